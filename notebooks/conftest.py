@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The package is not installed, the tests import it from this directory
+sys.path.insert(0, str(Path(__file__).parent))
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of eotools, which run offline (no credentials or downloads needed).
+
+    python -m eotools.benchmarks.imports    # import time of every module
+    python -m eotools.benchmarks.suite      # loading, contrast, classification and ROI export on synthetic products
+'''
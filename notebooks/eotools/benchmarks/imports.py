@@ -0,0 +1,118 @@
+#Description
+'''
+This script measures the time of a cold import of every eotools module.
+Every import runs in a fresh python process, as it happens in the batch workers. The benchmark fails (exit code 1),
+if the import of a module takes longer than its budget or if one of the heavy dependencies is imported at import time.
+
+Usage:
+    python -m eotools.benchmarks.imports [--budget 0.5] [--repeat 5] [--modules shortcut loading]
+'''
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+MODULES = ['lazy', 'trace', 'composite', 'contrast', 'cube', 'download', 'geometry', 'loading', 'pipeline', 'plan', 'polygons', 'regions', 'shortcut']
+
+# Dependencies which must only be imported when they are used for the first time
+HEAVY_MODULES = ['xarray', 'pandas', 'eodag', 'matplotlib', 'geopandas', 'rioxarray', 'shapely',
+                 'sklearn', 'joblib', 'ipywidgets', 'IPython', 'requests', 'PIL', 'yaml', 'zarr', 'dask', 'pyproj']
+
+# Budget of a cold import in seconds (numpy is still imported directly)
+DEFAULT_BUDGET = 0.5
+
+
+
+#Modules:
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+
+_CHILD = '''
+import sys, time, json
+start = time.perf_counter()
+import eotools.{module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def cold_import(module:str, repeat:int=5) -> dict:
+    '''
+    Imports an eotools module in fresh python processes and measures the time of the import.
+
+    Params:
+    -------
+        - module: str -> name of the eotools module (e.g.: 'shortcut')
+        - repeat: int -> number of processes, the fastest import is used (the others are disturbed by the system)
+
+    Returns:
+    -------
+        - result: dict -> 'module', 'seconds' (fastest), 'median' and 'heavy' (heavy dependencies imported with the module)
+    '''
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parents[2])
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+
+    times, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _CHILD.format(module=module, heavy=HEAVY_MODULES)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        heavy = result['heavy']
+
+    return {'module': module, 'seconds': min(times), 'median': statistics.median(times), 'heavy': heavy}
+
+def run(modules:list=None, budget:float|dict=DEFAULT_BUDGET, repeat:int=5, log:bool=True) -> list[dict]:
+    '''
+    Runs the import benchmark for several modules and checks them against their budget.
+
+    Params:
+    -------
+        - modules: list -> names of the eotools modules (default: all modules)
+        - budget: float|dict -> budget in seconds, either for all modules or per module ({'geometry': 0.4, ...})
+        - repeat: int -> number of processes per module
+        - log: bool -> if True, a table of the results is printed
+
+    Returns:
+    -------
+        - results: list[dict] -> results of ``cold_import`` with the additional keys 'budget' and 'passed'
+    '''
+    results = []
+    for module in modules or MODULES:
+        result = cold_import(module, repeat=repeat)
+        result['budget'] = budget.get(module, DEFAULT_BUDGET) if isinstance(budget, dict) else budget
+        result['passed'] = result['seconds'] <= result['budget'] and len(result['heavy']) == 0
+        results.append(result)
+
+        if log:
+            status = 'ok' if result['passed'] else 'FAILED'
+            heavy = f" (imports {', '.join(result['heavy'])})" if result['heavy'] else ''
+            print(f"{module:<10} {result['seconds'] * 1000:8.1f} ms  (median {result['median'] * 1000:8.1f} ms, "
+                  f"budget {result['budget'] * 1000:6.0f} ms)  {status}{heavy}")
+    return results
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description='Cold import time of the eotools modules.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='budget per module in seconds')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh processes per module')
+    parser.add_argument('--modules', nargs='+', default=None, help='modules to benchmark (default: all)')
+    parser.add_argument('--json', default=None, help='optional filepath to save the results as json')
+    args = parser.parse_args(argv)
+
+    results = run(args.modules, budget=args.budget, repeat=args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r['passed'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
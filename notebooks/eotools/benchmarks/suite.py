@@ -0,0 +1,239 @@
+#Description
+'''
+This script benchmarks the main functions of eotools on synthetic Sentinel-2 products (see ``synthetic``),
+so it runs offline without credentials. For every function the wall time and the memory peak
+(increase of the resident memory of the process) are recorded.
+The results can be saved as json and compared against a previous run to catch regressions.
+
+Usage:
+    python -m eotools.benchmarks.suite [--size 1098] [--dates 3] [--driver JP2OpenJPEG] [--json results.json]
+                                       [--baseline previous.json --tolerance 0.25]
+'''
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+LOAD_BANDS = ['B02', 'B03', 'B04', 'B08']
+
+
+
+#Modules:
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import numpy as np
+from pathlib import Path
+from eotools import loading, composite, contrast, cube, geometry, regions, shortcut, trace
+from eotools.trace import current_rss
+from eotools.benchmarks import synthetic
+
+
+##############################################
+# Measurement functions
+##############################################
+
+class _PeakMemory:
+    '''
+    Samples the resident memory in a background thread and keeps the maximum (use as context manager).
+    '''
+    def __init__(self, interval:float=0.005):
+        self.interval = interval
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+def measure(name:str, func, *args, repeat:int=1, **kwargs) -> tuple[dict, object]:
+    '''
+    Runs a function and measures its wall time and memory peak.
+
+    Params:
+    -------
+        - name: str -> name of the benchmark
+        - func: callable -> function to be measured
+        - *args, **kwargs: -> arguments passed to the function
+        - repeat: int -> number of runs, the fastest run is reported
+
+    Returns:
+    -------
+        - (result, value): dictionary with 'name', 'seconds', 'peak_mb' and 'repeat' and the return value of the function
+    '''
+    times, peaks = [], []
+    for _ in range(repeat):
+        with _PeakMemory() as memory:
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        peaks.append((memory.peak - memory.start) / 1e6)
+    return {'name': name, 'seconds': min(times), 'peak_mb': max(peaks), 'repeat': repeat}, value
+
+
+##############################################
+# Benchmark functions
+##############################################
+
+def _extract_infos(titles:list, n:int=1000) -> list:
+    return [loading.extract_infos_from_filename(titles[i % len(titles)]) for i in range(n)]
+
+def _roi_export(store, ds, savepath:str) -> list:
+    paths = store.export_geojson(savepath)
+    statistics = {int(i): regions.polygon_band_statistics(ds, store.coordinates(int(i))) for i in store.ids}
+    return paths, statistics
+
+def run(workdir:str|Path=None, size:int=1098, n_dates:int=3, driver:str='JP2OpenJPEG', repeat:int=1,
+        n_polygons:int=10, log:bool=True) -> list[dict]:
+    '''
+    Creates synthetic products and benchmarks loading, compositing, cube storage, contrast, training data extraction, prediction and ROI export.
+
+    Params:
+    -------
+        - workdir: str|Path -> directory for the synthetic products (default: temporary directory, removed afterwards)
+        - size: int -> number of pixels of a scene in x and y direction at 10 m (multiple of 6)
+        - n_dates: int -> number of products (dates)
+        - driver: str -> 'JP2OpenJPEG' or 'GTiff'
+        - repeat: int -> number of runs per benchmark, the fastest run is reported
+        - n_polygons: int -> number of training polygons per class
+        - log: bool -> if True, the results are printed
+
+    Returns:
+    -------
+        - results: list[dict] -> one dictionary per benchmark (see ``measure``)
+    '''
+    from sklearn.ensemble import RandomForestClassifier
+
+    tmp_dir = None
+    if workdir is None:
+        workdir = tmp_dir = tempfile.mkdtemp(prefix='eotools_benchmark_')
+    workdir = Path(workdir)
+    products_dir, polygons_dir = workdir / 'products', workdir / 'polygons'
+    products_dir.mkdir(parents=True, exist_ok=True)
+    polygons_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    def bench(name, func, *args, repeat=repeat, **kwargs):
+        result, value = measure(name, func, *args, repeat=repeat, **kwargs)
+        results.append(result)
+        if log:
+            print(f"{name:<32} {result['seconds']:9.3f} s  {result['peak_mb']:9.1f} MB")
+        return value
+
+    try:
+        safe_dirs = bench('generate_products', synthetic.make_time_series, products_dir, n_dates=n_dates,
+                          size=size, driver=driver, repeat=1)
+        products = synthetic.products_from_directory(products_dir)
+        titles = [p.properties['title'] for p in products]
+
+        bench('load_assets', lambda: [loading.load_assets(str(d), res=res) for d in safe_dirs for res in (10, 20, 60)])
+        bench('extract_infos_from_filename', _extract_infos, titles)
+        bench('products_table', shortcut.products_table, [titles[i % len(titles)] for i in range(50_000)])
+        ds = bench('load_multiple_timestamps', loading.load_multiple_timestamps, products, LOAD_BANDS)
+        bench('load_multiple_timestamps_regex', loading.load_multiple_timestamps_regex, products, LOAD_BANDS)
+        bench('load_multiple_timestamps_multires', loading.load_multiple_timestamps_multires, products,
+              LOAD_BANDS + ['B05', 'B11', 'SCL'])
+
+        bench('composite_products', composite.composite_products, products, LOAD_BANDS, stats=('mean', 'median', 'count'))
+
+        cube_path = workdir / 'cube.zarr'
+        bench('save_cube', cube.save_cube, ds, cube_path, products=products, overwrite=True)
+        bench('open_cube', cube.open_cube, cube_path)
+
+        bench('auto_clip_dataset', contrast.auto_clip_dataset, ds)
+        rgb = ds[['B04', 'B03', 'B02']].isel(time=0).to_array().values.astype(float)
+        bench('stretch', contrast.stretch, rgb, 0, 1)
+
+        store = synthetic.training_polygons(size=size, n_polygons=n_polygons)
+        paths, _ = bench('roi_export', _roi_export, store, ds, str(polygons_dir), repeat=1)
+        feature_path, nonfeature_path = [next(p for p in paths if Path(p).stem == label) for label in ('forest', 'artificial')]
+        X_train, X_test, y_train, y_test = bench('preprocess_data_to_classify', geometry.preprocess_data_to_classify,
+                                                 ds, feature_path, nonfeature_path, max_samples=100_000)
+
+        model = RandomForestClassifier(n_estimators=20, n_jobs=1, random_state=42).fit(X_train, y_train)
+        prediction = bench('predict_image', geometry.predict_image, model, ds)
+        if log:
+            forest = np.nanmean(prediction.values[:, :size // 3])
+            print(f'Accuracy {model.score(X_test, y_test):.3f}, predicted forest in the left third {forest:.2f}')
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return results
+
+def compare(results:list[dict], baseline:list[dict], tolerance:float=0.25, min_seconds:float=0.05) -> list[str]:
+    '''
+    Compares the wall times with a previous run.
+
+    Params:
+    -------
+        - results: list[dict] -> results of ``run``
+        - baseline: list[dict] -> results of a previous run (e.g.: loaded from the json file)
+        - tolerance: float -> allowed relative slowdown (0.25 -> 25 % slower)
+        - min_seconds: float -> slowdowns smaller than this are ignored (timer noise of very short benchmarks)
+
+    Returns:
+    -------
+        - regressions: list[str] -> description of every benchmark which is slower than allowed
+    '''
+    previous = {r['name']: r for r in baseline}
+    regressions = []
+    for result in results:
+        if result['name'] not in previous:
+            continue
+        before = previous[result['name']]['seconds']
+        if result['seconds'] > before * (1 + tolerance) and result['seconds'] - before > min_seconds:
+            regressions.append(f"{result['name']}: {result['seconds']:.3f} s instead of {before:.3f} s "
+                               f"({result['seconds'] / max(before, 1e-9) - 1:+.0%})")
+    return regressions
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks of eotools on synthetic Sentinel-2 products.')
+    parser.add_argument('--size', type=int, default=1098, help='pixels of a scene in x and y direction at 10 m')
+    parser.add_argument('--dates', type=int, default=3, help='number of products')
+    parser.add_argument('--driver', default='JP2OpenJPEG', choices=list(synthetic.DRIVERS), help='file format of the bands')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per benchmark')
+    parser.add_argument('--workdir', default=None, help='directory for the synthetic products (kept afterwards)')
+    parser.add_argument('--json', default=None, help='filepath to save the results as json')
+    parser.add_argument('--baseline', default=None, help='json file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown compared to the baseline')
+    parser.add_argument('--trace', default=None, help='filepath to save the spans of all stages in the Chrome trace format')
+    args = parser.parse_args(argv)
+
+    if args.trace is not None:
+        trace.enable()
+    results = run(args.workdir, size=args.size, n_dates=args.dates, driver=args.driver, repeat=args.repeat)
+    if args.trace is not None:
+        trace.summary()
+        trace.export_chrome_trace(args.trace)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
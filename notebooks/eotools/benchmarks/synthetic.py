@@ -0,0 +1,289 @@
+#Description
+'''
+This script creates synthetic Sentinel-2 L2A products in SAFE format, so eotools can be benchmarked without
+credentials or downloads. The products follow the naming of the real products (``load_assets`` and
+``extract_infos_from_filename`` work on them), contain bands at 10, 20 and 60 m as JP2 or GeoTIFF,
+a cloud probability mask (MSK_CLDPRB), the cloud cover in ``MTD_MSIL2A.xml`` and a ``manifest.safe`` with sizes
+and MD5 checksums. They are read with ``loading.LocalProduct`` like any other local product.
+The scene is split into a forested (left) and an artificial (right) half, so classifications can be trained on it.
+'''
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+# Bands of a L2A product per resolution
+BANDS = {10: ['B02', 'B03', 'B04', 'B08', 'TCI'],
+         20: ['B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B8A', 'B11', 'B12', 'SCL'],
+         60: ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B8A', 'B09', 'B11', 'B12', 'SCL']}
+
+# Surface reflectance of forest and artificial land per band
+REFLECTANCE = {'B01': (0.02, 0.08), 'B02': (0.03, 0.10), 'B03': (0.05, 0.12), 'B04': (0.03, 0.14),
+               'B05': (0.09, 0.16), 'B06': (0.25, 0.18), 'B07': (0.30, 0.19), 'B08': (0.35, 0.20),
+               'B8A': (0.36, 0.21), 'B09': (0.12, 0.08), 'B11': (0.16, 0.25), 'B12': (0.07, 0.22)}
+
+# Scene classification values (SCL) used for the synthetic scenes
+SCL_VEGETATION, SCL_NOT_VEGETATED, SCL_CLOUD_HIGH_PROBABILITY = 4, 5, 9
+
+DRIVERS = {'JP2OpenJPEG': 'jp2', 'GTiff': 'tif'}
+
+
+
+#Modules:
+import hashlib
+import datetime as dt
+import numpy as np
+from pathlib import Path
+from eotools import loading
+from eotools.lazy import lazy_import
+from eotools.polygons import PolygonStore
+rasterio = lazy_import('rasterio')
+
+
+##############################################
+# Scene functions
+##############################################
+
+def _block_mean(array:np.ndarray, factor:int) -> np.ndarray:
+    '''
+    Downsamples a 2D array by averaging blocks of ``factor`` x ``factor`` pixels.
+    '''
+    rows, cols = array.shape[0] // factor, array.shape[1] // factor
+    return array[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor).mean(axis=(1, 3))
+
+def synthetic_scene(size:int=1098, date_index:int=0, cloud_fraction:float=0.1, seed:int=0) -> dict:
+    '''
+    Creates the 10 m reflectance of all bands and the cloud mask of a synthetic scene.
+
+    Params:
+    -------
+        - size: int -> number of pixels of the scene in x and y direction at 10 m (multiple of 6)
+        - date_index: int -> index of the date, changes the noise, the clouds and the phenology slightly
+        - cloud_fraction: float -> approximate fraction of the scene covered by clouds
+        - seed: int -> seed of the random generator
+
+    Returns:
+    -------
+        - scene: dict -> reflectance per band (np.ndarray of float32), 'forest' and 'cloud' masks (np.ndarray of bool)
+    '''
+    if size % 6 != 0:
+        raise ValueError('The size of the scene has to be a multiple of 6, so the 20 m and 60 m bands fit the 10 m grid.')
+
+    rng = np.random.default_rng([seed, date_index])
+    cols = np.arange(size)
+    # Left half forested, with a wavy border
+    border = size / 2 + size / 20 * np.sin(np.arange(size) / size * 4 * np.pi)
+    forest = cols[None, :] < border[:, None]
+
+    # Clouds are the highest values of a coarse random field
+    coarse = rng.random((size // 60 + 2, size // 60 + 2))
+    field = np.kron(coarse, np.ones((60, 60)))[:size, :size]
+    cloud = field > np.quantile(field, 1 - cloud_fraction) if cloud_fraction > 0 else np.zeros((size, size), dtype=bool)
+
+    scene = {'forest': forest, 'cloud': cloud}
+    season = 1 + 0.05 * np.sin(date_index)
+    for band, (forest_value, artificial_value) in REFLECTANCE.items():
+        reflectance = np.where(forest, forest_value * season, artificial_value)
+        reflectance = reflectance + rng.normal(0, 0.01, (size, size))
+        reflectance[cloud] = 0.6 + rng.normal(0, 0.02, int(cloud.sum()))
+        scene[band] = np.clip(reflectance, 0, 1).astype(np.float32)
+    return scene
+
+def band_array(scene:dict, band:str, resolution:int) -> np.ndarray:
+    '''
+    Band of a synthetic scene at a resolution, in the data type of the L2A products.
+
+    Params:
+    -------
+        - scene: dict -> synthetic scene (provided by ``synthetic_scene``)
+        - band: str -> band name (e.g.: 'B04', 'SCL', 'TCI')
+        - resolution: int -> resolution in meters (10, 20, 60)
+
+    Returns:
+    -------
+        - array: np.ndarray -> (bands, y, x) array (uint16 reflectance * 10000, uint8 for SCL and TCI)
+    '''
+    factor = resolution // 10
+    if band == 'SCL':
+        scl = np.where(scene['forest'], SCL_VEGETATION, SCL_NOT_VEGETATED)
+        scl[scene['cloud']] = SCL_CLOUD_HIGH_PROBABILITY
+        return scl[::factor, ::factor][None].astype(np.uint8)
+    if band == 'TCI':
+        rgb = np.stack([scene['B04'], scene['B03'], scene['B02']])
+        return np.clip(rgb * 255 / 0.3, 0, 255).astype(np.uint8)[:, ::factor, ::factor]
+    return (_block_mean(scene[band], factor) * 10000).astype(np.uint16)[None]
+
+
+##############################################
+# SAFE functions
+##############################################
+
+def _write_band(path:Path, array:np.ndarray, transform, crs:str, driver:str) -> None:
+    '''
+    Writes a (bands, y, x) array as a raster file.
+    '''
+    profile = {'driver': driver, 'width': array.shape[2], 'height': array.shape[1], 'count': array.shape[0],
+               'dtype': array.dtype.name, 'crs': crs, 'transform': transform}
+    if driver == 'JP2OpenJPEG':
+        profile['QUALITY'] = 100
+        profile['REVERSIBLE'] = 'YES'
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(array)
+
+def _write_metadata(safe_dir:Path, cloud_cover:float) -> None:
+    '''
+    Writes the part of the product metadata (``MTD_MSIL2A.xml``) which is read by ``loading.LocalProduct``.
+    '''
+    metadata = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<n1:Level-2A_User_Product xmlns:n1="https://psd-14.sentinel2.eo.esa.int/PSD/User_Product_Level-2A.xsd">\n'
+                '  <n1:Quality_Indicators_Info>\n'
+                f'    <Cloud_Coverage_Assessment>{cloud_cover:.6f}</Cloud_Coverage_Assessment>\n'
+                '  </n1:Quality_Indicators_Info>\n'
+                '</n1:Level-2A_User_Product>\n')
+    (safe_dir / 'MTD_MSIL2A.xml').write_text(metadata)
+
+def _write_manifest(safe_dir:Path) -> None:
+    '''
+    Writes a ``manifest.safe`` listing all files of the product with their size and MD5 checksum.
+    '''
+    streams = []
+    for path in sorted(p for p in safe_dir.rglob('*') if p.is_file() and p.name != 'manifest.safe'):
+        md5 = hashlib.md5(path.read_bytes()).hexdigest()
+        streams.append(f'    <dataObject ID="{path.stem}">\n'
+                       f'      <byteStream mimeType="application/octet-stream" size="{path.stat().st_size}">\n'
+                       f'        <fileLocation locatorType="URL" href="./{path.relative_to(safe_dir).as_posix()}"/>\n'
+                       f'        <checksum checksumName="MD5">{md5}</checksum>\n'
+                       f'      </byteStream>\n'
+                       f'    </dataObject>')
+    manifest = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<xfdu:XFDU xmlns:xfdu="urn:ccsds:schema:xfdu:1">\n'
+                '  <dataObjectSection>\n' + '\n'.join(streams) + '\n  </dataObjectSection>\n</xfdu:XFDU>\n')
+    (safe_dir / 'manifest.safe').write_text(manifest)
+
+def product_title(date:dt.datetime, tile:str='33UWP', platform:str='S2A', relative_orbit:int=122) -> str:
+    '''
+    Name of a L2A product following the naming convention
+    ``<platform>_<instrument><product_level>_<sensing_datetime>_<processing_pipeline>_<orbit>_<tile>_<processing_date>``.
+    '''
+    sensing = date.strftime('%Y%m%dT%H%M%S')
+    processing = (date + dt.timedelta(hours=3)).strftime('%Y%m%dT%H%M%S')
+    return f'{platform}_MSIL2A_{sensing}_N0510_R{relative_orbit:03d}_T{tile}_{processing}'
+
+def make_safe_product(root:str|Path, date:dt.datetime, size:int=1098, tile:str='33UWP', driver:str='JP2OpenJPEG',
+                      bands:dict=None, cloud_fraction:float=0.1, date_index:int=0, seed:int=0,
+                      crs:str='EPSG:32633', origin:tuple=(499980.0, 5400000.0)) -> Path:
+    '''
+    Writes a synthetic L2A product in SAFE format.
+
+    Params:
+    -------
+        - root: str|Path -> directory in which the product is created
+        - date: datetime -> sensing time of the product
+        - size: int -> number of pixels in x and y direction at 10 m (multiple of 6)
+        - tile: str -> MGRS tile (e.g.: '33UWP')
+        - driver: str -> 'JP2OpenJPEG' (like the real products) or 'GTiff' (faster to write and read)
+        - bands: dict -> bands per resolution (default: ``BANDS``)
+        - cloud_fraction: float -> approximate fraction of the scene covered by clouds (flagged in the SCL band)
+        - date_index: int -> index of the date (changes noise and clouds)
+        - seed: int -> seed of the random generator
+        - crs: str -> CRS of the product
+        - origin: tuple -> upper left corner (x, y) in the CRS
+
+    Returns:
+    -------
+        - safe_dir: Path -> directory of the product (``<title>.SAFE``)
+    '''
+    if driver not in DRIVERS:
+        raise ValueError(f'Unknown driver {driver}, use one of {list(DRIVERS)}.')
+    bands = BANDS if bands is None else bands
+
+    title = product_title(date, tile=tile)
+    safe_dir = Path(root) / f'{title}.SAFE'
+    sensing = date.strftime('%Y%m%dT%H%M%S')
+    granule = safe_dir / 'GRANULE' / f'L2A_T{tile}_A000000_{sensing}'
+    img_data = granule / 'IMG_DATA'
+
+    scene = synthetic_scene(size=size, date_index=date_index, cloud_fraction=cloud_fraction, seed=seed)
+    for resolution, resolution_bands in bands.items():
+        directory = img_data / f'R{resolution}m'
+        directory.mkdir(parents=True, exist_ok=True)
+        transform = rasterio.transform.from_origin(origin[0], origin[1], resolution, resolution)
+        for band in resolution_bands:
+            path = directory / f'T{tile}_{sensing}_{band}_{resolution}m.{DRIVERS[driver]}'
+            _write_band(path, band_array(scene, band, resolution), transform, crs, driver)
+
+    # Cloud probability mask (MSK_CLDPRB) in percent at 20 m
+    qi_data = granule / 'QI_DATA'
+    qi_data.mkdir(parents=True, exist_ok=True)
+    transform = rasterio.transform.from_origin(origin[0], origin[1], 20, 20)
+    probability = np.where(scene['cloud'], 90, 2).astype(np.uint8)[::2, ::2][None]
+    _write_band(qi_data / f'MSK_CLDPRB_20m.{DRIVERS[driver]}', probability, transform, crs, driver)
+
+    _write_metadata(safe_dir, cloud_cover=100 * float(scene['cloud'].mean()))
+    _write_manifest(safe_dir)
+    return safe_dir
+
+def make_time_series(root:str|Path, n_dates:int=3, start:str='2024-05-01', interval_days:int=5, **kwargs) -> list[Path]:
+    '''
+    Writes synthetic L2A products of the same tile for several dates (see ``make_safe_product``).
+
+    Params:
+    -------
+        - root: str|Path -> directory in which the products are created
+        - n_dates: int -> number of products
+        - start: str -> date of the first product (YYYY-MM-DD)
+        - interval_days: int -> days between two products (5 days like Sentinel-2A/B)
+        - **kwargs: -> arguments passed to ``make_safe_product``
+
+    Returns:
+    -------
+        - safe_dirs: list[Path] -> directories of the products
+    '''
+    first = dt.datetime.strptime(start, '%Y-%m-%d') + dt.timedelta(hours=10, seconds=31)
+    return [make_safe_product(root, first + dt.timedelta(days=i * interval_days), date_index=i, **kwargs)
+            for i in range(n_dates)]
+
+
+##############################################
+# Product functions
+##############################################
+
+def products_from_directory(root:str|Path) -> list[loading.LocalProduct]:
+    '''
+    Reads the synthetic products of a directory like any other local product (see ``loading.local_products``).
+    '''
+    return loading.local_products(root)
+
+
+##############################################
+# Polygon functions
+##############################################
+
+def training_polygons(size:int=1098, n_polygons:int=10, polygon_size:int=200, origin:tuple=(499980.0, 5400000.0),
+                      seed:int=0) -> PolygonStore:
+    '''
+    Creates square polygons in the forested and the artificial half of a synthetic scene
+    (labels 'forest' and 'artificial', in the CRS of the scene).
+
+    Params:
+    -------
+        - size: int -> size of the scene in pixels at 10 m
+        - n_polygons: int -> number of polygons per label
+        - polygon_size: int -> edge length of a polygon in meters
+        - origin: tuple -> upper left corner (x, y) of the scene
+        - seed: int -> seed of the random generator
+
+    Returns:
+    -------
+        - store: PolygonStore -> store with the polygons
+    '''
+    rng = np.random.default_rng(seed)
+    extent = size * 10
+    store = PolygonStore()
+    for label, (low, high) in {'forest': (0.05, 0.35), 'artificial': (0.65, 0.95)}.items():
+        for _ in range(n_polygons):
+            x = origin[0] + rng.uniform(low, high) * extent - polygon_size / 2
+            y = origin[1] - rng.uniform(0.05, 0.95) * extent - polygon_size / 2
+            store.add([(x, y), (x + polygon_size, y), (x + polygon_size, y + polygon_size), (x, y + polygon_size)], label)
+    return store
@@ -0,0 +1,286 @@
+#Description
+'''
+This script is intended to produce temporal composites (e.g.: seasonal medians) of many acquisitions.
+In here you will find a reducer which consumes the products one at a time and keeps running statistics per pixel,
+so the memory needed does not grow with the number of dates, as it does for ``load_multiple_timestamps(...).median(dim='time')``.
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+STATISTICS = ('mean', 'min', 'max', 'count', 'median', 'best')
+
+
+
+#Modules:
+import numpy as np
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools import loading
+from eotools.lazy import lazy_import
+xr = lazy_import('xarray')
+
+if TYPE_CHECKING:
+    from eodag import SearchResult
+
+
+class TemporalComposite:
+    '''
+    Running per pixel statistics of a time series, updated with one acquisition (Dataset with dims (y, x)) at a time.
+    Nan values are ignored by all statistics.
+
+    - 'mean', 'min', 'max' and 'count' are exact.
+    - 'median' and the ``percentiles`` are approximated with a coarse histogram per pixel of ``bins`` bins over ``value_range``
+      (linear interpolation inside the bin, the error is below the bin width, so a tight ``value_range`` is more accurate).
+      The counts of the histogram are stored in 1 byte up to 255 acquisitions (2 bytes afterwards),
+      it is only allocated if a median or a percentile is requested.
+
+    The state needs ``nbytes_per_pixel`` bytes per pixel and band (count: 2, mean: 8, min: 4, max: 4, best: 8,
+    median and percentiles: ``bins``), e.g.: 34 bytes for a median with 32 bins, which is 4 GB for one band
+    of a 10980 x 10980 tile. Larger areas should be composited tile by tile.
+    - 'best' keeps the values of the acquisition with the highest score per pixel (e.g.: lowest cloud probability).
+
+    Params:
+    -------
+        - stats: tuple -> statistics to compute (any of ``STATISTICS``)
+        - percentiles: tuple -> additional percentiles (e.g.: (10, 90)), results are named 'p10', 'p90'
+        - bins: int -> number of histogram bins for the median and the percentiles (at most 255)
+        - value_range: tuple -> (min, max) of the values for the histogram (e.g.: (0, 10000) for L2A reflectances)
+
+    Example:
+    -------
+        composite = TemporalComposite(stats=('median', 'count'), value_range=(0, 10000))
+        for product in products:
+            composite.update(loading.load_single_product(product, bands, **common_params).isel(time=0))
+        median = composite.result('median')
+    '''
+
+    def __init__(self, stats:tuple=('median',), percentiles:tuple=(), bins:int=32, value_range:tuple=(0, 10000)):
+        unknown = set(stats) - set(STATISTICS)
+        if unknown:
+            raise ValueError(f'Unknown statistics {sorted(unknown)}, use any of {STATISTICS}.')
+        if not 1 <= bins <= 255:
+            raise ValueError(f'The number of bins has to be between 1 and 255, got {bins}.')
+        self.stats = tuple(stats)
+        self.percentiles = tuple(percentiles) + ((50,) if 'median' in stats and 50 not in percentiles else ())
+        self.bins = bins
+        self.value_range = tuple(float(v) for v in value_range)
+        self.n_updates = 0
+        self.coords = None
+        self.attrs = {}
+        self._bands = {}
+        self._best_score = None
+
+    def __repr__(self) -> str:
+        shape = tuple(self.coords[d].size for d in ('y', 'x')) if self.coords is not None else None
+        return f'TemporalComposite({self.n_updates} acquisitions, bands={list(self._bands)}, shape={shape}, stats={self.stats})'
+
+    @property
+    def nbytes_per_pixel(self) -> int:
+        '''
+        Bytes of the state per pixel and band (the counts of the histogram with 1 byte).
+        '''
+        nbytes = {'mean': 8, 'min': 4, 'max': 4, 'best': 8}
+        return 2 + sum(nbytes.get(stat, 0) for stat in self.stats) + (self.bins if self.percentiles else 0)
+
+    def _allocate(self, shape:tuple) -> dict:
+        state = {'count': np.zeros(shape, dtype=np.uint16)}
+        if 'mean' in self.stats:
+            state['sum'] = np.zeros(shape, dtype=np.float64)
+        if 'min' in self.stats:
+            state['min'] = np.full(shape, np.inf, dtype=np.float32)
+        if 'max' in self.stats:
+            state['max'] = np.full(shape, -np.inf, dtype=np.float32)
+        if self.percentiles:
+            state['histogram'] = np.zeros((self.bins,) + shape, dtype=np.uint8)
+        if 'best' in self.stats:
+            state['best'] = np.full(shape, np.nan, dtype=np.float32)
+        return state
+
+    @trace.traced()
+    def update(self, ds:xr.Dataset, score:np.ndarray|float=None) -> TemporalComposite:
+        '''
+        Adds one acquisition to the statistics.
+
+        Params:
+        -------
+            - ds: xr.Dataset -> bands with dims (y, x) (a time dimension of size 1 is removed)
+            - score: np.ndarray|float -> score of the acquisition for 'best', per pixel (y, x) or for the whole scene
+                                         (default: 0, so the first valid value is kept)
+
+        Returns:
+        -------
+            - self
+        '''
+        if 'time' in ds.dims:
+            if ds.sizes['time'] != 1:
+                raise ValueError('Update the composite with one acquisition at a time.')
+            ds = ds.isel(time=0)
+        shape = (ds.sizes['y'], ds.sizes['x'])
+        if self.coords is None:
+            self.coords = {'y': ds['y'].values, 'x': ds['x'].values}
+            self.attrs = dict(ds.attrs)
+        elif shape != (self.coords['y'].size, self.coords['x'].size):
+            raise ValueError(f'All acquisitions need the same grid, got {shape} instead of '
+                             f'{(self.coords["y"].size, self.coords["x"].size)} (use the same common_params).')
+
+        if 'best' in self.stats:
+            score = np.broadcast_to(np.asarray(0.0 if score is None else score, dtype=np.float32), shape)
+            if self._best_score is None:
+                self._best_score = np.full(shape, -np.inf, dtype=np.float32)
+
+        low, high = self.value_range
+        for band in ds.data_vars:
+            state = self._bands.get(band)
+            if state is None:
+                state = self._bands[band] = self._allocate(shape)
+            values = np.asarray(ds[band].values, dtype=np.float32)
+            valid = ~np.isnan(values)
+
+            state['count'] += valid
+            if 'sum' in state:
+                state['sum'] += np.where(valid, values, 0)
+            if 'min' in state:
+                np.fmin(state['min'], values, out=state['min'])
+            if 'max' in state:
+                np.fmax(state['max'], values, out=state['max'])
+            if 'histogram' in state:
+                if self.n_updates >= np.iinfo(state['histogram'].dtype).max:
+                    # A bin could overflow with this acquisition
+                    state['histogram'] = state['histogram'].astype(np.uint16)
+                pixels = np.flatnonzero(valid)
+                index = ((values.ravel()[pixels] - low) / (high - low) * self.bins).astype(np.int64)
+                np.clip(index, 0, self.bins - 1, out=index)
+                # Every pixel appears only once per update, so the increment does not need np.add.at
+                state['histogram'].reshape(self.bins, -1)[index, pixels] += 1
+            if 'best' in state:
+                better = valid & (score > self._best_score)
+                state['best'][better] = values[better]
+
+        if 'best' in self.stats:
+            # The score of a pixel is updated once all bands have been compared with the previous best score
+            valid_any = np.zeros(shape, dtype=bool)
+            for band in ds.data_vars:
+                valid_any |= ~np.isnan(ds[band].values)
+            np.copyto(self._best_score, score, where=valid_any & (score > self._best_score))
+
+        self.n_updates += 1
+        return self
+
+    def _percentile(self, histogram:np.ndarray, count:np.ndarray, q:float, block_rows:int=256) -> np.ndarray:
+        '''
+        Approximates a percentile from the histograms (linear interpolation between the closest ranks, as numpy),
+        computed in blocks of rows to limit the temporary memory.
+        '''
+        low, high = self.value_range
+        width = (high - low) / self.bins
+        result = np.full(count.shape, np.nan, dtype=np.float32)
+        for start in range(0, count.shape[0], block_rows):
+            block = histogram[:, start:start + block_rows]
+            n = count[start:start + block_rows].astype(np.int64)
+            cumulative = np.cumsum(block, axis=0, dtype=np.int32)
+
+            def value_of_rank(rank):
+                # The values inside of a bin are assumed to be evenly spread
+                index = np.minimum((cumulative <= rank).sum(axis=0), self.bins - 1)
+                in_bin = np.take_along_axis(block, index[None], axis=0)[0]
+                below = np.take_along_axis(cumulative, index[None], axis=0)[0] - in_bin
+                return low + (index + (rank - below + 0.5) / np.maximum(in_bin, 1)) * width
+
+            position = q / 100 * np.maximum(n - 1, 0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, np.maximum(n - 1, 0))
+            values = value_of_rank(lower)
+            values += (position - lower) * (value_of_rank(upper) - values)
+            result[start:start + block_rows] = np.where(n > 0, values, np.nan)
+        return result
+
+    def result(self, stat:str='median') -> xr.Dataset:
+        '''
+        Dataset of one statistic with the same variables as the acquisitions, dims (y, x).
+
+        Params:
+        -------
+            - stat: str -> 'mean', 'min', 'max', 'count', 'median', 'best' or a percentile 'p<q>' (e.g.: 'p90')
+
+        Returns:
+        -------
+            - composite: xr.Dataset
+        '''
+        if self.n_updates == 0:
+            raise ValueError('The composite has not been updated yet.')
+        q = 50.0 if stat == 'median' else float(stat[1:]) if stat.startswith('p') else None
+        if q is not None and q not in self.percentiles:
+            raise ValueError(f'The percentile {stat} has not been requested, available: {self.percentiles}.')
+        if q is None and stat not in self.stats:
+            raise ValueError(f'The statistic {stat} has not been requested, available: {self.stats}.')
+
+        variables = {}
+        for band, state in self._bands.items():
+            count = state['count']
+            if stat == 'count':
+                values = count
+            elif stat == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values = (state['sum'] / count).astype(np.float32)
+            elif stat in ('min', 'max'):
+                values = np.where(count > 0, state[stat], np.nan).astype(np.float32)
+            elif stat == 'best':
+                values = state['best']
+            else:
+                values = self._percentile(state['histogram'], count, q)
+            variables[band] = (('y', 'x'), values)
+
+        ds = xr.Dataset(variables, coords=self.coords, attrs=dict(self.attrs, composite=stat, n_acquisitions=self.n_updates))
+        return ds
+
+    def results(self) -> dict:
+        '''
+        All requested statistics and percentiles (see ``result``) as dictionary of Datasets.
+        '''
+        names = [s for s in self.stats if s != 'median'] + ['median' if q == 50 and 'median' in self.stats else f'p{q:g}'
+                                                              for q in self.percentiles]
+        return {name: self.result(name) for name in names}
+
+
+def scene_score(product) -> float:
+    '''
+    Score of a whole scene for the 'best' composite: the lower the cloud cover, the better.
+    '''
+    return -float(product.properties.get('cloudCover') or 0)
+
+@trace.traced()
+def composite_products(products:SearchResult|list, bands:list[str], stats:tuple=('median',), percentiles:tuple=(),
+                       bins:int=32, value_range:tuple=(0, 10000), mask:str=None, min_valid_fraction:float=None,
+                       score=scene_score, log:bool=False, **kwargs) -> TemporalComposite:
+    '''
+    Loads the products one after another and adds them to a ``TemporalComposite``,
+    so only one acquisition is in memory at a time.
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products of the same area (same grid, e.g.: with ``common_params``)
+        - bands: list[str] -> bands to be loaded
+        - stats, percentiles, bins, value_range: -> see ``TemporalComposite``
+        - mask: str -> mask applied while loading ('SCL' or 'CLDPRB', see ``loading.load_valid_mask``)
+        - min_valid_fraction: float -> products with fewer valid pixels are skipped before the bands are loaded
+        - score: callable -> score of a product for 'best', ``score(product)`` returns a float or an array (y, x)
+        - log: bool -> if True, the progress is printed
+        - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
+
+    Returns:
+    -------
+        - composite: TemporalComposite -> use ``composite.result('median')`` to get a Dataset
+    '''
+    composite = TemporalComposite(stats=stats, percentiles=percentiles, bins=bins, value_range=value_range)
+    for i, product in enumerate(products):
+        ds = loading.load_single_product_regex(product, bands, mask=mask, min_valid_fraction=min_valid_fraction, **kwargs)
+        if ds is None:
+            continue
+        composite.update(ds, score=score(product) if 'best' in stats else None)
+        if log:
+            print(f'{i + 1}/{len(products)} {trace.product_name(product)}')
+    return composite
@@ -4,6 +4,7 @@ This script is intended to simplify further processes in your code.
 In here you will find all the necessary functions to manipulate the quality 
 and contrasts of your produced tif images.
 '''
+from __future__ import annotations
 
 
 
@@ -15,13 +16,16 @@ __version__ = '20-Jun-2024_v01'
 
 #Modules:
 import numpy as np
-import matplotlib.pyplot as plt
 from numpy import ndarray
-import xarray as xr
+from eotools import trace
+from eotools.lazy import lazy_import
+plt = lazy_import('matplotlib.pyplot')
+xr = lazy_import('xarray')
 
 
 
 #Functions
+@trace.traced()
 def auto_clip(I:ndarray, percentile:float=0.02, pooled:bool=True) -> ndarray:
     """ 
     Calculates the quantiles of I using the percentile parameter and clips the values using the clip function defined below.
@@ -88,6 +92,7 @@ def clip(I:ndarray, v_min:float, v_max:float) -> ndarray:
     
     return I
 
+@trace.traced()
 def stretch(I:ndarray, p_min:float, p_max:float, pooled:bool=True) -> ndarray:
     """
     Performs histogram stretching or normalisation (dt. "Spreizung")
@@ -186,6 +191,7 @@ def histogram(data:xr.DataArray|ndarray, nbins:int=256, alpha:float=0.5, figsize
     plt.show()
 
 
+@trace.traced()
 def auto_clip_dataarray(dataarray: xr.DataArray, percentile: float = 0.02, pooled: bool = True) -> xr.DataArray:
     '''
     This function clips the values of a DataArray using the auto_clip function.
@@ -212,6 +218,7 @@ def auto_clip_dataarray(dataarray: xr.DataArray, percentile: float = 0.02, poole
     
     return clipped_dataarray
 
+@trace.traced()
 def auto_clip_dataset(ds, *args, **kwargs):
     '''
     This function clips the values of a Dataset using the auto_clip_dataarray function.
@@ -232,6 +239,7 @@ def auto_clip_dataset(ds, *args, **kwargs):
         ds[var] = clipped
     return ds
 
+@trace.traced()
 def stretch_dataarray(dataarray: xr.DataArray, p_min: float, p_max: float, pooled: bool = True) -> xr.DataArray:
     '''
     This function stretches the values of a DataArray using the stretch function.
@@ -0,0 +1,370 @@
+#Description
+'''
+This script is intended to keep loaded data between sessions.
+In here you will find functions to save a Dataset (e.g.: from ``load_multiple_timestamps_regex``) as chunked
+and compressed Zarr store (or NetCDF file) and to reopen it lazily, so an analysis starts from the stored cube
+instead of reading the JP2 files again. The ids of the loaded products and the parameters of the loading
+are stored with the cube.
+
+Example:
+    ds = cube.load_cube(products, bands, 'cube.zarr', mask='SCL', access='time-series', **common_params)
+    ds = cube.open_cube('cube.zarr')
+    ds = cube.append_cube('cube.zarr', new_search_result)     # only the new acquisitions are loaded
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+# Chunk sizes per dimension for the typical access patterns
+# - 'spatial': whole scenes of one date (maps, clipping, contrast)
+# - 'time-series': all dates of small windows (temporal profiles, composites, classification of pixel time series)
+# - 'balanced': in between, for mixed access
+CHUNK_PRESETS = {'spatial': {'time': 1, 'y': 2048, 'x': 2048},
+                 'time-series': {'time': 512, 'y': 128, 'x': 128},
+                 'balanced': {'time': 16, 'y': 512, 'x': 512}}
+
+# Attribute names of the metadata stored with the cube (json strings, so they can be stored in Zarr and NetCDF)
+PRODUCTS_ATTR = 'eotools_products'
+LOAD_PARAMS_ATTR = 'eotools_load_params'
+
+
+
+#Modules:
+import json
+import importlib.util
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools import loading
+from eotools.lazy import lazy_import
+xr = lazy_import('xarray')
+pd = lazy_import('pandas')
+
+if TYPE_CHECKING:
+    from eodag import SearchResult
+
+
+##############################################
+# Chunk functions
+##############################################
+
+def band_chunks(ds:xr.Dataset, access:str|dict='balanced') -> dict:
+    '''
+    Chunk sizes of every band, limited to the size of the cube.
+
+    Params:
+    -------
+        - ds: xr.Dataset -> cube to be stored
+        - access: str|dict -> name of a preset in ``CHUNK_PRESETS``, chunks per dimension ({'time': 1, 'y': 1024, 'x': 1024})
+                              or per band ({'B04': 'spatial', 'NDVI': 'time-series', ...}, missing bands use 'balanced')
+
+    Returns:
+    -------
+        - chunks: dict -> tuple of chunk sizes per band (in the order of the dimensions of the band)
+    '''
+    per_band = isinstance(access, dict) and any(name in ds.data_vars for name in access)
+    chunks = {}
+    for name, data in ds.data_vars.items():
+        preset = access.get(name, 'balanced') if per_band else access
+        sizes = CHUNK_PRESETS[preset] if isinstance(preset, str) else preset
+        chunks[name] = tuple(min(sizes.get(dim, length), length) for dim, length in zip(data.dims, data.shape))
+    return chunks
+
+def _compression(level:int) -> dict:
+    '''
+    Zstandard compression with bit shuffling as Zarr encoding (the arguments differ between zarr 2 and zarr 3).
+    '''
+    import zarr
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        return {'compressors': [zarr.codecs.BloscCodec(cname='zstd', clevel=level, shuffle='bitshuffle')]}
+    from numcodecs import Blosc
+    return {'compressor': Blosc(cname='zstd', clevel=level, shuffle=Blosc.BITSHUFFLE)}
+
+def _prepare(ds:xr.Dataset) -> xr.Dataset:
+    '''
+    Converts the dates of the loaders (datetime.date objects) to datetime64, which can be encoded in Zarr and NetCDF,
+    and removes chunk encodings of the source files, which would conflict with the new chunks.
+    Identity scalings of rasterio (scale_factor 1, add_offset 0) are removed as well, otherwise xarray encodes
+    appended integer bands as scaled floats.
+    '''
+    if 'time' in ds.coords and ds['time'].dtype == object:
+        ds = ds.assign_coords(time=pd.to_datetime(ds['time'].values))
+    ds = ds.copy()
+    for data in ds.variables.values():
+        for key in ('chunks', 'preferred_chunks', 'chunksizes', 'compressor', 'compressors', 'filters'):
+            data.encoding.pop(key, None)
+        for key, identity in (('scale_factor', 1), ('add_offset', 0)):
+            if data.attrs.get(key, identity) == identity:
+                data.attrs.pop(key, None)
+    return ds
+
+
+##############################################
+# Metadata functions
+##############################################
+
+def product_ids(products:SearchResult|list) -> list[str]:
+    '''
+    Sorted ids of products (the title, e.g.: 'S2A_MSIL2A_20240501T100031_N0510_R122_T33UWP_20240501T130031').
+    '''
+    return sorted({trace.product_name(product) for product in products})
+
+def cube_metadata(ds:xr.Dataset) -> dict:
+    '''
+    Metadata stored with a cube by ``save_cube``.
+
+    Params:
+    -------
+        - ds: xr.Dataset -> cube opened with ``open_cube``
+
+    Returns:
+    -------
+        - metadata: dict -> 'products' (list of product ids) and 'load_params' (dictionary)
+    '''
+    return {'products': json.loads(ds.attrs.get(PRODUCTS_ATTR, '[]')),
+            'load_params': json.loads(ds.attrs.get(LOAD_PARAMS_ATTR, '{}'))}
+
+
+##############################################
+# Save and open functions
+##############################################
+
+@trace.traced()
+def save_cube(ds:xr.Dataset, path:str|Path, products:SearchResult|list=None, load_params:dict=None,
+              access:str|dict='balanced', compression_level:int=3, overwrite:bool=False) -> Path:
+    '''
+    Saves a Dataset as chunked and compressed Zarr store (consolidated metadata) or as NetCDF file (suffix '.nc').
+
+    Params:
+    -------
+        - ds: xr.Dataset -> cube to be stored (e.g.: from ``load_multiple_timestamps_regex``)
+        - path: str|Path -> path of the Zarr store (directory, e.g.: 'cube.zarr') or of the NetCDF file ('cube.nc')
+        - products: list[EOProduct] -> loaded products, their ids are stored with the cube
+        - load_params: dict -> parameters of the loading, stored as json (objects which are not json serialisable,
+                               e.g.: geometries, are stored as string). ``load_cube`` stores 'regex', 'bands', 'mask',
+                               'min_valid_fraction' and 'common_params', which are used again by ``append_cube``
+        - access: str|dict -> chunking of the bands, see ``band_chunks``
+        - compression_level: int -> compression level (1: fast, 9: small)
+        - overwrite: bool -> if True, an existing cube is replaced
+
+    Returns:
+    -------
+        - path: Path -> path of the stored cube
+    '''
+    path = Path(path)
+    if path.exists() and not overwrite:
+        raise FileExistsError(f'{path} already exists, use overwrite=True to replace it.')
+
+    ds = _prepare(ds)
+    ds.attrs[PRODUCTS_ATTR] = json.dumps(product_ids(products) if products is not None else [])
+    ds.attrs[LOAD_PARAMS_ATTR] = json.dumps(load_params or {}, default=str)
+    chunks = band_chunks(ds, access)
+
+    if path.suffix == '.nc':
+        # NetCDF4 needs the netCDF4 or h5netcdf package, chunks and compression are set per variable
+        encoding = {name: {'zlib': True, 'complevel': compression_level, 'shuffle': True, 'chunksizes': chunks[name]}
+                    for name in ds.data_vars}
+        ds.to_netcdf(path, mode='w', encoding=encoding)
+    else:
+        encoding = {name: dict(_compression(compression_level), chunks=chunks[name]) for name in ds.data_vars}
+        ds.to_zarr(path, mode='w', encoding=encoding, consolidated=True)
+    return path
+
+@trace.traced()
+def open_cube(path:str|Path) -> xr.Dataset:
+    '''
+    Opens a cube stored with ``save_cube`` lazily: only the metadata is read, the bands are read when they are used
+    (in the chunks of the store, as dask arrays if dask is installed).
+
+    Params:
+    -------
+        - path: str|Path -> path of the Zarr store or NetCDF file
+
+    Returns:
+    -------
+        - ds: xr.Dataset -> stored cube (time as datetime64), see ``cube_metadata`` for the product ids and load parameters
+    '''
+    path = Path(path)
+    chunks = {} if importlib.util.find_spec('dask') is not None else None
+    if path.suffix == '.nc':
+        return xr.open_dataset(path, chunks=chunks)
+    return xr.open_zarr(path, consolidated=True, chunks=chunks)
+
+
+##############################################
+# Append functions
+##############################################
+
+def _load(products:list, params:dict, common_params:dict) -> xr.Dataset:
+    loader = loading.load_multiple_timestamps_regex if params.get('regex', True) else loading.load_multiple_timestamps
+    return loader(products, params['bands'], mask=params.get('mask'),
+                  min_valid_fraction=params.get('min_valid_fraction'), **common_params)
+
+def load_cube(products:SearchResult|list, bands:list[str], path:str|Path, regex:bool=True, mask:str=None,
+              min_valid_fraction:float=None, access:str|dict='balanced', dtype=None, overwrite:bool=False,
+              **kwargs) -> xr.Dataset:
+    '''
+    Loads products (see ``loading.load_multiple_timestamps_regex``), saves them as cube together with
+    the parameters of the loading and reopens the cube lazily.
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products to be loaded
+        - bands: list[str] -> bands to be loaded
+        - path: str|Path -> path of the Zarr store
+        - regex: bool -> if True, ``load_multiple_timestamps_regex`` is used, otherwise ``load_multiple_timestamps``
+        - mask, min_valid_fraction: -> see ``loading.load_multiple_timestamps``
+        - access: str|dict -> chunking of the bands, see ``band_chunks``
+        - dtype: -> data type of the stored bands (default: as loaded). A cube which is created from a single product
+                    is uint16, use float32 if acquisitions with Nan values are appended later (Nan is the fill value)
+        - overwrite: bool -> if True, an existing cube is replaced
+        - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
+
+    Returns:
+    -------
+        - ds: xr.Dataset -> stored cube, opened with ``open_cube``
+    '''
+    params = {'regex': regex, 'bands': list(bands), 'mask': mask, 'min_valid_fraction': min_valid_fraction,
+              'common_params': kwargs}
+    ds = _load(products, params, kwargs)
+    if dtype is not None:
+        ds = ds.astype(dtype)
+    save_cube(ds, path, products=products, load_params=params, access=access, overwrite=overwrite)
+    return open_cube(path)
+
+def new_products(path:str|Path, products:SearchResult|list) -> list:
+    '''
+    Products which are not stored in a cube yet (compared by their ids, see ``product_ids``).
+    '''
+    stored = set(cube_metadata(open_cube(path))['products'])
+    return [product for product in products if trace.product_name(product) not in stored]
+
+def _cast(ds:xr.Dataset, stored:xr.Dataset, fill_value:int=0) -> xr.Dataset:
+    '''
+    Casts the bands to the data type of the stored bands, Nan values cannot be stored in integer bands.
+    '''
+    ds = ds.copy()
+    for name in ds.data_vars:
+        dtype = np.dtype(stored[name].encoding.get('dtype', stored[name].dtype))
+        if dtype.kind in 'biu':
+            ds[name] = ds[name].fillna(stored[name].encoding.get('_FillValue', fill_value))
+        ds[name] = ds[name].astype(dtype)
+        ds[name].encoding = {}
+        # Attributes which are encodings of the stored bands (e.g.: scale_factor) are already defined by the store
+        for key in stored[name].encoding:
+            ds[name].attrs.pop(key, None)
+    return ds
+
+def _insert(path:Path, stored:xr.Dataset, ds:xr.Dataset, fill_value:int=0) -> None:
+    '''
+    Inserts acquisitions into the time dimension of a Zarr cube in place. The cube is extended at the end, then the
+    chunks along time from the first inserted date on are rewritten one after another, starting with the last one,
+    so the stored slices are read before they are overwritten and only one chunk is in memory at a time.
+    Acquisitions of a stored date only fill its Nan pixels.
+    '''
+    stored_times = stored['time'].values
+    times = np.union1d(stored_times, ds['time'].values)
+    n_inserted = len(times) - len(stored_times)
+    first = int(np.searchsorted(times, ds['time'].values[0]))
+
+    if n_inserted:
+        # Placeholders which extend the cube, they are overwritten below
+        inserted = ds.sel(time=np.setdiff1d(ds['time'].values, stored_times))
+        placeholder = _cast(inserted, stored, fill_value).assign_coords(time=times[-n_inserted:])
+        placeholder.attrs = dict(stored.attrs)
+        placeholder.to_zarr(path, mode='a', append_dim='time', consolidated=True)
+
+    chunk = stored[next(iter(stored.data_vars))].encoding['chunks'][0]
+    starts = range(first // chunk * chunk, len(times), chunk)
+    for start in reversed(starts):
+        block_times = times[start:start + chunk]
+        parts = [stored.sel(time=stored_times[np.isin(stored_times, block_times)]).load(),
+                 ds.sel(time=ds['time'].values[np.isin(ds['time'].values, block_times)])]
+        # The stored values come first, so they are kept where both are valid
+        block = loading.assemble_cube([part for part in parts if part.sizes['time'] > 0])
+        block = _cast(block, stored, fill_value)
+        block = block.drop_vars([name for name, data in block.variables.items() if 'time' not in data.dims or name == 'time'])
+        block.to_zarr(path, mode='r+', region={'time': slice(start, start + len(block_times))})
+
+    # Index coordinates are not written in a region, the time axis is small and written at once with the stored units
+    import zarr
+    from xarray.coding.times import encode_cf_datetime
+    time = zarr.open_group(str(path), mode='r+')['time']
+    encoding = stored['time'].encoding
+    values, _, _ = encode_cf_datetime(times, encoding['units'], encoding.get('calendar'), dtype=time.dtype)
+    time[:] = values
+
+@trace.traced()
+def append_cube(path:str|Path, products:SearchResult|list, allow_rewrite:bool=False, fill_value:int=0, log:bool=False,
+                **kwargs) -> xr.Dataset:
+    '''
+    Loads only the products which are not stored in a Zarr cube yet and appends them along the time dimension.
+    The bands and parameters of the first loading (see ``load_cube``) are used again.
+
+    The existing chunks are not rewritten, if all new acquisitions are later than the last stored one
+    (only a partially filled last chunk along time is completed). Acquisitions of an earlier or of an already stored
+    date would break the order of the time dimension, in this case the chunks along time from the first inserted date
+    on are rewritten in place, one chunk at a time (``allow_rewrite``, an interrupted rewrite leaves a broken cube).
+    Products which were skipped by ``min_valid_fraction`` are recorded as well, so they are not loaded again.
+    The new bands are cast to the data type of the stored bands, Nan values of integer bands are set to the fill value.
+
+    Params:
+    -------
+        - path: str|Path -> path of the Zarr store
+        - products: list[EOProduct] -> products of the area (e.g.: a new SearchResult), stored products are ignored
+        - allow_rewrite: bool -> if True, chunks are rewritten when new acquisitions have to be inserted,
+                                 otherwise a ValueError is raised
+        - fill_value: int -> value of Nan pixels in integer bands without a stored _FillValue (0: nodata of Sentinel-2)
+        - log: bool -> if True, the number of new products is printed
+        - **kwargs: dict -> ``common_params`` which replace the stored ones (needed for values which were not
+                            json serialisable, e.g.: geometries)
+
+    Returns:
+    -------
+        - ds: xr.Dataset -> updated cube, opened with ``open_cube``
+    '''
+    import zarr
+
+    path = Path(path)
+    if path.suffix == '.nc':
+        raise ValueError('Only Zarr cubes can be appended, NetCDF files have to be rewritten with save_cube.')
+    stored = open_cube(path)
+    metadata = cube_metadata(stored)
+    params = metadata['load_params']
+    if 'bands' not in params:
+        raise ValueError(f'{path} has no stored bands, create the cube with load_cube or pass load_params to save_cube.')
+
+    products = new_products(path, products)
+    if log:
+        print(f'{len(products)} new products for {path}')
+    if len(products) == 0:
+        return stored
+
+    ds = _load(products, params, dict(params.get('common_params', {}), **kwargs))
+    ids = json.dumps(sorted(set(metadata['products']) | set(product_ids(products))))
+
+    if len(ds.data_vars) > 0:
+        ds = _prepare(ds).sortby('time')
+        for dim in ('x', 'y'):
+            if ds.sizes[dim] != stored.sizes[dim] or not (ds[dim].values == stored[dim].values).all():
+                raise ValueError(f'The new products are not on the grid of the cube ({dim} differs), use the same common_params.')
+
+        if ds['time'].values[0] > stored['time'].values[-1]:
+            ds = _cast(ds, stored, fill_value)
+            ds.attrs = dict(stored.attrs, **{PRODUCTS_ATTR: ids})
+            ds.to_zarr(path, mode='a', append_dim='time', consolidated=True)
+        elif allow_rewrite:
+            _insert(path, stored, ds, fill_value)
+        else:
+            raise ValueError(f'New acquisitions are not later than the last one of {path}, '
+                             f'use allow_rewrite=True to rewrite the cube.')
+
+    # The attributes of the group are updated separately, the data of the cube is not touched
+    group = zarr.open_group(str(path), mode='r+')
+    group.attrs[PRODUCTS_ATTR] = ids
+    zarr.consolidate_metadata(str(path))
+    return open_cube(path)
@@ -0,0 +1,311 @@
+#Description
+'''
+This script is intended to simplify further processes in your code.
+In here you will find all the necessary functions to download products into a shared datapool:
+products which are already complete are skipped, interrupted downloads are resumed and
+the downloaded files are verified with the checksums of the SAFE manifest.
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+
+
+#Modules:
+import os
+import time
+import shutil
+import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools.lazy import lazy_import
+requests = lazy_import('requests')
+
+if TYPE_CHECKING:
+    from eodag import EOProduct, SearchResult
+
+
+##############################################
+# Manifest functions
+##############################################
+
+def read_manifest(safe_dir:str|Path) -> list[dict]:
+    '''
+    Reads the list of files (path, size and MD5 checksum) from the ``manifest.safe`` of a product in SAFE format.
+
+    Params:
+    -------
+        - safe_dir: str|Path -> directory of the product containing the ``manifest.safe``
+
+    Returns:
+    -------
+        - files: list[dict] -> one dictionary per file with the keys 'path', 'size' and 'md5' (None if not given)
+                                 Raises a ValueError, if a file of the manifest is outside of ``safe_dir``.
+    '''
+    files = []
+    safe_dir = Path(safe_dir)
+    root = ET.parse(safe_dir / 'manifest.safe').getroot()
+    for element in root.iter():
+        if not element.tag.endswith('byteStream'):
+            continue
+        location = next((e for e in element if e.tag.endswith('fileLocation')), None)
+        checksum = next((e for e in element if e.tag.endswith('checksum')), None)
+        if location is None:
+            continue
+        path = safe_dir / location.get('href').removeprefix('./')
+        if not path.resolve().is_relative_to(safe_dir.resolve()):
+            raise ValueError(f'{location.get("href")} of the manifest.safe points outside of {safe_dir}.')
+        files.append({
+            'path': path,
+            'size': int(element.get('size')) if element.get('size') else None,
+            'md5': checksum.text.strip().lower() if checksum is not None and checksum.get('checksumName', '').upper() == 'MD5' else None,
+        })
+    return files
+
+def _md5(filepath:Path, chunk_size:int=8*1024*1024) -> str:
+    '''
+    MD5 checksum of a file (read in chunks).
+    '''
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def is_product_complete(safe_dir:str|Path, verify_checksums:bool=False) -> bool:
+    '''
+    Checks if all files listed in the ``manifest.safe`` of a product exist and have the right size.
+
+    Params:
+    -------
+        - safe_dir: str|Path -> directory of the product containing the ``manifest.safe``
+        - verify_checksums: bool -> if True, also the MD5 checksums of the files are compared (reads every file)
+
+    Returns:
+    -------
+        - complete: bool
+    '''
+    if not (Path(safe_dir) / 'manifest.safe').is_file():
+        return False
+    try:
+        files = read_manifest(safe_dir)
+    except (ET.ParseError, ValueError):
+        return False
+
+    for file in files:
+        if not file['path'].is_file():
+            return False
+        if file['size'] is not None and file['path'].stat().st_size != file['size']:
+            return False
+        if verify_checksums and file['md5'] is not None and _md5(file['path']) != file['md5']:
+            return False
+    return True
+
+def find_local_product(product:EOProduct, outputs_prefix:str|Path, verify_checksums:bool=False) -> Path|None:
+    '''
+    Looks for a complete copy of a product in the datapool. The usual layouts of eodag
+    (``<title>``, ``<title>/<title>.SAFE``) and of ``download_product`` (``<title>.SAFE``) are checked.
+
+    Params:
+    -------
+        - product: EOProduct -> product to look for
+        - outputs_prefix: str|Path -> directory of the datapool
+        - verify_checksums: bool -> if True, also the MD5 checksums of the files are compared
+
+    Returns:
+    -------
+        - safe_dir: Path -> directory containing the ``manifest.safe`` (None if there is no complete copy)
+    '''
+    title = product.properties['title']
+    candidates = [Path(outputs_prefix) / f'{title}.SAFE',
+                  Path(outputs_prefix) / title / f'{title}.SAFE',
+                  Path(outputs_prefix) / title]
+    for candidate in candidates:
+        if is_product_complete(candidate, verify_checksums=verify_checksums):
+            return candidate
+    return None
+
+
+##############################################
+# Download functions
+##############################################
+
+@trace.traced('download.download_archive')
+def _download_archive(product:EOProduct, archive_path:Path, chunk_size:int=8*1024*1024, timeout:int=60) -> int:
+    '''
+    Downloads the archive of a product. If a partial download (``.part`` file) exists, only the missing bytes are requested.
+
+    Returns:
+    -------
+        - bytes: int -> number of bytes downloaded in this call
+    '''
+    url = product.properties.get('downloadLink') or product.remote_location
+    auth = product.downloader_auth.authenticate()
+    part_path = archive_path.with_name(archive_path.name + '.part')
+    offset = part_path.stat().st_size if part_path.is_file() else 0
+
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+    with requests.get(url, headers=headers, auth=auth, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The partial file is already complete
+            os.replace(part_path, archive_path)
+            return 0
+        response.raise_for_status()
+
+        # The server ignored the range request, so the download starts from the beginning
+        if response.status_code != 206:
+            offset = 0
+        expected = response.headers.get('Content-Length')
+        expected = offset + int(expected) if expected is not None else None
+
+        downloaded = 0
+        with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                downloaded += len(chunk)
+
+    if expected is not None and part_path.stat().st_size != expected:
+        raise IOError(f'Download of {product.properties["title"]} is incomplete, run the download again to resume it.')
+    os.replace(part_path, archive_path)
+    return downloaded
+
+@trace.traced('download.extract_archive')
+def _extract_archive(archive_path:Path, outputs_prefix:Path) -> Path:
+    '''
+    Checks the CRCs of a zip archive and extracts it. The product is extracted into a temporary directory first,
+    so an interrupted extraction never looks like a complete product.
+
+    Returns:
+    -------
+        - safe_dir: Path -> extracted directory containing the ``manifest.safe``
+    '''
+    try:
+        archive = zipfile.ZipFile(archive_path)
+        broken = archive.testzip()
+    except zipfile.BadZipFile:
+        archive, broken = None, archive_path.name
+    if broken is not None:
+        # A corrupt archive is removed, so the next run downloads it again
+        if archive is not None:
+            archive.close()
+        archive_path.unlink()
+        raise IOError(f'{archive_path.name} is corrupt ({broken}).')
+
+    with archive:
+        tmp_dir = outputs_prefix / f'.{archive_path.stem}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        archive.extractall(tmp_dir)
+
+    manifests = list(tmp_dir.glob('**/manifest.safe'))
+    if len(manifests) == 0:
+        raise IOError(f'{archive_path.name} does not contain a manifest.safe.')
+    extracted = manifests[0].parent
+    safe_dir = outputs_prefix / (extracted.name if extracted.name.endswith('.SAFE') else f'{archive_path.stem}.SAFE')
+    shutil.rmtree(safe_dir, ignore_errors=True)
+    os.replace(extracted, safe_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return safe_dir
+
+def download_product(product:EOProduct, outputs_prefix:str|Path, verify_checksums:bool=True) -> tuple[Path, int, bool]:
+    '''
+    Downloads a single product into the datapool, unless a complete copy already exists.
+    Interrupted downloads are resumed and the extracted files are verified with the ``manifest.safe``.
+    Products without a direct download link are downloaded with eodag (without resuming).
+    The location of the product is set to the local copy, so ``get_data`` reads from the datapool.
+
+    Params:
+    -------
+        - product: EOProduct -> product to be downloaded
+        - outputs_prefix: str|Path -> directory of the datapool
+        - verify_checksums: bool -> if True, the MD5 checksums of the downloaded files are verified
+
+    Returns:
+    -------
+        - (safe_dir, bytes, skipped): directory of the product, number of downloaded bytes and if the download was skipped
+    '''
+    outputs_prefix = Path(outputs_prefix).resolve()
+    outputs_prefix.mkdir(parents=True, exist_ok=True)
+
+    safe_dir = find_local_product(product, outputs_prefix)
+    if safe_dir is not None:
+        product.location = safe_dir.as_uri()
+        return safe_dir, 0, True
+
+    url = product.properties.get('downloadLink') or product.remote_location
+    if not url or not str(url).startswith('http') or product.downloader_auth is None:
+        path = product.download(outputs_prefix=str(outputs_prefix), extract=True)
+        safe_dir = find_local_product(product, outputs_prefix) or Path(path)
+        return safe_dir, 0, False
+
+    archive_path = outputs_prefix / f'{product.properties["title"]}.zip'
+    downloaded = 0
+    if not archive_path.is_file():
+        downloaded = _download_archive(product, archive_path)
+    safe_dir = _extract_archive(archive_path, outputs_prefix)
+
+    if not is_product_complete(safe_dir, verify_checksums=verify_checksums):
+        shutil.rmtree(safe_dir, ignore_errors=True)
+        archive_path.unlink()
+        raise IOError(f'{product.properties["title"]} does not match its manifest, the download has been removed.')
+    archive_path.unlink()
+
+    product.location = safe_dir.as_uri()
+    return safe_dir, downloaded, False
+
+@trace.traced()
+def download_all(products:SearchResult|list[EOProduct], outputs_prefix:str|Path, max_workers:int=4,
+                 verify_checksums:bool=True, log:bool=True) -> list[str|None]:
+    '''
+    Downloads multiple products into the datapool with a pool of workers (see ``download_product``).
+    Only products without a complete copy in the datapool are downloaded, products listed more than once
+    (same id) are downloaded once.
+
+    Params:
+    -------
+        - products: SearchResult|list[EOProduct] -> products to be downloaded
+        - outputs_prefix: str|Path -> directory of the datapool (e.g.: ``workspace['download']``)
+        - max_workers: int -> number of downloads at the same time (CDSE allows 4 per user)
+        - verify_checksums: bool -> if True, the MD5 checksums of the downloaded files are verified
+        - log: bool -> if True, failed downloads and the throughput are printed
+
+    Returns:
+    -------
+        - paths: list[str|None] -> local paths of the products in the order of the products (None if the download failed)
+    '''
+    def download(product):
+        try:
+            with trace.span('download.download_product', product=trace.product_name(product)) as s:
+                result = download_product(product, outputs_prefix, verify_checksums=verify_checksums)
+                s.set(bytes=result[1], skipped=result[2])
+            return result
+        except Exception as e:
+            if log:
+                print(f'Download of {product.properties["title"]} failed: {e}')
+            return None, 0, False
+
+    # A product listed twice is downloaded once, two workers would write into the same .part file
+    products = list(products)
+    unique = list({product.properties['id']: product for product in products}.values())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip([product.properties['id'] for product in unique], executor.map(download, unique)))
+    elapsed = time.perf_counter() - start
+
+    if log:
+        total_bytes = sum(r[1] for r in results.values())
+        n_skipped = sum(r[2] for r in results.values())
+        n_failed = sum(r[0] is None for r in results.values())
+        n_downloaded = len(results) - n_skipped - n_failed
+        print(f'Downloaded {n_downloaded} products ({total_bytes / 1e9:.2f} GB) in {elapsed:.1f} s '
+              f'({total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s), skipped {n_skipped} complete products, {n_failed} failed.')
+
+    paths = {product_id: str(r[0]) if r[0] is not None else None for product_id, r in results.items()}
+    return [paths[product.properties['id']] for product in products]
@@ -4,6 +4,7 @@ This script is intended to simplify further processes in your code.
 In here you will find all the necessary functions to transform Geojson Files 
 into Polygons and to preprocess the data for classification.
 '''
+from __future__ import annotations
 
 
 
@@ -14,29 +15,73 @@ __version__ = '20-Jun-2024_v01'
 
 
 #Modules:
-import rioxarray
-import xarray as xr
+import os
 import numpy as np
-import geopandas as gpd
-from shapely.geometry import mapping, box
-from sklearn.model_selection import train_test_split
+from functools import lru_cache
+from eotools import trace
+from eotools.lazy import lazy_import
+xr = lazy_import('xarray')
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
 
 
-def clip_dataset_2_shapefile(ds:xr.Dataset, shapefile:str) -> xr.Dataset:
+@lru_cache(maxsize=16)
+@trace.traced('geometry.read_shapefile')
+def _prepared_clip_geometries(path:str, mtime:float, crs_wkt:str, bounds:tuple) -> tuple:
+    '''
+    Reads the features of a shapefile which intersect the bounds and reprojects them to the given CRS.
+    The result is cached, ``mtime`` is part of the cache key so a changed file is read again.
+
+    Params:
+    ------
+        - ``path``: Absolute filepath to Shapefile
+        - ``mtime``: Modification time of the file
+        - ``crs_wkt``: CRS of the Dataset (WKT string)
+        - ``bounds``: Bounds of the Dataset in its CRS (left, bottom, right, top)
+
+    Returns:
+    -------
+        - ``geometries, window``: Tuple of GeoJSON-like geometries in the CRS of the Dataset and their total bounds
+    '''
+    from shapely.geometry import mapping, box
+
+    # Only features intersecting the Dataset are read (geopandas reprojects the bbox to the CRS of the file)
+    bbox = gpd.GeoSeries([box(*bounds)], crs=crs_wkt)
+    clip_shape = gpd.read_file(path, bbox=bbox)
+    if len(clip_shape) == 0:
+        raise ValueError('No features in the shapefile are within the bounds of the xarray Dataset.')
+    clip_shape = clip_shape.to_crs(crs_wkt)
+    return tuple(clip_shape.geometry.apply(mapping)), tuple(clip_shape.total_bounds)
+
+@trace.traced()
+def clip_dataset_2_shapefile(ds:xr.Dataset, shapefile:str, drop:bool=False) -> xr.Dataset:
     '''
     Clips an xarray Dataset to a shapefile.
+    The features of the shapefile are only read and reprojected once for a given Dataset CRS and extent,
+    so clipping a time series of Datasets to the same shapefile does not read the file again.
 
     Params:
     ------
         - ``ds``: xarray.Dataset
         - ``shapefile``: Filepath to Shapefile
+        - ``drop``: If True, the Dataset is cropped to the extent of the geometries before masking,
+                    otherwise it keeps its extent and the values outside are masked (default: False)
 
     Returns:
     -------
         - ``ds``: Clipped xarray.Dataset
     '''
-    clip_shape = gpd.read_file(shapefile)
-    ds = ds.rio.clip(clip_shape.geometry.apply(mapping), clip_shape.crs, drop=False, invert=False)
+    import rioxarray  # registers the .rio accessor
+
+    path = os.path.abspath(shapefile)
+    bounds = tuple(float(b) for b in ds.rio.bounds())
+    geometries, window = _prepared_clip_geometries(path, os.path.getmtime(path), ds.rio.crs.to_wkt(), bounds)
+
+    if drop:
+        # Crop to the bounding window of the geometries, so only this window has to be masked
+        ds = ds.rio.clip_box(*window)
+
+    ds = ds.rio.clip(geometries, ds.rio.crs, drop=drop, invert=False)
     return ds
 
 def geojson_to_polygon(path:str) -> list:
@@ -88,6 +133,8 @@ def check_in_bounds(dataset, polygon):
     Returns:
     bool: True, wenn das Polygon innerhalb des geographischen Bereichs des Datasets liegt, andernfalls False.
     """
+    from shapely.geometry import box
+
     # Extrahiere die geographischen Grenzen des xarray Datasets
     lat_min = dataset.coords['y'].min().item()
     lat_max = dataset.coords['y'].max().item()
@@ -100,6 +147,7 @@ def check_in_bounds(dataset, polygon):
     # Überprüfe, ob das Polygon innerhalb des geographischen Bereichs liegt
     return bounding_box.contains(polygon)
 
+@trace.traced()
 def clip_array(ds:xr.Dataset, polygons):
     '''
     Takes an xarray.Dataset and a geometry and returns the xarray.Dataset, which has been spatialy clipped
@@ -114,14 +162,136 @@ def clip_array(ds:xr.Dataset, polygons):
     -------
         - ``clipped_nan``: clipped dataset where values outside of polygons have Nan type
     '''
+    import rioxarray  # registers the .rio accessor
+
     clipped = ds.rio.clip(polygons, invert=False, all_touched=False, drop=True)
     clipped_nan = clipped.where(clipped == ds)
     return clipped_nan
 
-def preprocess_data_to_classify(ds:xr.Dataset, feature_path:str, nonfeature_path:str, bands:list=None) -> list:
+def subsample_rows(values:np.ndarray, max_samples:int=None, rng:np.random.Generator=None) -> np.ndarray:
     '''
-    Takes an xarray Dataset, two geojson files (one of areas with the desired feature, the other not with the feature)
-    and a list of strings of the desired Bandnames in the Dataset and returns The Training and Test data for some Classifikators.
+    Draws a random subset of rows (without replacement) from a 2D array, keeping the original row order.
+
+    Params:
+    -------
+        - ``values``: np.ndarray of shape (n_pixels, n_features)
+        - ``max_samples``: Maximum number of rows to keep. If None or larger than the array, all rows are kept.
+        - ``rng``: np.random.Generator used for the draw (optional)
+
+    Returns:
+    -------
+        - ``values``: np.ndarray with at most ``max_samples`` rows
+    '''
+    if max_samples is None or values.shape[0] <= max_samples:
+        return values
+    if rng is None:
+        rng = np.random.default_rng()
+    idx = np.sort(rng.choice(values.shape[0], size=max_samples, replace=False))
+    return values[idx]
+
+def reservoir_sample(chunks, max_samples:int=None, random_state:int=None) -> np.ndarray:
+    '''
+    Uniformly samples rows from a stream of 2D arrays with a fixed memory budget (reservoir sampling).
+    Only the reservoir and the current chunk are held in memory, so the size of the stream does not matter.
+    The result is deterministic for a given ``random_state`` and order of chunks.
+
+    Params:
+    -------
+        - ``chunks``: Iterable of np.ndarrays with the same number of columns
+        - ``max_samples``: Size of the reservoir. If None, all rows are kept.
+        - ``random_state``: Seed or np.random.Generator for reproducible sampling
+
+    Returns:
+    -------
+        - ``sample``: np.ndarray with at most ``max_samples`` rows. If all chunks are empty, the result has
+          zero rows and the number of columns of the chunks (shape (0, 0) only if the stream has no chunks at all).
+    '''
+    rng = np.random.default_rng(random_state)
+
+    # Shape and dtype of an empty result are taken from the first chunk (which may be empty itself)
+    empty = None
+
+    if max_samples is None:
+        kept = []
+        for chunk in chunks:
+            chunk = np.asarray(chunk)
+            if empty is None:
+                empty = np.empty((0,) + chunk.shape[1:], dtype=chunk.dtype)
+            if chunk.shape[0] > 0:
+                kept.append(chunk)
+        if kept:
+            return np.concatenate(kept)
+        return empty if empty is not None else np.empty((0, 0))
+
+    reservoir = None
+    seen = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if empty is None:
+            empty = np.empty((0,) + chunk.shape[1:], dtype=chunk.dtype)
+        if chunk.shape[0] == 0:
+            continue
+        if reservoir is None:
+            reservoir = np.empty((max_samples,) + chunk.shape[1:], dtype=chunk.dtype)
+
+        # Fill the reservoir until it is full
+        n_fill = max(0, min(max_samples - seen, chunk.shape[0]))
+        reservoir[seen:seen + n_fill] = chunk[:n_fill]
+        seen += n_fill
+        rest = chunk[n_fill:]
+        if rest.shape[0] == 0:
+            continue
+
+        # Row number t (1-based) of the stream replaces a random slot with probability max_samples/t
+        positions = seen + np.arange(1, rest.shape[0] + 1)
+        slots = rng.integers(0, positions)
+        keep = slots < max_samples
+        slots, rows = slots[keep][::-1], rest[keep][::-1]
+
+        # If a slot is hit more than once within a chunk, the latest row wins (as in the sequential algorithm)
+        _, last = np.unique(slots, return_index=True)
+        reservoir[slots[last]] = rows[last]
+        seen += rest.shape[0]
+
+    if reservoir is None:
+        return empty if empty is not None else np.empty((0, 0))
+    return reservoir[:min(seen, max_samples)]
+
+def extract_polygon_pixels(ds:xr.Dataset, polygons_dict:dict, features:dict, max_samples_per_polygon:int=None, rng:np.random.Generator=None):
+    '''
+    Generator which clips the Dataset to one polygon at a time and yields the valid feature values of that polygon.
+    Pixels containing Nan values are dropped.
+
+    Params:
+    -------
+        - ``ds``: xarray.Dataset
+        - ``polygons_dict``: Dictionary of polygons (provided by ``geojson_to_polygon_dict``)
+        - ``features``: Dictionary of feature functions (provided by ``band_features`` or built with the feature functions)
+        - ``max_samples_per_polygon`` (optional): Maximum number of pixels taken from a single polygon
+        - ``rng`` (optional): np.random.Generator used for subsampling
+
+    Yields:
+    -------
+        - ``idx, values``: polygon id and np.ndarray of shape (n_pixels, n_features)
+    '''
+    for idx, polygon in polygons_dict.items():
+        # The clipped Dataset only covers the bounding window of the polygon
+        clipped = clip_array(ds, polygon)
+
+        values = compute_features(clipped, features)
+        values = values[np.isfinite(values).all(axis=1)]
+
+        yield idx, subsample_rows(values, max_samples=max_samples_per_polygon, rng=rng)
+
+@trace.traced()
+def extract_training_data(ds:xr.Dataset, feature_path:str, nonfeature_path:str, bands:list=None,
+                          max_samples:int=None, max_samples_per_polygon:int=None, random_state:int=42,
+                          features:dict=None) -> tuple:
+    '''
+    Takes an xarray Dataset and two geojson files (one of areas with the desired feature, the other not with the feature)
+    and returns the pixel values, the classes and the polygon of every pixel.
+    The pixels are sampled polygon by polygon while they are extracted, so the memory needed for the training data
+    is bounded by ``max_samples`` and not by the size of the digitised areas.
 
     Params:
     -------
@@ -130,48 +300,377 @@ def preprocess_data_to_classify(ds:xr.Dataset, feature_path:str, nonfeature_path
         - ``nonfeature_path``: Filepath to Geojson, which does not have the feature (e.g.: not forested Areas)
         - ``bands`` (optional): List of Strings of desired Spectral Bands (e.g.: bands=['B02', 'B03', 'B04', 'B08'])
                                 If None, then takes all in the Dataset.
+        - ``max_samples`` (optional): Maximum number of pixels per class (e.g.: 100_000). If None, all pixels are used.
+        - ``max_samples_per_polygon`` (optional): Maximum number of pixels taken from a single polygon,
+                                                  so that large polygons do not dominate a class.
+        - ``random_state``: Seed for the sampling (default: 42)
+        - ``features`` (optional): Dictionary of feature functions (e.g.: {'B04': band_feature('B04'), 'NDVI': normalized_difference_feature('B08', 'B04')})
+                                   If None, the median over time of every band is used.
 
     Returns:
     -------
-        -  ``X_train, X_test, y_train, y_test``: Training and Test Split for scikit.learn Classificators
+        - ``X, y, groups``: Feature values (n_pixels, n_features), classes (1 for feature, 0 for not feature) and
+                            polygon ids (the ids of ``geojson_to_polygon_dict``, the nonfeature ids follow the feature ids)
     '''
     # List all Bands which are loaded as Variables into the Dataset
     if bands == None:
         bands = list(ds.data_vars)
+    if features is None:
+        features = band_features(bands)
 
     # Geojsons from Features to Polygons
     polygons_feat:dict = geojson_to_polygon_dict(feature_path, ds=ds)
     polygons_nonfeat:dict = geojson_to_polygon_dict(nonfeature_path, ds=ds)
+    offset = len(polygons_feat)
 
-    # Dictionaries with Dataarrays, each clipped by a Polygon
-    data_dict_feat = {idx: clip_array(ds, polygon) for idx, polygon in polygons_feat.items()}
-    data_dict_nonfeat = {idx: clip_array(ds, polygon)  for idx, polygon in polygons_nonfeat.items()}
-
-    # Median over time to get rid of outliers
-    median_data_dict_feat = {idx: xarray.median(dim='time', skipna=True) for idx, xarray in data_dict_feat.items()}
-    median_data_dict_nonfeat = {idx: xarray.median(dim='time', skipna=True) for idx, xarray in data_dict_nonfeat.items()}
-
-    # Reshape the polygon dataarrays to get a tuple (one value per band) of pixel values
-    feat_data = [xarray.to_array().values.reshape(len(bands),-1).T for xarray in median_data_dict_feat.values()]
-    nonfeat_data = [xarray.to_array().values.reshape(len(bands),-1).T for xarray in median_data_dict_nonfeat.values()]
+    # Seeded generators, one per class, so that the sample of a class does not depend on the other class
+    rng_feat, rng_nonfeat = np.random.default_rng(random_state).spawn(2)
 
-    # The rows of the different polygons are concatenated to a single array for further processing
-    feat_values = np.concatenate(feat_data)
-    nonfeat_values = np.concatenate(nonfeat_data)
+    # Pixels are extracted polygon by polygon and directly fed into a reservoir of at most max_samples rows per class.
+    # The polygon id is carried along as last column, so it stays attached to its pixels while sampling.
+    pixels_feat = (np.column_stack([values, np.full(values.shape[0], idx)])
+                   for idx, values in extract_polygon_pixels(ds, polygons_feat, features, max_samples_per_polygon, rng_feat))
+    pixels_nonfeat = (np.column_stack([values, np.full(values.shape[0], idx + offset)])
+                      for idx, values in extract_polygon_pixels(ds, polygons_nonfeat, features, max_samples_per_polygon, rng_nonfeat))
 
-    # Drop Nan Values
-    X_feat_data = feat_values[~np.isnan(feat_values).any(axis=1)]
-    X_nonfeat_data = nonfeat_values[~np.isnan(nonfeat_values).any(axis=1)]
+    feat_data = reservoir_sample(pixels_feat, max_samples=max_samples, random_state=rng_feat).reshape(-1, len(features) + 1)
+    nonfeat_data = reservoir_sample(pixels_nonfeat, max_samples=max_samples, random_state=rng_nonfeat).reshape(-1, len(features) + 1)
 
     # Creating Output Vector (1 for pixel is features; 0 for pixel is not feature)
-    y_feat_data = np.ones(X_feat_data.shape[0])
-    y_nonfeat_data = np.zeros(X_nonfeat_data.shape[0])
-    
+    y_feat_data = np.ones(feat_data.shape[0])
+    y_nonfeat_data = np.zeros(nonfeat_data.shape[0])
+
     # Concatnate all Classes for training 
-    X = np.concatenate([X_feat_data, X_nonfeat_data])
+    data = np.concatenate([feat_data, nonfeat_data])
+    X = data[:, :-1]
     y = np.concatenate([y_feat_data, y_nonfeat_data])
+    groups = data[:, -1].astype(int)
+
+    return X, y, groups
+
+@trace.traced()
+def preprocess_data_to_classify(ds:xr.Dataset, feature_path:str, nonfeature_path:str, bands:list=None,
+                                max_samples:int=None, max_samples_per_polygon:int=None, random_state:int=42,
+                                group_by_polygon:bool=False, features:dict=None) -> list:
+    '''
+    Takes an xarray Dataset, two geojson files (one of areas with the desired feature, the other not with the feature)
+    and a list of strings of the desired Bandnames in the Dataset and returns The Training and Test data for some Classifikators.
+    See ``extract_training_data`` for the sampling of the pixels.
+
+    Params:
+    -------
+        - ``ds``: xarray.Dataset
+        - ``feature_path``: Filepath to Geojson with Polygons, which represent the Feature (e.g.: forested Areas)
+        - ``nonfeature_path``: Filepath to Geojson, which does not have the feature (e.g.: not forested Areas)
+        - ``bands`` (optional): List of Strings of desired Spectral Bands (e.g.: bands=['B02', 'B03', 'B04', 'B08'])
+                                If None, then takes all in the Dataset.
+        - ``max_samples`` (optional): Maximum number of pixels per class (e.g.: 100_000). If None, all pixels are used.
+        - ``max_samples_per_polygon`` (optional): Maximum number of pixels taken from a single polygon
+        - ``random_state``: Seed for the sampling and the train/test split (default: 42)
+        - ``group_by_polygon``: If True, all pixels of a polygon end up either in the training or in the test data,
+                                so neighbouring pixels of the same polygon are not used for training and testing.
+        - ``features`` (optional): Dictionary of feature functions, see ``extract_training_data``
+
+    Returns:
+    -------
+        -  ``X_train, X_test, y_train, y_test``: Training and Test Split for scikit.learn Classificators
+    '''
+    from sklearn.model_selection import train_test_split
+
+    X, y, groups = extract_training_data(ds, feature_path, nonfeature_path, bands=bands, max_samples=max_samples,
+                                         max_samples_per_polygon=max_samples_per_polygon, random_state=random_state,
+                                         features=features)
 
     # Split into Training and Testing Data.
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.5, random_state=42)
+    if group_by_polygon:
+        X_train, X_test, y_train, y_test = grouped_train_test_split(X, y, groups, test_size=0.5, random_state=random_state)
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.5, random_state=random_state)
+
+    return X_train, X_test, y_train, y_test
 
-    return X_train, X_test, y_train, y_test
\ No newline at end of file
+
+##############################################
+# Feature functions
+##############################################
+
+def _composite(da:xr.DataArray, stat:str='median') -> xr.DataArray:
+    '''
+    Reduces the time dimension of a DataArray (if there is one) with the given statistic.
+    '''
+    if 'time' not in da.dims:
+        return da
+    return getattr(da, stat)(dim='time', skipna=True)
+
+def band_feature(band:str):
+    '''
+    Feature of a single band (median over time, if the Dataset has a time dimension).
+
+    Params:
+    -------
+        - ``band``: Name of the band (e.g.: 'B04')
+
+    Returns:
+    -------
+        - ``feature``: Function which takes a Dataset (block) and returns a DataArray with dims (y, x)
+    '''
+    def feature(block:xr.Dataset) -> xr.DataArray:
+        return _composite(block[band])
+    return feature
+
+def ratio_feature(a:str, b:str):
+    '''
+    Feature of the ratio of two bands (a / b) of the median over time.
+
+    Params:
+    -------
+        - ``a``: Name of the band in the numerator
+        - ``b``: Name of the band in the denominator
+
+    Returns:
+    -------
+        - ``feature``: Function which takes a Dataset (block) and returns a DataArray with dims (y, x)
+    '''
+    def feature(block:xr.Dataset) -> xr.DataArray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = _composite(block[a]) / (_composite(block[b]) * 1.)
+        # A band with value 0 (nodata of L2A) gives +-inf, which the classifiers do not accept
+        return ratio.where(np.isfinite(ratio))
+    return feature
+
+def normalized_difference_feature(a:str, b:str):
+    '''
+    Feature of the normalized difference of two bands (a - b) / (a + b) of the median over time
+    (e.g.: NDVI with a='B08' and b='B04').
+
+    Params:
+    -------
+        - ``a``: Name of the first band
+        - ``b``: Name of the second band
+
+    Returns:
+    -------
+        - ``feature``: Function which takes a Dataset (block) and returns a DataArray with dims (y, x)
+    '''
+    def feature(block:xr.Dataset) -> xr.DataArray:
+        a_data, b_data = _composite(block[a]), _composite(block[b])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            difference = (a_data - b_data * 1.) / (a_data + b_data)
+        return difference.where(np.isfinite(difference))
+    return feature
+
+def temporal_feature(band:str, stat:str='std'):
+    '''
+    Feature of a temporal statistic of a band.
+
+    Params:
+    -------
+        - ``band``: Name of the band (e.g.: 'B08')
+        - ``stat``: Statistic over time ('mean', 'median', 'std', 'min', 'max') (default: 'std')
+
+    Returns:
+    -------
+        - ``feature``: Function which takes a Dataset (block) and returns a DataArray with dims (y, x)
+    '''
+    if stat not in ['mean', 'median', 'std', 'min', 'max']:
+        raise ValueError(f'Unknown statistic {stat}.')
+
+    def feature(block:xr.Dataset) -> xr.DataArray:
+        return _composite(block[band], stat=stat)
+    return feature
+
+def band_features(bands:list) -> dict:
+    '''
+    Creates the default features, which are the bands themselves.
+
+    Params:
+    -------
+        - ``bands``: List of Strings of Bands (e.g.: ['B02', 'B03', 'B04', 'B08'])
+
+    Returns:
+    -------
+        - ``features``: Dictionary of feature functions
+    '''
+    return {band: band_feature(band) for band in bands}
+
+def compute_features(block:xr.Dataset, features:dict) -> np.ndarray:
+    '''
+    Computes all features of a (spatial) block of a Dataset.
+    The features are written one after another into the output array, so only one derived feature
+    is held in memory in addition to the output.
+
+    Params:
+    -------
+        - ``block``: xarray.Dataset (e.g.: a window of the full Dataset)
+        - ``features``: Dictionary of feature functions
+
+    Returns:
+    -------
+        - ``values``: np.ndarray of shape (n_pixels, n_features), pixels in (y, x) order
+    '''
+    shape = (block.sizes['y'], block.sizes['x'])
+    values = np.empty((shape[0] * shape[1], len(features)))
+    for i, feature in enumerate(features.values()):
+        data = feature(block).transpose('y', 'x')
+        values[:, i] = np.asarray(data.values, dtype=float).reshape(-1)
+    return values
+
+def iter_blocks(ds:xr.Dataset, block_size:int=512):
+    '''
+    Generator which splits a Dataset into spatial blocks.
+    If the Dataset is lazy (e.g.: loaded with dask), only the current block is read.
+
+    Params:
+    -------
+        - ``ds``: xarray.Dataset
+        - ``block_size``: Number of pixels of a block in x and y direction (default: 512)
+
+    Yields:
+    -------
+        - ``(y_slice, x_slice), block``: position of the block and the block as xarray.Dataset
+    '''
+    for y0 in range(0, ds.sizes['y'], block_size):
+        for x0 in range(0, ds.sizes['x'], block_size):
+            window = (slice(y0, y0 + block_size), slice(x0, x0 + block_size))
+            yield window, ds.isel(y=window[0], x=window[1])
+
+def iter_feature_blocks(ds:xr.Dataset, features:dict, block_size:int=512):
+    '''
+    Generator which computes the features of a Dataset block by block.
+
+    Params:
+    -------
+        - ``ds``: xarray.Dataset
+        - ``features``: Dictionary of feature functions
+        - ``block_size``: Number of pixels of a block in x and y direction (default: 512)
+
+    Yields:
+    -------
+        - ``(y_slice, x_slice), values``: position of the block and np.ndarray of shape (n_pixels, n_features)
+    '''
+    for window, block in iter_blocks(ds, block_size=block_size):
+        yield window, compute_features(block, features)
+
+@trace.traced()
+def predict_image(model, ds:xr.Dataset, features:dict=None, block_size:int=512) -> xr.DataArray:
+    '''
+    Classifies a whole Dataset block by block with the same features which were used for training.
+    Pixels with Nan or infinite values in any feature are Nan in the output.
+
+    Params:
+    -------
+        - ``model``: fitted scikit.learn Classificator
+        - ``ds``: xarray.Dataset
+        - ``features`` (optional): Dictionary of feature functions. If None, all bands of the Dataset are used.
+        - ``block_size``: Number of pixels of a block in x and y direction (default: 512)
+
+    Returns:
+    -------
+        - ``prediction``: xarray.DataArray with dims (y, x)
+    '''
+    if features is None:
+        features = band_features(list(ds.data_vars))
+
+    prediction = np.full((ds.sizes['y'], ds.sizes['x']), np.nan)
+    for (y_slice, x_slice), values in iter_feature_blocks(ds, features, block_size=block_size):
+        block = prediction[y_slice, x_slice]
+        valid = np.isfinite(values).all(axis=1)
+        if valid.any():
+            flat = np.full(values.shape[0], np.nan)
+            flat[valid] = model.predict(values[valid])
+            block[...] = flat.reshape(block.shape)
+
+    return xr.DataArray(prediction, dims=['y', 'x'], coords={'x': ds['x'], 'y': ds['y']})
+
+
+##############################################
+# Model evaluation functions
+##############################################
+
+def grouped_train_test_split(X:np.ndarray, y:np.ndarray, groups:np.ndarray, test_size:float=0.5, random_state:int=42) -> list:
+    '''
+    Splits the data into Training and Test data, while keeping all pixels of a polygon together.
+    The polygons are stratified by class as in ``evaluate_classifiers`` (one fold of ``StratifiedGroupKFold``),
+    so the classes are balanced between Training and Test data as far as the polygons allow
+    (a class is in both, if it has at least n_splits polygons, e.g.: 2 for the default test_size).
+
+    Params:
+    -------
+        - ``X``: np.ndarray of pixel values (n_pixels, n_bands)
+        - ``y``: np.ndarray of classes
+        - ``groups``: np.ndarray of polygon ids (provided by ``extract_training_data``)
+        - ``test_size``: Fraction of polygons used for testing, rounded to 1 / n_splits (default: 0.5)
+        - ``random_state``: Seed for the split (default: 42)
+
+    Returns:
+    -------
+        -  ``X_train, X_test, y_train, y_test``: Training and Test Split for scikit.learn Classificators
+    '''
+    from sklearn.model_selection import StratifiedGroupKFold
+
+    n_groups = len(np.unique(groups))
+    if n_groups < 2:
+        raise ValueError('At least two polygons are needed to split the data by polygon.')
+
+    n_splits = min(max(round(1 / test_size), 2), n_groups)
+    splitter = StratifiedGroupKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    train, test = next(splitter.split(X, y, groups=groups))
+    return X[train], X[test], y[train], y[test]
+
+def _fit_and_score(name:str, fold:int, model, X:np.ndarray, y:np.ndarray, train:np.ndarray, test:np.ndarray) -> dict:
+    '''
+    Fits a model on the training indices and scores it on the test indices (used by ``evaluate_classifiers``).
+    '''
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+
+    model.fit(X[train], y[train])
+    predicted = model.predict(X[test])
+    return {'model': name,
+            'fold': fold,
+            'n_train': len(train),
+            'n_test': len(test),
+            'accuracy': accuracy_score(y[test], predicted),
+            'precision': precision_score(y[test], predicted, average='macro', zero_division=0),
+            'recall': recall_score(y[test], predicted, average='macro', zero_division=0),
+            'f1': f1_score(y[test], predicted, average='macro', zero_division=0)}
+
+@trace.traced()
+def evaluate_classifiers(X:np.ndarray, y:np.ndarray, groups:np.ndarray, models:dict, n_splits:int=5,
+                         n_jobs:int=-1, random_state:int=42) -> pd.DataFrame:
+    '''
+    Evaluates several classifiers with a k-fold cross validation, where the folds are made of whole polygons
+    (pixels of the same polygon are never used for training and testing at the same time).
+    All folds of all models are fitted in parallel.
+
+    Params:
+    -------
+        - ``X``: np.ndarray of pixel values (n_pixels, n_bands)
+        - ``y``: np.ndarray of classes
+        - ``groups``: np.ndarray of polygon ids (provided by ``extract_training_data``)
+        - ``models``: Dictionary of unfitted scikit.learn Classificators (e.g.: {'NB': GaussianNB(), 'RF': RandomForestClassifier()})
+        - ``n_splits``: Number of folds (default: 5), is reduced if there are fewer polygons
+        - ``n_jobs``: Number of parallel workers (default: -1, all cores)
+        - ``random_state``: Seed for the folds (default: 42)
+
+    Returns:
+    -------
+        - ``metrics``: pandas.DataFrame with accuracy, precision, recall and f1 score for every model and fold
+    '''
+    from joblib import Parallel, delayed
+    from sklearn.base import clone
+    from sklearn.model_selection import StratifiedGroupKFold
+
+    n_groups = len(np.unique(groups))
+    if n_groups < 2:
+        raise ValueError('At least two polygons are needed to split the data by polygon.')
+
+    # The folds are balanced by class, as long as every class has enough polygons
+    splitter = StratifiedGroupKFold(n_splits=min(n_splits, n_groups), shuffle=True, random_state=random_state)
+    folds = list(splitter.split(X, y, groups=groups))
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_and_score)(name, fold, clone(model), X, y, train, test)
+        for name, model in models.items()
+        for fold, (train, test) in enumerate(folds)
+    )
+    return pd.DataFrame(results)
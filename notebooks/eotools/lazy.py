@@ -0,0 +1,67 @@
+#Description
+'''
+This script is intended to keep the import of eotools fast.
+In here you will find the functions to defer the import of heavy dependencies (xarray, eodag, matplotlib, ...)
+until they are used for the first time.
+'''
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+
+
+#Modules:
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    '''
+    Placeholder for a module which is imported on the first attribute access.
+    Afterwards the attributes of the module are copied, so further accesses are as fast as for the module itself.
+    '''
+    def __init__(self, name:str):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr:str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name:str) -> types.ModuleType:
+    '''
+    Import a module on first use. If the module has already been imported, it is returned directly.
+
+    Params:
+    -------
+        - name: str -> full name of the module (e.g.: 'xarray', 'matplotlib.pyplot')
+
+    Returns:
+    -------
+        - module: ModuleType -> the module or a placeholder which imports it on the first attribute access
+
+    Example:
+    -------
+        xr = lazy_import('xarray')  # instead of: import xarray as xr
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -3,6 +3,7 @@
 This script is intended to simplify further processes in your code. 
 In here you will find all the necessary functions to load data into xarray Datasets.
 '''
+from __future__ import annotations
 
 
 
@@ -10,20 +11,34 @@ In here you will find all the necessary functions to load data into xarray Datas
 __name__ = 'loading'
 __version__ = '20-Jun-2024_v01'
 
+# Finest native resolution (in meters) of the Sentinel-2 bands and masks
+NATIVE_RESOLUTION = {'B01': 60, 'B02': 10, 'B03': 10, 'B04': 10, 'B05': 20, 'B06': 20, 'B07': 20, 'B08': 10,
+                     'B8A': 20, 'B09': 60, 'B10': 60, 'B11': 20, 'B12': 20, 'TCI': 10, 'AOT': 10, 'WVP': 10,
+                     'SCL': 20, 'CLDPRB': 20}
+
 
 
 #Modules:
 import datetime as dt
-import xarray as xr
 import os
-from eodag.utils.exceptions import AddressNotFound
-from eodag import EOProduct, SearchResult, EODataAccessGateway
+import re
+import warnings
+import numpy as np
 from pathlib import Path
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools.lazy import lazy_import
+xr = lazy_import('xarray')
+eodag = lazy_import('eodag')
+exceptions = lazy_import('eodag.utils.exceptions')
+
+if TYPE_CHECKING:
+    from eodag import EOProduct, SearchResult
 
 
 def load_assets(root:str, res=60, only_spectral:bool=True, include_tci:bool=False) -> list[str]:
     '''
-    Load all available assets/bands of a given product.
+    Load all available assets/bands of a given product (JP2 or GeoTIFF files).
 
     Params:
     -------
@@ -37,7 +52,7 @@ def load_assets(root:str, res=60, only_spectral:bool=True, include_tci:bool=Fals
         - assets: list[str] -> list of available assets/bands
     '''
     jp2_files = [file for dirs in os.walk(root, topdown=True)
-                     for file in dirs[2] if file.endswith(f"_{res}m.jp2")]
+                     for file in dirs[2] if file.endswith((f"_{res}m.jp2", f"_{res}m.tif"))]
     assets = [file.split('_')[2] for file in jp2_files if file.startswith('T')]
 
     if only_spectral and include_tci==False:
@@ -49,7 +64,8 @@ def load_assets(root:str, res=60, only_spectral:bool=True, include_tci:bool=Fals
     
     return assets
 
-def load_single_product(product: EOProduct, bands:list[str], **kwargs) -> xr.Dataset:
+@trace.traced()
+def load_single_product(product: EOProduct, bands:list[str], mask:str=None, min_valid_fraction:float=None, **kwargs) -> xr.Dataset|None:
     '''
     Load multiple bands of a single product into an xarray Dataset.
 
@@ -57,19 +73,30 @@ def load_single_product(product: EOProduct, bands:list[str], **kwargs) -> xr.Dat
     -------
         - product: EOProduct -> product to be loaded
         - bands: list[str] -> list of bands to be loaded (provided by ``load_assets`` function)
+        - mask: str -> if given, pixels flagged in this mask asset are set to Nan in every band ('SCL' or 'CLDPRB', see ``load_valid_mask``)
+        - min_valid_fraction: float -> products with a smaller fraction of valid pixels (according to the mask) are skipped
+                                       before any band is loaded (e.g.: 0.3)
         - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
 
     Returns:
     -------
-        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands
+        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands (None if the product was skipped)
     '''
+    valid = _valid_mask_or_skip(product, mask, min_valid_fraction, **kwargs)
+    if valid is False:
+        return None
+
     loaded_data = {}
     for band in bands:
         # Load Band into an xarray Dataarray
-        data = product.get_data(band=band, **kwargs)
+        with trace.span('loading.get_data', product=trace.product_name(product), band=band) as s:
+            data = product.get_data(band=band, **kwargs)
+            s.set(shape=data)
 
         # Get rid of Dimensions of size 1 [e.g.: shapes from (1,300,500) to (300,500)]
         data = data.squeeze()
+        if valid is not None:
+            data = apply_mask(data, valid)
 
         # Get time information from the product properties
         time_str = product.properties['startTimeFromAscendingNode']
@@ -87,7 +114,9 @@ def load_single_product(product: EOProduct, bands:list[str], **kwargs) -> xr.Dat
     ds = xr.Dataset(loaded_data)
     return ds
 
-def load_multiple_timestamps(products:SearchResult, bands:list, *args, **kwargs) -> xr.Dataset:
+@trace.traced()
+def load_multiple_timestamps(products:SearchResult, bands:list, *args, mask:str=None, min_valid_fraction:float=None,
+                             duplicates:str='first', **kwargs) -> xr.Dataset:
     '''
     Load multiple bands of multiple products into an xarray Dataset. 
     Do not use different geographical areas, as merging needs to be done beforehand.
@@ -96,6 +125,10 @@ def load_multiple_timestamps(products:SearchResult, bands:list, *args, **kwargs)
     -------
         - products: list[EOProduct] -> list of products to be loaded
         - bands: list[str] -> list of bands to be loaded (provided by ``load_assets`` function)
+        - mask: str -> if given, pixels flagged in this mask asset are set to Nan in every band ('SCL' or 'CLDPRB', see ``load_valid_mask``)
+        - min_valid_fraction: float -> products with a smaller fraction of valid pixels (according to the mask) are skipped
+                                       before any band is loaded (e.g.: 0.3)
+        - duplicates: str -> rule for products of the same date, 'first' or 'last' (see ``assemble_cube``)
         - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
 
     Returns:
@@ -103,13 +136,18 @@ def load_multiple_timestamps(products:SearchResult, bands:list, *args, **kwargs)
         - ds: xarray.Dataset -> xarray Dataset containing the loaded bands from all products
     '''
     # Empty List where datasets are stored
-    single_ds = []
+    single_ds, keys = [], []
     for product in products:
         # Load each dataarray and add to single_ds List
-        single_product = load_single_product(product=product, bands=bands, *args, **kwargs)
-        single_ds.append(single_product)
-    # Merge datasets from List
-    ds = xr.merge(single_ds)
+        single_product = load_single_product(product=product, bands=bands, *args, mask=mask,
+                                             min_valid_fraction=min_valid_fraction, **kwargs)
+        if single_product is not None:
+            single_ds.append(single_product)
+            keys.append(_product_key(product))
+    # Combine the datasets into one cube, the arrays are allocated once if all grids are the same
+    with trace.span('loading.merge', n_datasets=len(single_ds)) as s:
+        ds = assemble_cube(single_ds, keys=keys, duplicates=duplicates)
+        s.set(shape=ds)
     return ds
 
 
@@ -132,12 +170,13 @@ def band_2_regex(band:str) -> tuple[str]:
         - (r10, r20, r60): list[str] -> list of regex patterns for 10m, 20m, and 60m resolution bands
     '''
     # regex = rf'^(?!.*MSK).*{band}_[0-9]*m.jp2$'
-    r10 = rf'^(?!.*MSK).*{band}_10m.jp2$'
-    r20 = rf'^(?!.*MSK).*{band}_20m.jp2$'
-    r60 = rf'^(?!.*MSK).*{band}_60m.jp2$'
+    r10 = rf'^(?!.*MSK).*{band}_10m.(jp2|tif)$'
+    r20 = rf'^(?!.*MSK).*{band}_20m.(jp2|tif)$'
+    r60 = rf'^(?!.*MSK).*{band}_60m.(jp2|tif)$'
     return r10, r20, r60
 
-def load_single_product_regex(product, bands:list[str], **kwargs) -> xr.Dataset:
+@trace.traced()
+def load_single_product_regex(product, bands:list[str], mask:str=None, min_valid_fraction:float=None, **kwargs) -> xr.Dataset|None:
     '''
     Load multiple bands of a single product into an xarray Dataset using regex patterns.
 
@@ -145,25 +184,36 @@ def load_single_product_regex(product, bands:list[str], **kwargs) -> xr.Dataset:
     -------
         - product: EOProduct -> product to be loaded
         - bands: list[str] -> list of bands to be loaded (provided by ``load_assets`` function)
+        - mask: str -> if given, pixels flagged in this mask asset are set to Nan in every band ('SCL' or 'CLDPRB', see ``load_valid_mask``)
+        - min_valid_fraction: float -> products with a smaller fraction of valid pixels (according to the mask) are skipped
+                                       before any band is loaded (e.g.: 0.3)
         - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
 
     Returns:
     -------
-        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands
+        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands (None if the product was skipped)
     '''
+    valid = _valid_mask_or_skip(product, mask, min_valid_fraction, **kwargs)
+    if valid is False:
+        return None
+
     loaded_data = {}
     for band in bands:
         regex = band_2_regex(band=band)
         # Load Band into an xarray Dataarray
-        for r in regex:
-            try:
-                data = product.get_data(band=r, **kwargs)
-                break
-            except:
-                AddressNotFound
+        with trace.span('loading.get_data', product=trace.product_name(product), band=band) as s:
+            for r in regex:
+                try:
+                    data = product.get_data(band=r, **kwargs)
+                    s.set(shape=data, regex=r)
+                    break
+                except:
+                    exceptions.AddressNotFound
         
         # Get rid of Dimensions of size 1 [e.g.: shapes from (1,300,500) to (300,500)]
         data = data.squeeze()
+        if valid is not None:
+            data = apply_mask(data, valid)
 
         # Get time information from the product properties
         time_str = product.properties['startTimeFromAscendingNode']
@@ -181,7 +231,9 @@ def load_single_product_regex(product, bands:list[str], **kwargs) -> xr.Dataset:
     ds = xr.Dataset(loaded_data)
     return ds
 
-def load_multiple_timestamps_regex(products, bands:list, **kwargs) -> xr.Dataset:
+@trace.traced()
+def load_multiple_timestamps_regex(products, bands:list, mask:str=None, min_valid_fraction:float=None,
+                                   duplicates:str='first', **kwargs) -> xr.Dataset:
     '''
     Load multiple bands of multiple products into an xarray Dataset using regex patterns.
 
@@ -189,6 +241,10 @@ def load_multiple_timestamps_regex(products, bands:list, **kwargs) -> xr.Dataset
     -------
         - products: list[EOProduct] -> list of products to be loaded
         - bands: list[str] -> list of bands to be loaded (provided by ``load_assets`` function)
+        - mask: str -> if given, pixels flagged in this mask asset are set to Nan in every band ('SCL' or 'CLDPRB', see ``load_valid_mask``)
+        - min_valid_fraction: float -> products with a smaller fraction of valid pixels (according to the mask) are skipped
+                                       before any band is loaded (e.g.: 0.3)
+        - duplicates: str -> rule for products of the same date, 'first' or 'last' (see ``assemble_cube``)
         - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
 
     Returns:
@@ -196,15 +252,21 @@ def load_multiple_timestamps_regex(products, bands:list, **kwargs) -> xr.Dataset
         - ds: xarray.Dataset -> xarray Dataset containing the loaded bands from all products
     '''
     # Empty List where datasets are stored
-    single_ds = []
+    single_ds, keys = [], []
     for product in products:
         # Load each dataarray and add to single_ds List
-        single_product = load_single_product_regex(product=product, bands=bands, **kwargs)
-        single_ds.append(single_product)
-    # Merge datasets from List
-    ds = xr.merge(single_ds)
+        single_product = load_single_product_regex(product=product, bands=bands, mask=mask,
+                                                   min_valid_fraction=min_valid_fraction, **kwargs)
+        if single_product is not None:
+            single_ds.append(single_product)
+            keys.append(_product_key(product))
+    # Combine the datasets into one cube, the arrays are allocated once if all grids are the same
+    with trace.span('loading.merge', n_datasets=len(single_ds)) as s:
+        ds = assemble_cube(single_ds, keys=keys, duplicates=duplicates)
+        s.set(shape=ds)
     return ds
 
+@trace.traced()
 def get_data_regex(product, band:str, **kwargs):
     '''
     Load a single band of a single product using regex patterns.
@@ -225,7 +287,575 @@ def get_data_regex(product, band:str, **kwargs):
             data = product.get_data(band=r, **kwargs)
             return data
         except:
-            AddressNotFound
+            exceptions.AddressNotFound
+
+##############################################
+# Mask functions
+##############################################
+
+# Scene classification (SCL) classes which are masked: no data, saturated or defective, cloud shadows,
+# cloud medium probability, cloud high probability and thin cirrus
+SCL_INVALID = (0, 1, 3, 8, 9, 10)
+
+def mask_2_regex(mask:str) -> tuple[str]:
+    '''
+    Regex patterns of a mask asset to be used in the ``get_data`` method of the EOProduct (20m first, then 60m).
+
+    Params:
+    -------
+        - mask: str -> 'SCL' (scene classification) or 'CLDPRB' (cloud probability, MSK_CLDPRB)
+
+    Returns:
+    -------
+        - (r20, r60): tuple[str] -> regex patterns for the 20m and 60m mask
+    '''
+    if mask == 'SCL':
+        return r'^(?!.*MSK).*SCL_20m.(jp2|tif)$', r'^(?!.*MSK).*SCL_60m.(jp2|tif)$'
+    if mask == 'CLDPRB':
+        return r'.*MSK_CLDPRB_20m.(jp2|tif)$', r'.*MSK_CLDPRB_60m.(jp2|tif)$'
+    raise ValueError("mask has to be 'SCL' or 'CLDPRB'.")
+
+@trace.traced()
+def load_valid_mask(product, mask:str='SCL', invalid_classes:tuple=SCL_INVALID, max_cloud_probability:int=50,
+                    **kwargs) -> xr.DataArray:
+    '''
+    Loads the mask asset of a product once and converts it into a mask of the valid pixels.
+
+    Params:
+    -------
+        - product: EOProduct -> product (L2A for 'SCL' and 'CLDPRB')
+        - mask: str -> 'SCL' (pixels of ``invalid_classes`` are invalid) or 'CLDPRB' (pixels with a cloud probability
+                       above ``max_cloud_probability`` are invalid)
+        - invalid_classes: tuple -> SCL classes which are invalid (default: ``SCL_INVALID``)
+        - max_cloud_probability: int -> highest cloud probability in percent which is still valid
+        - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
+
+    Returns:
+    -------
+        - valid: xarray.DataArray -> boolean DataArray (y, x), True for valid pixels
+    '''
+    data = None
+    for r in mask_2_regex(mask):
+        try:
+            data = product.get_data(band=r, **kwargs)
+            break
+        except Exception:
+            continue
+    if data is None:
+        raise ValueError(f'The product {trace.product_name(product)} has no {mask} asset.')
+
+    data = data.squeeze(drop=True)
+    if mask == 'SCL':
+        valid = ~data.isin(invalid_classes)
+    else:
+        valid = data <= max_cloud_probability
+    return valid.rename('valid')
+
+def apply_mask(data:xr.DataArray, valid:xr.DataArray) -> xr.DataArray:
+    '''
+    Sets the invalid pixels of a band to Nan. A mask with a different resolution (e.g.: 20m SCL for a 10m band)
+    is resampled to the pixels of the band (nearest neighbour).
+
+    Params:
+    -------
+        - data: xarray.DataArray -> band (y, x)
+        - valid: xarray.DataArray -> mask of the valid pixels (provided by ``load_valid_mask``)
+
+    Returns:
+    -------
+        - data: xarray.DataArray -> band with Nan for the invalid pixels
+    '''
+    if valid.shape != data.shape or not (np.array_equal(valid['x'], data['x']) and np.array_equal(valid['y'], data['y'])):
+        valid = valid.reindex(x=data['x'], y=data['y'], method='nearest', fill_value=False)
+    return data.where(valid.values)
+
+def _valid_mask_or_skip(product, mask:str, min_valid_fraction:float, **kwargs) -> xr.DataArray|None|bool:
+    '''
+    Loads the valid mask for the loaders: None without mask, False if the product has too few valid pixels.
+    '''
+    if mask is None:
+        return None
+    valid = load_valid_mask(product, mask=mask, **kwargs)
+    if min_valid_fraction is not None and float(valid.mean()) < min_valid_fraction:
+        return False
+    return valid
+
+
+##############################################
+# Assembly functions
+##############################################
+
+def _promoted(dtype:np.dtype) -> np.dtype:
+    '''
+    Data type which can hold Nan, promoted like xarray does it when it aligns arrays (uint16 -> float32).
+    '''
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'biu':
+        return np.dtype(np.float32) if dtype.itemsize <= 2 else np.dtype(np.float64)
+    return dtype
+
+def _same_grid(datasets:list) -> bool:
+    reference = datasets[0]
+    return all(ds.sizes.get(dim) == reference.sizes.get(dim) and np.array_equal(ds[dim].values, reference[dim].values)
+               for ds in datasets[1:] for dim in ('x', 'y'))
+
+def assemble_cube(datasets:list[xr.Dataset], keys:list=None, duplicates:str='first') -> xr.Dataset:
+    '''
+    Combines the Datasets of single products (see ``load_single_product``) into one (time, y, x) cube.
+    If all Datasets are on the same grid (products loaded with the same ``common_params``), the arrays of the cube
+    are allocated once and every product is written into its time slice. Otherwise the Datasets are aligned first
+    (outer join of x and y, as ``xr.merge`` does).
+
+    Products of the same date (e.g.: two tiles or a reprocessed product) share a time slice,
+    they are combined in the order of ``keys`` instead of raising merge conflicts:
+
+    - 'first': the values of the first product are kept, later products only fill its Nan pixels
+    - 'last': the values of later products replace the earlier ones, except where they are Nan
+
+    Params:
+    -------
+        - datasets: list[xr.Dataset] -> Datasets with a time dimension (usually of size 1)
+        - keys: list -> sort keys of the Datasets, e.g.: (sensing time, title) of the products (default: given order)
+        - duplicates: str -> 'first' or 'last'
+
+    Returns:
+    -------
+        - ds: xarray.Dataset -> cube with sorted time dimension
+    '''
+    if duplicates not in ('first', 'last'):
+        raise ValueError(f"Unknown duplicates rule '{duplicates}', use 'first' or 'last'.")
+    if len(datasets) == 0:
+        return xr.Dataset()
+    if keys is not None:
+        datasets = [ds for _, ds in sorted(zip(keys, datasets), key=lambda item: item[0])]
+    if not _same_grid(datasets):
+        datasets = list(xr.align(*datasets, join='outer', exclude=['time']))
+
+    reference = datasets[0]
+    times = sorted({t for ds in datasets for t in ds['time'].values})
+    position = {t: i for i, t in enumerate(times)}
+    shape = (len(times), reference.sizes['y'], reference.sizes['x'])
+    bands = list(dict.fromkeys(band for ds in datasets for band in ds.data_vars))
+
+    variables = {}
+    for band in bands:
+        parts = [ds[band] for ds in datasets if band in ds.data_vars]
+        dtype = np.result_type(*[part.dtype for part in parts])
+        n_slices = sum(part.sizes['time'] for part in parts)
+        # Slices without data are Nan, so the data type has to hold Nan (as after xr.merge)
+        if len(times) > 1 or n_slices != len(times):
+            dtype = _promoted(dtype)
+        cube = np.full(shape, np.nan, dtype=dtype) if dtype.kind == 'f' else np.zeros(shape, dtype=dtype)
+        filled = np.zeros(len(times), dtype=bool)
+
+        for part in parts:
+            values = part.transpose('time', 'y', 'x').values
+            for t, time in enumerate(part['time'].values):
+                i = position[time]
+                if not filled[i]:
+                    cube[i] = values[t]
+                    filled[i] = True
+                elif dtype.kind == 'f':
+                    update = np.isnan(cube[i]) & ~np.isnan(values[t]) if duplicates == 'first' else ~np.isnan(values[t])
+                    cube[i][update] = values[t][update]
+                elif duplicates == 'last':
+                    cube[i] = values[t]
+        variables[band] = xr.DataArray(cube, dims=('time', 'y', 'x'), attrs=parts[0].attrs)
+
+    coords = {name: coord for name, coord in reference.coords.items() if 'time' not in coord.dims}
+    coords['time'] = np.array(times, dtype=reference['time'].dtype)
+    return xr.Dataset(variables, coords=coords, attrs=reference.attrs)
+
+def _product_key(product) -> tuple:
+    '''
+    Sort key of a product for ``assemble_cube``: sensing time, then title.
+    '''
+    return (product.properties.get('startTimeFromAscendingNode', ''), trace.product_name(product))
+
+
+##############################################
+# Multi-resolution functions
+##############################################
+
+# Bands with classes instead of values, they are always resampled with 'nearest'
+CATEGORICAL_BANDS = ('SCL',)
+
+def get_data_native(product, band:str) -> tuple:
+    '''
+    Load a single band of a single product at its finest available native resolution, without resampling.
+    Resolutions finer than the native one (see ``NATIVE_RESOLUTION``) are not tried, a fallback to a coarser
+    resolution (e.g.: a missing 20 m file replaced by the 60 m file) is reported with a warning.
+
+    Params:
+    -------
+        - product: EOProduct -> product to be loaded
+        - band: str -> band to be loaded
+
+    Returns:
+    -------
+        - (data, resolution): xarray.DataArray of the band and the resolution of the file in meters
+    '''
+    native = NATIVE_RESOLUTION.get(band, 10)
+    for resolution, regex in zip((10, 20, 60), band_2_regex(band)):
+        if resolution < native:
+            continue
+        try:
+            with trace.span('loading.get_data', product=trace.product_name(product), band=band) as s:
+                data = product.get_data(band=regex)
+                s.set(shape=data, resolution=resolution)
+        except exceptions.AddressNotFound:
+            continue
+        if resolution > native:
+            warnings.warn(f'{band} of {trace.product_name(product)} is not available at {native} m, '
+                          f'the {resolution} m file is used.')
+        return data, resolution
+    raise exceptions.AddressNotFound(f'{band} not found in {trace.product_name(product)}')
+
+def common_grid(crs, resolution:float, extent:tuple) -> dict:
+    '''
+    Grid of the ``common_params``: the extent (in EPSG:4326) transformed into the CRS, snapped to the resolution.
+    Products loaded with the same parameters get exactly the same grid.
+
+    Params:
+    -------
+        - crs: -> CRS of the grid
+        - resolution: float -> pixel size in units of the CRS
+        - extent: tuple -> (lonmin, latmin, lonmax, latmax)
+
+    Returns:
+    -------
+        - grid: dict -> 'crs', 'transform' and 'shape' (arguments of ``rio.reproject``)
+    '''
+    from pyproj import Transformer
+    from rasterio.transform import from_origin
+
+    minx, miny, maxx, maxy = Transformer.from_crs('EPSG:4326', crs, always_xy=True).transform_bounds(*extent)
+    left, top = np.floor(minx / resolution) * resolution, np.ceil(maxy / resolution) * resolution
+    width = int(np.ceil((maxx - left) / resolution))
+    height = int(np.ceil((top - miny) / resolution))
+    return {'crs': crs, 'transform': from_origin(left, top, resolution, resolution), 'shape': (height, width)}
+
+@trace.traced()
+def load_single_product_multires(product, bands:list[str], crs=None, resolution:float=None, extent:tuple=None,
+                                 resampling:str|dict='bilinear', mask:str=None, min_valid_fraction:float=None) -> xr.Dataset|None:
+    '''
+    Load bands of different native resolutions (e.g.: 10 m and 20 m bands) of a single product onto one grid.
+    Every band is read at its finest native resolution (``get_data_native``) and resampled once,
+    with an explicit resampling method, to the target grid:
+
+    - the grid of ``common_grid(crs, resolution, extent)``, if all three are given
+    - the native grid of the finest band reprojected to ``crs`` and ``resolution`` (clipped to ``extent``), if some are given
+    - the native grid of the finest band otherwise (e.g.: 20 m bands are resampled to 10 m)
+
+    Params:
+    -------
+        - product: EOProduct -> product to be loaded
+        - bands: list[str] -> list of bands to be loaded
+        - crs, resolution, extent: -> ``common_params`` of the target grid (extent in EPSG:4326)
+        - resampling: str|dict -> rasterio resampling method ('nearest', 'bilinear', 'cubic', 'average', ...),
+                                  for all bands or per band ({'B11': 'cubic', ...}), classes (SCL) always use 'nearest'
+        - mask, min_valid_fraction: -> see ``load_single_product``
+
+    Returns:
+    -------
+        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands (None if the product was skipped)
+    '''
+    import rioxarray  # registers the .rio accessor
+    from rasterio.enums import Resampling
+
+    grid_params = {key: value for key, value in (('crs', crs), ('resolution', resolution), ('extent', extent)) if value is not None}
+    valid = _valid_mask_or_skip(product, mask, min_valid_fraction, **grid_params)
+    if valid is False:
+        return None
+
+    # The finest bands are read first, they define the grid, if it is not given
+    order = sorted(bands, key=lambda band: NATIVE_RESOLUTION.get(band, 10))
+    grid = common_grid(crs, resolution, extent) if len(grid_params) == 3 else None
+    reference = None
+
+    loaded_data = {}
+    for band in order:
+        data, _ = get_data_native(product, band)
+        data = data.squeeze()
+        method = 'nearest' if band in CATEGORICAL_BANDS else resampling.get(band, 'bilinear') if isinstance(resampling, dict) else resampling
+        method = Resampling[method]
+
+        with trace.span('loading.resample', product=trace.product_name(product), band=band) as s:
+            if extent is not None and grid is None:
+                data = data.rio.clip_box(*extent, crs='EPSG:4326')
+            if grid is not None:
+                data = data.rio.reproject(grid['crs'], shape=grid['shape'], transform=grid['transform'], resampling=method)
+            elif reference is not None:
+                data = data.rio.reproject_match(reference, resampling=method)
+            elif crs is not None or resolution is not None:
+                data = data.rio.reproject(crs or data.rio.crs, resolution=resolution, resampling=method)
+            s.set(shape=data)
+        if reference is None:
+            reference = data
+
+        if valid is not None:
+            data = apply_mask(data, valid)
+
+        # Get time information from the product properties
+        time_str = product.properties['startTimeFromAscendingNode']
+        date = dt.datetime.strptime(time_str,'%Y-%m-%dT%H:%M:%S.%f%z')
+        data = data.expand_dims(dim={'time':[date.date()]})
+        data.name = band
+        loaded_data[band] = data
+    # Keep the order of the requested bands
+    ds = xr.Dataset({band: loaded_data[band] for band in bands})
+    return ds
+
+@trace.traced()
+def load_multiple_timestamps_multires(products, bands:list, crs=None, resolution:float=None, extent:tuple=None,
+                                      resampling:str|dict='bilinear', mask:str=None, min_valid_fraction:float=None,
+                                      duplicates:str='first') -> xr.Dataset:
+    '''
+    Load bands of different native resolutions of multiple products onto one grid (see ``load_single_product_multires``).
+    Give ``crs``, ``resolution`` and ``extent``, if the products are not on the same native grid (e.g.: different tiles).
+
+    Params:
+    -------
+        - products: list[EOProduct] -> list of products to be loaded
+        - bands: list[str] -> list of bands to be loaded
+        - crs, resolution, extent: -> ``common_params`` of the target grid (extent in EPSG:4326)
+        - resampling: str|dict -> resampling method for all bands or per band
+        - mask, min_valid_fraction, duplicates: -> see ``load_multiple_timestamps``
+
+    Returns:
+    -------
+        - ds: xarray.Dataset -> xarray Dataset containing the loaded bands from all products
+    '''
+    single_ds, keys = [], []
+    for product in products:
+        single_product = load_single_product_multires(product, bands, crs=crs, resolution=resolution, extent=extent,
+                                                      resampling=resampling, mask=mask, min_valid_fraction=min_valid_fraction)
+        if single_product is not None:
+            single_ds.append(single_product)
+            keys.append(_product_key(product))
+    with trace.span('loading.merge', n_datasets=len(single_ds)) as s:
+        ds = assemble_cube(single_ds, keys=keys, duplicates=duplicates)
+        s.set(shape=ds)
+    return ds
+
+
+##############################################
+# Mosaic functions
+##############################################
+
+def acquisition_key(product, group_by:str='orbit') -> tuple:
+    '''
+    Key of the acquisition a product belongs to. Tiles of the same acquisition share the key and are mosaicked together.
+
+    Params:
+    -------
+        - product: EOProduct -> product
+        - group_by: str -> 'date' (sensing date), 'orbit' (sensing date and relative orbit) or None (all products together)
+
+    Returns:
+    -------
+        - key: tuple -> (date,) or (date, relative orbit), () if group_by is None
+    '''
+    if group_by is None:
+        return ()
+    time_str = product.properties['startTimeFromAscendingNode']
+    date = dt.datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S.%f%z').date()
+    if group_by == 'date':
+        return (date,)
+    if group_by == 'orbit':
+        orbit = product.properties.get('relativeOrbitNumber') or product.properties['title'].split('_')[4].lstrip('R')
+        return (date, int(orbit))
+    raise ValueError("group_by has to be 'date', 'orbit' or None.")
+
+def _north_up(data):
+    '''
+    DataArray of a single band (2D) with descending y coordinates and the nodata value replaced by Nan.
+    '''
+    data = data.squeeze(drop=True)
+    if data.ndim != 2:
+        raise ValueError(f'Only single band arrays can be mosaicked, got dims {data.dims}.')
+    nodata = data.rio.nodata
+    data = data.astype(np.float32)
+    if nodata is not None and not np.isnan(nodata):
+        data = data.where(data != nodata)
+    if data['y'].values[0] < data['y'].values[-1]:
+        data = data.isel(y=slice(None, None, -1))
+    return data
+
+def _mosaic_band(product, band:str, **kwargs):
+    '''
+    Single band of a product for the mosaic (see ``_north_up``), raises an error if no file of the band is found.
+    '''
+    data = get_data_regex(product, band, **kwargs)
+    if data is None:
+        raise ValueError(f'Band {band} of {trace.product_name(product)} could not be loaded, '
+                         f'no file matches {band_2_regex(band)}.')
+    return _north_up(data)
+
+def _sensing_time(product) -> dt.datetime:
+    '''
+    Sensing start of a product (UTC, without time zone, so it can be stored as datetime64).
+    '''
+    time_str = product.properties['startTimeFromAscendingNode']
+    return dt.datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S.%f%z').replace(tzinfo=None)
+
+def mosaic_grid(arrays:list, resolution:float=None) -> dict:
+    '''
+    Computes the grid which covers all arrays. The grid is aligned with the pixels of the first array and
+    uses its CRS, the bounds of arrays in another CRS (e.g.: tiles of a neighbouring UTM zone) are transformed into it.
+
+    Params:
+    -------
+        - arrays: list[xr.DataArray] -> 2D DataArrays with CRS (rioxarray)
+        - resolution: float -> pixel size of the grid (default: resolution of the first array)
+
+    Returns:
+    -------
+        - grid: dict -> 'crs', 'resolution', 'x' and 'y' (pixel centers, y descending)
+    '''
+    from rasterio.warp import transform_bounds
+
+    reference = arrays[0]
+    crs = reference.rio.crs
+    res = abs(resolution if resolution is not None else reference.rio.resolution()[0])
+    origin_x, _, _, origin_y = reference.rio.bounds()
+
+    bounds = np.array([a.rio.bounds() if a.rio.crs == crs else transform_bounds(a.rio.crs, crs, *a.rio.bounds(), densify_pts=21)
+                       for a in arrays])
+    left, bottom = bounds[:, 0].min(), bounds[:, 1].min()
+    right, top = bounds[:, 2].max(), bounds[:, 3].max()
+
+    # Snap the union bounds to the pixel edges of the reference array
+    left = origin_x + np.floor(round((left - origin_x) / res, 6)) * res
+    top = origin_y + np.ceil(round((top - origin_y) / res, 6)) * res
+    n_x = int(np.ceil(round((right - left) / res, 6)))
+    n_y = int(np.ceil(round((top - bottom) / res, 6)))
+    return {'crs': crs, 'resolution': res,
+            'x': left + (np.arange(n_x) + 0.5) * res, 'y': top - (np.arange(n_y) + 0.5) * res}
+
+def _grid_window(data, grid:dict) -> tuple:
+    '''
+    Window (row, col, values) of the grid covered by an array. Arrays which are not aligned with the pixels of the grid
+    (other CRS, resolution or origin) are reprojected onto the grid transform and shape of their window.
+    '''
+    from rasterio.warp import transform_bounds
+    from rasterio.transform import from_origin
+
+    res = grid['resolution']
+    col = (data['x'].values[0] - grid['x'][0]) / res
+    row = (grid['y'][0] - data['y'].values[0]) / res
+    aligned = (data.rio.crs == grid['crs'] and np.isclose(abs(data.rio.resolution()[0]), res)
+               and np.isclose(col, round(col), atol=1e-3) and np.isclose(row, round(row), atol=1e-3))
+    if aligned:
+        return int(round(row)), int(round(col)), data.values
+
+    # Only the window of the grid covered by the array is reprojected
+    left, bottom, right, top = transform_bounds(data.rio.crs, grid['crs'], *data.rio.bounds(), densify_pts=21)
+    west, north = grid['x'][0] - res / 2, grid['y'][0] + res / 2
+    col_0 = max(0, int(np.floor(round((left - west) / res, 6))))
+    col_1 = min(len(grid['x']), int(np.ceil(round((right - west) / res, 6))))
+    row_0 = max(0, int(np.floor(round((north - top) / res, 6))))
+    row_1 = min(len(grid['y']), int(np.ceil(round((north - bottom) / res, 6))))
+    if col_1 <= col_0 or row_1 <= row_0:
+        return 0, 0, np.empty((0, 0), dtype=np.float32)
+
+    transform = from_origin(west + col_0 * res, north - row_0 * res, res, res)
+    data = data.rio.write_nodata(np.nan, encoded=False).rio.reproject(grid['crs'], shape=(row_1 - row_0, col_1 - col_0),
+                                                                       transform=transform, nodata=np.nan)
+    return row_0, col_0, data.values
+
+def _paste(target:np.ndarray, data, grid:dict, method:str) -> None:
+    '''
+    Writes an array into the overlapping window of the target array with the given rule.
+    Only the window covered by the array is read and written.
+    '''
+    row, col, values = _grid_window(data, grid)
+
+    # Crop the parts of the array which are outside of the grid
+    col_0, row_0 = max(0, -col), max(0, -row)
+    col_1 = min(values.shape[1], target.shape[1] - col)
+    row_1 = min(values.shape[0], target.shape[0] - row)
+    if col_1 <= col_0 or row_1 <= row_0:
+        return
+    values = values[row_0:row_1, col_0:col_1]
+    window = target[row + row_0:row + row_1, col + col_0:col + col_1]
+
+    valid = ~np.isnan(values)
+    if method in ('first', 'best'):
+        valid &= np.isnan(window)
+    elif method == 'min':
+        valid &= ~(window <= values)
+    elif method == 'max':
+        valid &= ~(window >= values)
+    window[valid] = values[valid]
+
+@trace.traced()
+def mosaic_products(products:SearchResult|list, bands:list[str], method:str='first', group_by:str='orbit',
+                    resolution:float=None, quality=None, **kwargs) -> xr.Dataset:
+    '''
+    Mosaics the tiles of every acquisition into one image per band and stacks the acquisitions along time.
+    The grid of an acquisition is computed once for all bands and every band of every tile is only written
+    into the window it covers, so no band is merged over the full arrays repeatedly.
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products (tiles) to be mosaicked
+        - bands: list[str] -> bands to be loaded (e.g.: ['B04', 'B08'])
+        - method: str -> rule for overlapping pixels:
+                         'first' / 'last': value of the first / last product in the list,
+                         'min' / 'max': smallest / largest value,
+                         'best': value of the product with the best ``quality``
+        - group_by: str -> 'orbit' (same date and relative orbit), 'date' or None (all products in one mosaic)
+        - resolution: float -> pixel size of the mosaic (default: resolution of the first tile of the first band)
+        - quality: callable -> score of a product for method 'best', higher is better (default: lowest cloud cover)
+        - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
+
+    Returns:
+    -------
+        - ds: xarray.Dataset -> Dataset with dims (time, y, x), one time step per acquisition (float32, Nan where no tile is),
+                                time is the sensing start of the earliest product of the acquisition
+    '''
+    import rioxarray  # registers the .rio accessor
+
+    if method not in ('first', 'last', 'min', 'max', 'best'):
+        raise ValueError("method has to be one of 'first', 'last', 'min', 'max' or 'best'.")
+    if method == 'best':
+        quality = quality or (lambda product: -float(product.properties.get('cloudCover') or 0))
+
+    groups = {}
+    for product in products:
+        groups.setdefault(acquisition_key(product, group_by), []).append(product)
+
+    mosaics = []
+    for key, group in sorted(groups.items(), key=lambda item: item[0]):
+        if method == 'best':
+            group = sorted(group, key=quality, reverse=True)
+
+        # The first band of every tile defines the grid, the other bands are pasted into the same grid
+        first = [_mosaic_band(product, bands[0], **kwargs) for product in group]
+        grid = mosaic_grid(first, resolution=resolution)
+        shape = (len(grid['y']), len(grid['x']))
+
+        layers = {}
+        for band in bands:
+            with trace.span('loading.mosaic_band', band=band, n_products=len(group), shape=shape):
+                target = np.full(shape, np.nan, dtype=np.float32)
+                for i, product in enumerate(group):
+                    data = first[i] if band == bands[0] else _mosaic_band(product, band, **kwargs)
+                    _paste(target, data, grid, method)
+                layers[band] = target
+        first = None
+
+        # Acquisitions of the same date (e.g.: two relative orbits) are told apart by their sensing time
+        time = np.datetime64(min(_sensing_time(product) for product in group), 'ns')
+        mosaics.append(xr.Dataset({band: (('y', 'x'), layer) for band, layer in layers.items()},
+                                  coords={'x': grid['x'], 'y': grid['y']})
+                         .expand_dims(dim={'time': [time]})
+                         .rio.write_crs(grid['crs']))
+
+    ds = xr.concat(mosaics, dim='time').sortby('time') if len(mosaics) > 1 else mosaics[0]
+    ds.attrs['mosaic_method'] = method
+    return ds
 
 ##############################################
 # Reverse Search functions
@@ -271,6 +901,7 @@ def extract_infos_from_filename(file:Path|str) -> dict:
     data['tile'] = id.split('_')[5].lstrip('T')
     return data
 
+@trace.traced()
 def search_for_file(file:Path|str, provider:str='cop_dataspace') -> EOProduct|None:
     '''
     Searches for a file in the EODAG database based on the filename.
@@ -284,7 +915,7 @@ def search_for_file(file:Path|str, provider:str='cop_dataspace') -> EOProduct|No
     -------
         - found_product (EOProduct): EOProduct object found in the database
     '''
-    dag = EODataAccessGateway()
+    dag = eodag.EODataAccessGateway()
 
     if type(file) != str:
         id = file.name
@@ -327,9 +958,133 @@ def directory_to_search_results(directory:list[Path]|list[str], provider:str='co
     -------
         - results (SearchResult): SearchResult object with all found files
     '''
-    results = SearchResult([])
+    results = eodag.SearchResult([])
     for file in directory:
         result = search_for_file(file=file, provider=provider)
         if result:
             results.append(result)
-    return results
\ No newline at end of file
+    return results
+##############################################
+# Local product functions
+##############################################
+
+class LocalProduct:
+    '''
+    Product in SAFE format in a local directory (e.g.: in the datapool), which can be used instead of an ``EOProduct``
+    by the functions of this module without a search: it has the ``properties`` used by eotools and a ``get_data``
+    method which reads a band (by name or regex) and applies the ``common_params`` like eodag-cube.
+
+    Params:
+    -------
+        - safe_dir: str|Path -> directory of a product in SAFE format (``<title>.SAFE``)
+    '''
+
+    def __init__(self, safe_dir:str|Path):
+        self.safe_dir = Path(safe_dir)
+        self.location = self.safe_dir.resolve().as_uri()
+        title = self.safe_dir.name.removesuffix('.SAFE')
+        parts = title.split('_')
+        sensing = dt.datetime.strptime(parts[2], '%Y%m%dT%H%M%S')
+        self.properties = {'id': title,
+                           'title': title,
+                           'productType': extract_infos_from_filename(title)['product_type'],
+                           'tileIdentifier': parts[5].lstrip('T'),
+                           'startTimeFromAscendingNode': sensing.strftime('%Y-%m-%dT%H:%M:%S.%f') + 'Z',
+                           'cloudCover': self._cloud_cover()}
+        self._files = sorted(p for p in (self.safe_dir / 'GRANULE').rglob('*') if p.suffix in ('.jp2', '.tif'))
+
+    def __repr__(self) -> str:
+        return f'LocalProduct({self.properties["title"]})'
+
+    def _cloud_cover(self) -> float|None:
+        '''
+        Cloud cover in percent from the product metadata (MTD_MSIL2A.xml or MTD_MSIL1C.xml), None without metadata.
+        '''
+        import xml.etree.ElementTree as ET
+
+        for metadata in self.safe_dir.glob('MTD_MSIL*.xml'):
+            for _, element in ET.iterparse(metadata):
+                if element.tag.endswith('Cloud_Coverage_Assessment'):
+                    return float(element.text)
+        return None
+
+    @property
+    def geometry(self):
+        '''
+        Footprint of the product in EPSG:4326 (shapely Polygon), like ``EOProduct.geometry``.
+        '''
+        import rasterio
+        from shapely.geometry import box
+        from rasterio.warp import transform_bounds
+
+        with rasterio.open(self._files[0]) as src:
+            return box(*transform_bounds(src.crs, 'EPSG:4326', *src.bounds))
+
+    def _find(self, band:str) -> Path:
+        if band.isalnum():
+            # Band name (e.g.: 'B04'), the finest resolution first (L1C files have no resolution in their name)
+            matches = [p for p in self._files if p.stem.startswith('T') and p.stem.split('_')[2] == band]
+            matches.sort(key=lambda p: int(p.stem.split('_')[3].rstrip('m')) if p.stem.count('_') > 2 else 0)
+        else:
+            matches = [p for p in self._files if re.search(band, p.name)]
+        if len(matches) == 0:
+            raise exceptions.AddressNotFound(f'{band} not found in {self.safe_dir.name}')
+        return matches[0]
+
+    def get_data(self, band:str, crs=None, resolution:float=None, extent:tuple=None, resampling:str=None, **kwargs):
+        '''
+        Reads a band of the product. A band name (e.g.: 'B04') returns the band at the finest resolution,
+        any other string is used as regex on the filenames (e.g.: the patterns of ``band_2_regex``).
+        With all three ``common_params`` the band is resampled to ``common_grid(crs, resolution, extent)``,
+        so every product gets the same grid, otherwise the given ones are applied (clipped, then reprojected).
+
+        Params:
+        -------
+            - band: str -> band name or regex
+            - crs, resolution, extent: -> ``common_params`` (extent as (lonmin, latmin, lonmax, latmax) in EPSG:4326)
+            - resampling: str -> rasterio resampling method (default: 'nearest')
+            - **kwargs: dict -> additional arguments to be passed to ``rioxarray.open_rasterio``
+
+        Returns:
+        -------
+            - data: xr.DataArray -> (band, y, x) DataArray
+        '''
+        import rioxarray  # registers the .rio accessor
+        from rasterio.enums import Resampling
+        from rioxarray.exceptions import NoDataInBounds
+
+        data = rioxarray.open_rasterio(self._find(band), cache=False, **kwargs)
+        method = Resampling[resampling or 'nearest']
+        if crs is not None and resolution is not None and extent is not None:
+            grid = common_grid(crs, resolution, extent)
+            (height, width), transform = grid['shape'], grid['transform']
+            # Only the part of the file under the grid (and a margin of one pixel) is read
+            bounds = (transform.c - resolution, transform.f - (height + 1) * resolution,
+                      transform.c + (width + 1) * resolution, transform.f + resolution)
+            try:
+                data = data.rio.clip_box(*bounds, crs=crs)
+            except NoDataInBounds:
+                # The grid is outside of the product, the reprojection fills it with nodata
+                pass
+            return data.rio.reproject(grid['crs'], shape=grid['shape'], transform=grid['transform'], resampling=method)
+
+        if extent is not None:
+            data = data.rio.clip_box(*extent, crs='EPSG:4326')
+        if crs is not None or resolution is not None:
+            data = data.rio.reproject(crs or data.rio.crs, resolution=resolution, resampling=method)
+        return data
+
+def local_products(directory:str|Path) -> list[LocalProduct]:
+    '''
+    Creates a ``LocalProduct`` for every SAFE directory in a directory (e.g.: the datapool), sorted by sensing time.
+
+    Params:
+    -------
+        - directory: str|Path -> directory containing ``<title>.SAFE`` directories
+
+    Returns:
+    -------
+        - products: list[LocalProduct]
+    '''
+    products = [LocalProduct(p) for p in Path(directory).glob('*.SAFE') if p.is_dir()]
+    return sorted(products, key=lambda p: p.properties['startTimeFromAscendingNode'])
@@ -0,0 +1,461 @@
+#Description
+'''
+This script runs a processing chain headlessly (e.g.: as batch job on a server), described by a YAML file
+which is read like ``paths.yml`` (see ``shortcut.read_paths``). The stages are run in this order,
+stages which are missing in the file are skipped:
+
+    - search: searches the products with eodag (serialized into the workdir) or reads the SAFE directories of a directory
+              (see ``loading.local_products``)
+    - download: downloads the products into the datapool (see ``download.download_all``)
+    - load: loads the bands of every partition (per tile, per date or per tile and date) into a Zarr cube
+    - contrast: clips the values of every cube (see ``contrast.auto_clip_dataset``)
+    - classify: classifies every cube with a fitted model stored with joblib (see ``geometry.predict_image``) into a GeoTIFF
+
+The partitions of a stage are processed by a pool of worker processes. Every finished stage of a partition is
+recorded with its output in ``<workdir>/checkpoints.json``, outputs are written to a temporary path first and renamed
+when they are complete. If the pipeline is started again (e.g.: after a crash), the recorded stages are skipped,
+unless their parameters, their products or the stages before them have changed.
+
+Usage:
+    python -m eotools.pipeline pipeline.yml [--workers 4] [--restart] [--trace trace.json]
+
+Example of a pipeline.yml (relative paths are relative to the YAML file):
+    workdir: output
+    paths: paths.yml            # 'download' is the datapool
+    workers: 4
+    search:
+      productType: S2_MSI_L2A
+      geom: {lonmin: 14.0, latmin: 50.0, lonmax: 14.5, latmax: 50.3}
+      start: '2024-05-01'
+      end: '2024-06-01'
+      cloudCover: 30
+    download:
+      max_workers: 4
+    load:
+      bands: [B02, B03, B04, B08]
+      partition: tile           # tile, date or tile-date
+      mask: SCL
+      min_valid_fraction: 0.2
+      common_params: {resolution: 20}
+    contrast:
+      percentile: 0.02
+    classify:
+      model: model.joblib
+      block_size: 512
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+STAGES = ('search', 'download', 'load', 'contrast', 'classify')
+
+# Stages which are run per partition by the worker processes
+PARTITIONED_STAGES = ('load', 'contrast', 'classify')
+
+PARTITIONS = ('tile', 'date', 'tile-date')
+
+CHECKPOINTS_FILE = 'checkpoints.json'
+
+SEARCH_FILE = 'search.geojson'
+
+
+
+#Modules:
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from eotools import trace
+from eotools import cube
+from eotools import loading
+from eotools import shortcut
+
+
+##############################################
+# Configuration functions
+##############################################
+
+def read_config(filepath:str|Path) -> dict:
+    '''
+    Reads the YAML file of a pipeline. Relative paths are resolved relative to the YAML file
+    and the paths of ``paths`` are read with ``shortcut.read_paths``.
+
+    Params:
+    -------
+        - filepath: str|Path -> filepath of the pipeline YAML file
+
+    Returns:
+    -------
+        - config: dict -> configuration of the pipeline
+    '''
+    filepath = Path(filepath).resolve()
+    config = shortcut.read_paths(filepath) or {}
+    unknown = set(config) - set(STAGES) - {'workdir', 'paths', 'workers'}
+    if unknown:
+        raise ValueError(f'Unknown keys {sorted(unknown)} in {filepath}, use any of {STAGES} or workdir, paths, workers.')
+
+    def resolve(path):
+        return str((filepath.parent / Path(path).expanduser()).resolve())
+
+    config['workdir'] = resolve(config.get('workdir', filepath.stem))
+    config['paths'] = shortcut.read_paths(resolve(config['paths'])) if 'paths' in config else {}
+    if 'download' in config['paths']:
+        config['paths']['download'] = resolve(config['paths']['download'])
+    if 'directory' in (config.get('search') or {}):
+        config['search']['directory'] = resolve(config['search']['directory'])
+    if 'model' in (config.get('classify') or {}):
+        config['classify']['model'] = resolve(config['classify']['model'])
+
+    if 'download' in config and 'download' not in config['paths']:
+        raise ValueError('The download stage needs the datapool as "download" in the paths file.')
+    if 'load' in config and (config['load'] or {}).get('partition', 'tile') not in PARTITIONS:
+        raise ValueError(f'Unknown partition {config["load"]["partition"]}, use any of {PARTITIONS}.')
+    return config
+
+def stage_hash(config:dict, stage:str, titles:list=(), previous:str='') -> str:
+    '''
+    Short hash of the parameters of a stage, its products and the hash of the stage before it,
+    so a checkpoint is only valid as long as nothing it depends on has changed.
+    '''
+    content = json.dumps([config.get(stage), sorted(titles), previous], sort_keys=True, default=str)
+    return hashlib.md5(content.encode()).hexdigest()[:12]
+
+
+##############################################
+# Checkpoint functions
+##############################################
+
+class Checkpoints:
+    '''
+    Record of the finished stages of a pipeline, stored as json in the workdir after every change
+    (written to a temporary file and renamed, so a crash never leaves a broken file).
+
+    Params:
+    -------
+        - workdir: str|Path -> directory of the pipeline outputs
+        - restart: bool -> if True, existing checkpoints are discarded
+    '''
+
+    def __init__(self, workdir:str|Path, restart:bool=False):
+        self.path = Path(workdir) / CHECKPOINTS_FILE
+        self.records = {}
+        if self.path.exists() and not restart:
+            with open(self.path) as f:
+                self.records = json.load(f)
+
+    def __repr__(self) -> str:
+        return f'Checkpoints({len(self.records)} finished stages, {self.path})'
+
+    @staticmethod
+    def name(stage:str, key:str=None) -> str:
+        return stage if key is None else f'{stage}/{key}'
+
+    def done(self, stage:str, key:str=None, digest:str=None) -> bool:
+        '''
+        True if the stage (of the partition ``key``) has been finished with the same hash and its output still exists.
+        '''
+        record = self.records.get(self.name(stage, key))
+        if record is None or record['hash'] != digest:
+            return False
+        return record.get('output') is None or Path(record['output']).exists()
+
+    def output(self, stage:str, key:str=None) -> str|None:
+        record = self.records.get(self.name(stage, key))
+        return None if record is None else record.get('output')
+
+    def record(self, stage:str, key:str=None, digest:str=None, output:str|Path=None, **info) -> None:
+        self.records[self.name(stage, key)] = dict(hash=digest, output=None if output is None else str(output),
+                                                   finished=time.strftime('%Y-%m-%dT%H:%M:%S'), **info)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.records, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _replace(tmp:Path, output:Path) -> Path:
+    '''
+    Moves a completely written output (file or Zarr directory) to its final path.
+    '''
+    if output.is_dir():
+        shutil.rmtree(output)
+    elif output.exists():
+        output.unlink()
+    os.replace(tmp, output)
+    return output
+
+def _temporary(output:Path) -> Path:
+    '''
+    Temporary path of an output, the leftovers of an interrupted run are removed.
+    '''
+    tmp = output.with_name(f'.{output.name}.tmp')
+    if tmp.is_dir():
+        shutil.rmtree(tmp)
+    elif tmp.exists():
+        tmp.unlink()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    return tmp
+
+
+##############################################
+# Product functions
+##############################################
+
+def search_products(config:dict, workdir:Path) -> list:
+    '''
+    Runs the search stage: the products of a local directory or an eodag search, which is serialized into the workdir.
+    '''
+    params = dict(config['search'] or {})
+    if 'directory' in params:
+        return loading.local_products(params['directory'])
+
+    from eodag import EODataAccessGateway, SearchResult
+    dag = EODataAccessGateway()
+    products = SearchResult(list(shortcut.search_all(dag, **params)))
+    dag.serialize(products, filename=str(workdir / SEARCH_FILE))
+    return products
+
+def restore_products(config:dict, workdir:Path, titles:list=None) -> list:
+    '''
+    Recreates the products of a previous search stage (e.g.: in a worker process), optionally only the given titles.
+    Products of an eodag search are located in the datapool, products without a complete local copy are dropped.
+    '''
+    params = config['search'] or {}
+    if 'directory' in params:
+        products = loading.local_products(params['directory'])
+    else:
+        from eodag import EODataAccessGateway
+        products = EODataAccessGateway().deserialize_and_register(str(workdir / SEARCH_FILE))
+
+    if titles is not None:
+        titles = set(titles)
+        products = [p for p in products if p.properties['title'] in titles]
+    if 'download' in config['paths'] and 'directory' not in params:
+        from eotools import download
+        located = []
+        for product in products:
+            safe_dir = download.find_local_product(product, config['paths']['download'])
+            if safe_dir is None:
+                print(f'{product.properties["title"]} is not in the datapool, it is skipped.')
+                continue
+            product.location = safe_dir.as_uri()
+            located.append(product)
+        products = located
+    return list(products)
+
+def partition_products(products:list, partition:str='tile') -> dict:
+    '''
+    Splits the products into the partitions of the pipeline, which are processed independently.
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products of the search stage
+        - partition: str -> 'tile' (key: 'T33UWP'), 'date' (key: '20240501') or 'tile-date' (key: 'T33UWP_20240501')
+
+    Returns:
+    -------
+        - partitions: dict -> titles of the products per partition key (sorted by key)
+    '''
+    table = shortcut.products_table(products)
+    tiles = 'T' + table['tile'].astype(str)
+    dates = table['sensing'].dt.strftime('%Y%m%d')
+    keys = tiles if partition == 'tile' else dates if partition == 'date' else tiles + '_' + dates
+    partitions = {}
+    for key, title in zip(keys, table['title']):
+        partitions.setdefault(key, []).append(title)
+    return dict(sorted(partitions.items()))
+
+
+##############################################
+# Stage functions
+##############################################
+
+def _load(config:dict, workdir:Path, titles:list, source:str|None, output:Path) -> Path:
+    params = dict(config['load'])
+    products = restore_products(config, workdir, titles)
+    if not products:
+        raise RuntimeError('None of the products of the partition is available.')
+    tmp = _temporary(output)
+    cube.load_cube(products, params['bands'], tmp, regex=params.get('regex', True), mask=params.get('mask'),
+                   min_valid_fraction=params.get('min_valid_fraction'), access=params.get('access', 'balanced'),
+                   **(params.get('common_params') or {}))
+    return _replace(tmp, output)
+
+def _contrast(config:dict, workdir:Path, titles:list, source:str|None, output:Path) -> Path:
+    from eotools import contrast
+    params = config['contrast'] or {}
+    ds = cube.open_cube(source).load()
+    clipped = contrast.auto_clip_dataset(ds, percentile=params.get('percentile', 0.02), pooled=params.get('pooled', True))
+    metadata = cube.cube_metadata(ds)
+    tmp = _temporary(output)
+    cube.save_cube(clipped, tmp, products=metadata['products'], load_params=metadata['load_params'])
+    return _replace(tmp, output)
+
+def _classify(config:dict, workdir:Path, titles:list, source:str|None, output:Path) -> Path:
+    import joblib
+    import rioxarray  # registers the .rio accessor
+    from eotools import geometry
+    params = config['classify']
+    model = joblib.load(params['model'])
+    ds = cube.open_cube(source)
+    if params.get('bands'):
+        ds = ds[params['bands']]
+    prediction = geometry.predict_image(model, ds.load(), block_size=params.get('block_size', 512))
+    if ds.rio.crs is not None:
+        prediction = prediction.rio.write_crs(ds.rio.crs)
+    tmp = _temporary(output)
+    prediction.astype('float32').rio.to_raster(tmp, driver='GTiff', compress='deflate')
+    return _replace(tmp, output)
+
+_STAGE_FUNCTIONS = {'load': (_load, '.zarr'), 'contrast': (_contrast, '.zarr'), 'classify': (_classify, '.tif')}
+
+def run_stage(config:dict, stage:str, key:str, titles:list, source:str|None) -> dict:
+    '''
+    Runs one partitioned stage of one partition (in a worker process) and returns its output and duration.
+    '''
+    function, suffix = _STAGE_FUNCTIONS[stage]
+    workdir = Path(config['workdir'])
+    start = time.perf_counter()
+    with trace.span(f'pipeline.{stage}', product=key):
+        output = function(config, workdir, titles, source, workdir / stage / f'{key}{suffix}')
+    return {'output': str(output), 'seconds': round(time.perf_counter() - start, 3)}
+
+
+##############################################
+# Pipeline functions
+##############################################
+
+@trace.traced()
+def run_pipeline(config:dict, workers:int=None, restart:bool=False, log:bool=True) -> Checkpoints:
+    '''
+    Runs all stages of a pipeline, stages which have been finished before (see ``Checkpoints``) are skipped.
+
+    Params:
+    -------
+        - config: dict -> configuration of the pipeline (see ``read_config``)
+        - workers: int -> number of worker processes for the partitioned stages (default: ``config['workers']`` or 1)
+        - restart: bool -> if True, all stages are run again
+        - log: bool -> if True, the progress is printed
+
+    Returns:
+    -------
+        - checkpoints: Checkpoints -> finished stages with their outputs
+    '''
+    workdir = Path(config['workdir'])
+    workdir.mkdir(parents=True, exist_ok=True)
+    checkpoints = Checkpoints(workdir, restart=restart)
+    workers = workers or config.get('workers') or 1
+
+    def report(message):
+        if log:
+            print(f'[{time.strftime("%H:%M:%S")}] {message}', flush=True)
+
+    if 'search' not in config:
+        raise ValueError('The pipeline needs a search stage to know the products.')
+    digest = stage_hash(config, 'search')
+    if checkpoints.done('search', digest=digest):
+        products = restore_products(dict(config, paths={}), workdir)
+        report(f'search: {len(products)} products (checkpoint)')
+    else:
+        products = search_products(config, workdir)
+        checkpoints.record('search', digest=digest, n_products=len(products))
+        report(f'search: {len(products)} products')
+    titles = [p.properties['title'] for p in products]
+
+    if 'download' in config:
+        digest = stage_hash(config, 'download', titles, previous=digest)
+        if checkpoints.done('download', digest=digest):
+            report('download: finished (checkpoint)')
+        else:
+            from eotools import download
+            params = config['download'] or {}
+            paths = download.download_all(products, config['paths']['download'], max_workers=params.get('max_workers', 4),
+                                          verify_checksums=params.get('verify_checksums', True), log=log)
+            n_failed = sum(path is None for path in paths)
+            if n_failed:
+                raise RuntimeError(f'{n_failed} downloads failed, run the pipeline again to retry them.')
+            checkpoints.record('download', digest=digest, output=config['paths']['download'])
+            report(f'download: {len(paths)} products')
+
+    if 'load' not in config:
+        return checkpoints
+    partitions = partition_products(products, (config['load'] or {}).get('partition', 'tile'))
+    digests = {key: digest for key in partitions}
+    context = multiprocessing.get_context()
+    previous_stage = None
+    # Partitions with a new output in this run, their following stages are run again as well
+    rerun = set()
+    for stage in (s for s in PARTITIONED_STAGES if s in config):
+        tasks = []
+        for key, partition_titles in partitions.items():
+            digests[key] = stage_hash(config, stage, partition_titles, previous=digests[key])
+            if key in rerun or not checkpoints.done(stage, key, digests[key]):
+                source = checkpoints.output(previous_stage, key) if stage != 'load' else None
+                tasks.append((key, partition_titles, source))
+        report(f'{stage}: {len(tasks)} of {len(partitions)} partitions to process')
+
+        failed = []
+        def finished(key, result=None, error=None):
+            if error is not None:
+                failed.append(key)
+                report(f'{stage} {key} failed: {error!r}')
+            else:
+                checkpoints.record(stage, key, digests[key], **result)
+                rerun.add(key)
+                report(f'{stage} {key}: {result["output"]} ({result["seconds"]:.1f} s)')
+
+        if workers == 1 or len(tasks) <= 1:
+            for key, partition_titles, source in tasks:
+                try:
+                    finished(key, run_stage(config, stage, key, partition_titles, source))
+                except Exception as e:
+                    finished(key, error=e)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as executor:
+                futures = {executor.submit(run_stage, config, stage, key, partition_titles, source): key
+                           for key, partition_titles, source in tasks}
+                for future in as_completed(futures):
+                    try:
+                        finished(futures[future], future.result())
+                    except Exception as e:
+                        finished(futures[future], error=e)
+
+        if failed:
+            raise RuntimeError(f'{stage} failed for the partitions {failed}, run the pipeline again to retry them.')
+        previous_stage = stage
+    return checkpoints
+
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description='Runs an eotools pipeline described by a YAML file.')
+    parser.add_argument('config', help='filepath of the pipeline YAML file')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: workers of the YAML file or 1)')
+    parser.add_argument('--restart', action='store_true', help='discard the checkpoints and run all stages again')
+    parser.add_argument('--trace', default=None, help='filepath to save the spans of the main process in the Chrome trace format')
+    args = parser.parse_args(argv)
+
+    if args.trace is not None:
+        trace.enable()
+    try:
+        run_pipeline(read_config(args.config), workers=args.workers, restart=args.restart)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        if args.trace is not None:
+            trace.summary()
+            trace.export_chrome_trace(args.trace)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
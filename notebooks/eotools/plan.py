@@ -0,0 +1,333 @@
+#Description
+'''
+This script is intended to check a load before any data is read.
+In here you will find a planner which predicts the shape and the memory of a ``load_multiple_timestamps`` call
+from the products, bands and ``common_params`` (crs, resolution, extent) and chooses how it is executed:
+in memory, streamed product by product into a chunked Zarr cube (opened lazily with dask), or not at all,
+if a single acquisition is already larger than the memory budget.
+
+The memory budget is half of the available memory, unless it is configured with ``set_memory_budget``
+or the environment variable ``EOTOOLS_MEMORY_BUDGET`` (e.g.: '8GB').
+
+Example:
+    load_plan = plan.plan_load(products, bands, **common_params)
+    print(load_plan)
+    ds = plan.load_planned(products, bands, path='cube.zarr', **common_params)
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+# Side length of a Sentinel-2 tile in meters
+TILE_SIZE = 109_800
+
+# Approximate length of a degree at the equator in meters
+DEGREE = 111_320
+
+# Bytes per dask chunk, large enough for efficient reads, small enough for many chunks in memory
+CHUNK_BYTES = 64 * 2**20
+
+_UNITS = {'B': 1, 'KB': 2**10, 'MB': 2**20, 'GB': 2**30, 'TB': 2**40}
+
+
+
+#Modules:
+import os
+import re
+import math
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools import loading
+from eotools import cube
+from eotools.lazy import lazy_import
+xr = lazy_import('xarray')
+
+if TYPE_CHECKING:
+    from eodag import SearchResult
+
+
+_memory_budget = None
+
+
+##############################################
+# Memory functions
+##############################################
+
+def parse_bytes(value:int|float|str) -> int:
+    '''
+    Number of bytes of a size (e.g.: 1_000_000, '500MB', '8 GB').
+    '''
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?B)?\s*', value.upper())
+    if match is None:
+        raise ValueError(f'Unknown size {value!r}, use e.g. 500MB or 8GB.')
+    return int(float(match.group(1)) * _UNITS[match.group(2) or 'B'])
+
+def format_bytes(nbytes:int|float) -> str:
+    for unit in ('TB', 'GB', 'MB', 'KB'):
+        if nbytes >= _UNITS[unit]:
+            return f'{nbytes / _UNITS[unit]:.1f} {unit}'
+    return f'{int(nbytes)} B'
+
+def available_memory() -> int:
+    '''
+    Memory available for new allocations in bytes (MemAvailable of /proc/meminfo, the physical memory on other systems).
+    '''
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+def set_memory_budget(budget:int|str|None) -> None:
+    '''
+    Sets the memory budget of the loads (e.g.: '8GB'), None restores the default (half of the available memory).
+    '''
+    global _memory_budget
+    _memory_budget = parse_bytes(budget) if budget is not None else None
+
+def memory_budget() -> int:
+    '''
+    Memory budget of the loads in bytes: set with ``set_memory_budget``, the environment variable
+    ``EOTOOLS_MEMORY_BUDGET`` or half of the available memory.
+    '''
+    if _memory_budget is not None:
+        return _memory_budget
+    if os.environ.get('EOTOOLS_MEMORY_BUDGET'):
+        return parse_bytes(os.environ['EOTOOLS_MEMORY_BUDGET'])
+    return available_memory() // 2
+
+
+##############################################
+# Shape functions
+##############################################
+
+def _bounds(extent) -> tuple|None:
+    '''
+    Bounds (minx, miny, maxx, maxy) of an extent given as tuple, shapely geometry or GeoJSON-like dictionary.
+    '''
+    if extent is None:
+        return None
+    if hasattr(extent, 'bounds'):
+        return tuple(extent.bounds)
+    if isinstance(extent, dict):
+        from shapely.geometry import shape
+        return tuple(shape(extent).bounds)
+    return tuple(float(v) for v in extent)
+
+def _footprint_bounds(products:list) -> tuple|None:
+    '''
+    Union of the footprints of the products (EPSG:4326), None if a product has no footprint.
+    '''
+    bounds = [getattr(product, 'geometry', None) for product in products]
+    if len(bounds) == 0 or any(b is None for b in bounds):
+        return None
+    bounds = np.array([b.bounds for b in bounds])
+    return (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max())
+
+def grid_shape(bounds:tuple|None, crs=None, resolution:float=None, native_resolution:int=10) -> tuple[int, int]:
+    '''
+    Number of pixels (y, x) of an area.
+
+    Params:
+    -------
+        - bounds: tuple -> (minx, miny, maxx, maxy) in EPSG:4326, None for one Sentinel-2 tile
+        - crs: -> CRS of the data (default: the UTM zone of the product)
+        - resolution: float -> resolution in units of the CRS (default: ``native_resolution``)
+        - native_resolution: int -> native resolution of the band in meters
+
+    Returns:
+    -------
+        - shape: tuple -> (height, width)
+    '''
+    geographic = False
+    if crs is not None:
+        from pyproj import CRS
+        geographic = CRS.from_user_input(crs).is_geographic
+    if resolution is None:
+        resolution = native_resolution / DEGREE if geographic else native_resolution
+
+    if bounds is None:
+        width = height = TILE_SIZE / DEGREE if geographic else TILE_SIZE
+    elif crs is None:
+        # Native UTM grid, the length of a degree of longitude shrinks with the latitude
+        latitude = math.radians((bounds[1] + bounds[3]) / 2)
+        width = (bounds[2] - bounds[0]) * DEGREE * math.cos(latitude)
+        height = (bounds[3] - bounds[1]) * DEGREE
+    else:
+        from pyproj import Transformer
+        transformer = Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+        minx, miny, maxx, maxy = transformer.transform_bounds(*bounds)
+        width, height = maxx - minx, maxy - miny
+    return max(math.ceil(height / resolution), 1), max(math.ceil(width / resolution), 1)
+
+def plan_chunks(shape:tuple, itemsize:int, access:str='spatial', chunk_bytes:int=CHUNK_BYTES) -> dict:
+    '''
+    Chunk sizes (time, y, x) of a cube, so every chunk has about ``chunk_bytes``.
+
+    Params:
+    -------
+        - shape: tuple -> (time, y, x)
+        - itemsize: int -> bytes per value
+        - access: str -> 'spatial' (one date per chunk) or 'time-series' (all dates per chunk)
+        - chunk_bytes: int -> target size of a chunk
+
+    Returns:
+    -------
+        - chunks: dict -> {'time': ..., 'y': ..., 'x': ...}
+    '''
+    n_times, height, width = shape
+    time_chunk = 1 if access == 'spatial' else n_times
+    side = int(math.sqrt(chunk_bytes / (itemsize * time_chunk)))
+    # Multiples of 256 pixels fit the internal tiles of the JP2 and GeoTIFF files
+    side = max(side // 256 * 256, 256)
+    return {'time': time_chunk, 'y': min(side, height), 'x': min(side, width)}
+
+
+##############################################
+# Plan functions
+##############################################
+
+class LoadPlan:
+    '''
+    Predicted size of a load and the chosen execution mode (see ``plan_load``).
+
+    - 'memory': the cube is loaded with ``load_multiple_timestamps_regex``
+    - 'stream': the products are loaded one date at a time and written to a Zarr cube, which is opened lazily
+      with ``chunks`` (for reductions over time see ``composite.composite_products``)
+    - 'refuse': a single date does not fit into the budget, a coarser resolution, a smaller extent
+      or fewer bands are needed
+    '''
+
+    def __init__(self, shapes:dict, dtype:np.dtype, n_products:int, budget:int, access:str='spatial'):
+        self.shapes = shapes
+        self.dtype = np.dtype(dtype)
+        self.n_products = n_products
+        self.budget = budget
+        self.nbytes = sum(int(np.prod(shape)) for shape in shapes.values()) * self.dtype.itemsize
+        n_times = max(shape[0] for shape in shapes.values()) if shapes else 0
+        self.date_nbytes = self.nbytes // max(n_times, 1)
+        # The datasets of all products and the merged Dataset are in memory at the same time
+        self.peak_nbytes = 2 * self.nbytes
+        largest = max(shapes.values(), key=lambda shape: shape[1] * shape[2]) if shapes else (0, 1, 1)
+        self.chunks = plan_chunks(largest, self.dtype.itemsize, access=access)
+
+        if self.peak_nbytes <= budget:
+            self.mode, self.reason = 'memory', 'the cube fits into the memory budget'
+        elif 2 * self.date_nbytes <= budget:
+            self.mode, self.reason = 'stream', 'the cube is larger than the memory budget, but a single date fits'
+        else:
+            self.mode, self.reason = 'refuse', ('a single date is larger than the memory budget, '
+                                                'use a coarser resolution, a smaller extent or fewer bands')
+
+    def __repr__(self) -> str:
+        lines = [f'LoadPlan: {self.mode} ({self.reason})',
+                 f'  {self.n_products} products, {len(self.shapes)} bands, {self.dtype}',
+                 f'  cube {format_bytes(self.nbytes)}, peak {format_bytes(self.peak_nbytes)}, '
+                 f'one date {format_bytes(self.date_nbytes)}, budget {format_bytes(self.budget)}']
+        lines += [f'  {band}: {shape}' for band, shape in self.shapes.items()]
+        if self.mode == 'stream':
+            lines.append(f'  chunks {self.chunks}')
+        return '\n'.join(lines)
+
+    def check(self) -> LoadPlan:
+        '''
+        Raises a MemoryError, if the load was refused.
+        '''
+        if self.mode == 'refuse':
+            raise MemoryError(f'Load refused: {self.reason}.\n{self!r}')
+        return self
+
+@trace.traced()
+def plan_load(products:SearchResult|list, bands:list[str], crs=None, resolution:float=None, extent=None,
+              mask:str=None, dtype=None, budget:int|str=None, access:str='spatial', **kwargs) -> LoadPlan:
+    '''
+    Predicts shape and memory of loading products with ``load_multiple_timestamps`` before any data is read
+    and chooses the execution mode (see ``LoadPlan``).
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products to be loaded
+        - bands: list[str] -> bands to be loaded
+        - crs, resolution, extent: -> ``common_params`` of the load (default: native grid and resolution,
+                                      the union of the product footprints or one tile if they are unknown)
+        - mask: str -> mask of the load (masked bands are float32)
+        - dtype: -> data type of the bands (default: as returned by the loaders, uint16 for a single product
+                    without mask, float32 if a mask is applied or products are merged, see ``loading.assemble_cube``)
+        - budget: int|str -> memory budget (default: ``memory_budget()``)
+        - access: str -> chunking of a streamed cube, 'spatial' or 'time-series'
+        - **kwargs: dict -> further ``common_params``, ignored
+
+    Returns:
+    -------
+        - plan: LoadPlan
+    '''
+    products = list(products)
+    bounds = _bounds(extent) if extent is not None else _footprint_bounds(products)
+    dates = {str(product.properties.get('startTimeFromAscendingNode', ''))[:10] for product in products}
+    if dtype is None:
+        # Masked bands and merged products hold Nan values, so the loaders promote uint16 to float32
+        dtype = loading._promoted('uint16') if mask is not None or len(products) > 1 else np.dtype('uint16')
+
+    shapes = {}
+    for band in bands:
+        native = loading.NATIVE_RESOLUTION.get(band, 10)
+        shapes[band] = (len(dates),) + grid_shape(bounds, crs=crs, resolution=resolution, native_resolution=native)
+    budget = parse_bytes(budget) if budget is not None else memory_budget()
+    return LoadPlan(shapes, dtype, len(products), budget, access=access)
+
+@trace.traced()
+def load_planned(products:SearchResult|list, bands:list[str], path:str|Path=None, mask:str=None,
+                 min_valid_fraction:float=None, budget:int|str=None, access:str='spatial', log:bool=True,
+                 **kwargs) -> xr.Dataset:
+    '''
+    Plans a load (see ``plan_load``) and executes it in the chosen mode: in memory, streamed into a
+    Zarr cube at ``path`` one date at a time, or not at all (MemoryError).
+
+    Params:
+    -------
+        - products: list[EOProduct] -> products to be loaded
+        - bands: list[str] -> bands to be loaded
+        - path: str|Path -> Zarr store for the streamed mode (needed if the cube does not fit into the memory budget)
+        - mask, min_valid_fraction: -> see ``loading.load_multiple_timestamps``
+        - budget: int|str -> memory budget (default: ``memory_budget()``)
+        - access: str -> chunking of a streamed cube, 'spatial' or 'time-series'
+        - log: bool -> if True, the plan is printed
+        - **kwargs: dict -> additional arguments to be passed to the ``get_data`` method of the EOProduct (``common_params``)
+
+    Returns:
+    -------
+        - ds: xr.Dataset -> loaded cube (lazy dask arrays in the streamed mode)
+    '''
+    load_plan = plan_load(products, bands, mask=mask, budget=budget, access=access, **kwargs).check()
+    if log:
+        print(load_plan)
+    if load_plan.mode == 'memory':
+        return loading.load_multiple_timestamps_regex(products, bands, mask=mask,
+                                                      min_valid_fraction=min_valid_fraction, **kwargs)
+    if path is None:
+        raise MemoryError(f'The cube does not fit into the memory budget, give a path to stream it into a Zarr cube.\n{load_plan!r}')
+
+    # One date after another, so products of the same date are merged before they are written
+    by_date = {}
+    for product in sorted(products, key=lambda p: p.properties['startTimeFromAscendingNode']):
+        by_date.setdefault(product.properties['startTimeFromAscendingNode'][:10], []).append(product)
+    ds = None
+    for group in by_date.values():
+        if ds is None or len(ds.data_vars) == 0:
+            # The cube is created with the first date which has valid products, with the planned data type,
+            # so a first date of a single product (uint16) does not turn the Nan values of later dates into 0
+            ds = cube.load_cube(group, bands, path, mask=mask, min_valid_fraction=min_valid_fraction,
+                                access=load_plan.chunks, dtype=load_plan.dtype, overwrite=True, **kwargs)
+        else:
+            ds = cube.append_cube(path, group, **kwargs)
+    return ds
@@ -0,0 +1,421 @@
+#Description
+'''
+This script is intended to simplify further processes in your code.
+In here you will find a store for labelled polygons (e.g.: Regions of Interest), which can be used
+without any widget. It supports undo/redo, the import of existing Geojson Files and the export
+of one Geojson File per label.
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+
+
+#Modules:
+import os
+import json
+import warnings
+import numpy as np
+from typing import TYPE_CHECKING
+from eotools.lazy import lazy_import
+geometry = lazy_import('shapely.geometry')
+
+if TYPE_CHECKING:
+    from shapely.geometry import Polygon
+
+
+class PolygonStore:
+    '''
+    Stores labelled polygons in flat arrays: all vertices are kept in a single coordinate buffer,
+    each polygon is a slot with an offset into that buffer, a length, an id, a label code and a bounding box.
+    Adding a polygon appends to the buffers, removing a polygon only marks its slot as removed,
+    so both are O(1) (amortized). Removed slots are compacted once they are no longer needed for undo.
+
+    Params:
+    -------
+        - capacity: int -> initial number of polygons the buffers are allocated for (grows automatically)
+        - max_history: int -> number of operations which can be undone (default: 100)
+    '''
+
+    def __init__(self, capacity:int=256, max_history:int=100):
+        self._coords = np.empty((capacity * 8, 2))
+        self._n_coords = 0
+
+        self._offsets = np.empty(capacity, dtype=np.int64)
+        self._lengths = np.empty(capacity, dtype=np.int64)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._codes = np.empty(capacity, dtype=np.int64)
+        self._bounds = np.empty((capacity, 4))
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._n = 0
+        self._n_alive = 0
+
+        self._labels = []
+        self._label_codes = {}
+        self._slot_of_id = {}
+        self._next_id = 1
+
+        self._undo = []
+        self._redo = []
+        self.max_history = max_history
+
+    ##############################################
+    # Basic properties
+    ##############################################
+
+    def __len__(self) -> int:
+        return self._n_alive
+
+    def __repr__(self) -> str:
+        return f'PolygonStore({len(self)} polygons, labels={self.labels})'
+
+    def __contains__(self, polygon_id:int) -> bool:
+        slot = self._slot_of_id.get(polygon_id)
+        return slot is not None and bool(self._alive[slot])
+
+    @property
+    def ids(self) -> np.ndarray:
+        '''
+        Ids of all polygons in the order they were added.
+        '''
+        return self._ids[:self._n][self._alive[:self._n]].copy()
+
+    @property
+    def labels(self) -> list[str]:
+        '''
+        All labels known to the store (also labels without polygons).
+        '''
+        return list(self._labels)
+
+    def label(self, polygon_id:int) -> str:
+        '''
+        Label of a polygon.
+        '''
+        return self._labels[self._codes[self._slot(polygon_id)]]
+
+    def coordinates(self, polygon_id:int) -> np.ndarray:
+        '''
+        Vertices of a polygon as array of shape (n_vertices, 2), the first vertex is repeated at the end.
+        '''
+        slot = self._slot(polygon_id)
+        start = self._offsets[slot]
+        return self._coords[start:start + self._lengths[slot]].copy()
+
+    def polygon(self, polygon_id:int) -> Polygon:
+        '''
+        Polygon as shapely object.
+        '''
+        return geometry.Polygon(self.coordinates(polygon_id))
+
+    def last_id(self) -> int|None:
+        '''
+        Id of the most recently added polygon (None if the store is empty).
+        '''
+        alive = np.flatnonzero(self._alive[:self._n])
+        if len(alive) == 0:
+            return None
+        return int(self._ids[alive[-1]])
+
+    ##############################################
+    # Editing
+    ##############################################
+
+    def add(self, coordinates, label:str, polygon_id:int=None) -> int:
+        '''
+        Adds a polygon to the store.
+
+        Params:
+        -------
+            - coordinates: list|np.ndarray -> vertices of the polygon [(x, y), ...], the ring is closed if necessary
+            - label: str -> label of the polygon (e.g.: 'forest')
+            - polygon_id: int -> id of the polygon (optional, a new id is created if None)
+
+        Returns:
+        --------
+            - polygon_id: int -> id of the added polygon
+        '''
+        polygon_id = self._insert(coordinates, label, polygon_id)
+        self._record(('add', [polygon_id]))
+        return polygon_id
+
+    def remove(self, polygon_id:int) -> None:
+        '''
+        Removes a polygon from the store.
+
+        Params:
+        -------
+            - polygon_id: int -> id of the polygon
+        '''
+        self._set_alive([polygon_id], False)
+        self._record(('remove', [polygon_id]))
+
+    def clear(self) -> None:
+        '''
+        Removes all polygons from the store (can be undone).
+        '''
+        removed = [int(i) for i in self.ids]
+        if len(removed) == 0:
+            return
+        self._set_alive(removed, False)
+        self._record(('remove', removed))
+
+    def undo(self) -> bool:
+        '''
+        Undoes the most recent operation (add, remove, clear or import).
+
+        Returns:
+        --------
+            - bool -> False if there was nothing to undo
+        '''
+        if len(self._undo) == 0:
+            return False
+        operation, ids = self._undo.pop()
+        self._set_alive(ids, operation == 'remove')
+        self._redo.append((operation, ids))
+        return True
+
+    def redo(self) -> bool:
+        '''
+        Redoes the most recently undone operation.
+
+        Returns:
+        --------
+            - bool -> False if there was nothing to redo
+        '''
+        if len(self._redo) == 0:
+            return False
+        operation, ids = self._redo.pop()
+        self._set_alive(ids, operation == 'add')
+        self._undo.append((operation, ids))
+        return True
+
+    def find(self, x:float, y:float) -> list[int]:
+        '''
+        Finds all polygons which contain a point.
+        Only polygons whose bounding box contains the point are tested.
+
+        Params:
+        -------
+            - x, y: float -> coordinates of the point
+
+        Returns:
+        --------
+            - ids: list[int] -> ids of the polygons containing the point
+        '''
+        n = self._n
+        b = self._bounds[:n]
+        candidates = np.flatnonzero(self._alive[:n] & (b[:, 0] <= x) & (b[:, 2] >= x) & (b[:, 1] <= y) & (b[:, 3] >= y))
+        point = geometry.Point(x, y)
+        return [int(self._ids[slot]) for slot in candidates if self.polygon(int(self._ids[slot])).contains(point)]
+
+    ##############################################
+    # Import and Export
+    ##############################################
+
+    def import_geojson(self, geojson:str|dict, label:str=None) -> list[int]:
+        '''
+        Adds all polygons of a Geojson FeatureCollection to the store (undone as a whole).
+        The label is taken from the ``label`` parameter, the ``label`` property of a feature or
+        the name of the FeatureCollection (in this order).
+        Only exterior rings are stored, a warning is raised for polygons with holes.
+
+        Params:
+        -------
+            - geojson: str|dict -> Filepath to a Geojson File or an already loaded FeatureCollection
+            - label: str -> label for all polygons (optional)
+
+        Returns:
+        --------
+            - ids: list[int] -> ids of the imported polygons
+        '''
+        if not isinstance(geojson, dict):
+            with open(geojson, 'r') as f:
+                geojson = json.load(f)
+
+        default_label = label or geojson.get('name')
+        ids = []
+        for feature in geojson.get('features', []):
+            feature_geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            feature_label = label or properties.get('label', default_label)
+            if feature_label is None:
+                raise ValueError('No label found for the polygons of the Geojson File.')
+
+            if feature_geometry.get('type') == 'Polygon':
+                parts = [feature_geometry['coordinates']]
+            elif feature_geometry.get('type') == 'MultiPolygon':
+                parts = feature_geometry['coordinates']
+            else:
+                continue
+
+            # The store only keeps exterior rings, holes would be filled silently
+            if any(len(part) > 1 for part in parts):
+                warnings.warn(f'Feature {properties.get("id", len(ids))} has interior rings (holes), '
+                              'only its exterior ring is imported.')
+            rings = [part[0] for part in parts]
+
+            # Ids of the file are kept as long as they are not used already
+            feature_id = properties.get('id')
+            for ring in rings:
+                if feature_id in self._slot_of_id or not isinstance(feature_id, int):
+                    feature_id = None
+                ids.append(self._insert(ring, feature_label, feature_id))
+                feature_id = None
+
+        if len(ids) > 0:
+            self._record(('add', ids))
+        return ids
+
+    def to_feature_collections(self) -> dict:
+        '''
+        Creates one Geojson FeatureCollection per label in a single pass over all polygons.
+        Labels without polygons are left out.
+
+        Returns:
+        --------
+            - collections: dict -> {label: FeatureCollection}
+        '''
+        collections = {}
+        for slot in np.flatnonzero(self._alive[:self._n]):
+            name = self._labels[self._codes[slot]]
+            if name not in collections:
+                collections[name] = {"type": "FeatureCollection", "name": name, "features": []}
+            start = self._offsets[slot]
+            ring = self._coords[start:start + self._lengths[slot]].tolist()
+            collections[name]["features"].append({"type": "Feature", "properties": {"id": int(self._ids[slot])},
+                                                  "geometry": {"type": "Polygon", "coordinates": [ring]}})
+        return collections
+
+    def export_geojson(self, savepath:str='./') -> list[str]:
+        '''
+        Writes one Geojson File per label (``<label>.geojson``). Existing files are not overwritten,
+        instead a number is added to the filename (``<label>2.geojson``, ...).
+
+        Params:
+        -------
+            - savepath: str -> directory where the files are written
+
+        Returns:
+        --------
+            - filepaths: list[str] -> paths of the written files
+        '''
+        filepaths = []
+        for name, collection in self.to_feature_collections().items():
+            def write_path(num:int=None):
+                if num == 1:
+                    filename = name.lower()
+                else:
+                    filename = name.lower() + str(num)
+                return os.path.join(os.path.abspath(savepath), f"{filename}.geojson")
+
+            idx = 1
+            filepath = write_path(num=idx)
+            while os.path.exists(filepath):
+                idx += 1
+                filepath = write_path(num=idx)
+
+            with open(filepath, "w") as geojson_file:
+                json.dump(collection, geojson_file)
+            filepaths.append(filepath)
+        return filepaths
+
+    ##############################################
+    # Internal functions
+    ##############################################
+
+    def _slot(self, polygon_id:int) -> int:
+        slot = self._slot_of_id.get(polygon_id)
+        if slot is None or not self._alive[slot]:
+            raise KeyError(f'No polygon with id {polygon_id}.')
+        return slot
+
+    def _code(self, label:str) -> int:
+        if label not in self._label_codes:
+            self._label_codes[label] = len(self._labels)
+            self._labels.append(label)
+        return self._label_codes[label]
+
+    def _insert(self, coordinates, label:str, polygon_id:int=None) -> int:
+        ring = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        if len(ring) < 3:
+            raise ValueError('A polygon needs at least three vertices.')
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+
+        if polygon_id is None:
+            polygon_id = self._next_id
+        elif polygon_id in self._slot_of_id:
+            raise ValueError(f'A polygon with id {polygon_id} already exists.')
+        self._next_id = max(self._next_id, polygon_id + 1)
+
+        self._reserve(1, len(ring))
+        slot = self._n
+        self._coords[self._n_coords:self._n_coords + len(ring)] = ring
+        self._offsets[slot] = self._n_coords
+        self._lengths[slot] = len(ring)
+        self._ids[slot] = polygon_id
+        self._codes[slot] = self._code(label)
+        self._bounds[slot] = (*ring.min(axis=0), *ring.max(axis=0))
+        self._alive[slot] = True
+
+        self._n += 1
+        self._n_coords += len(ring)
+        self._n_alive += 1
+        self._slot_of_id[polygon_id] = slot
+        return polygon_id
+
+    def _set_alive(self, ids:list[int], alive:bool) -> None:
+        for polygon_id in ids:
+            slot = self._slot_of_id.get(polygon_id)
+            if slot is None:
+                raise KeyError(f'No polygon with id {polygon_id}.')
+            if self._alive[slot] != alive:
+                self._alive[slot] = alive
+                self._n_alive += 1 if alive else -1
+
+    def _record(self, operation:tuple) -> None:
+        self._undo.append(operation)
+        self._redo.clear()
+        if len(self._undo) > self.max_history:
+            del self._undo[0]
+        if self._n - self._n_alive > max(self._n_alive, 64):
+            self._compact()
+
+    def _reserve(self, n_polygons:int, n_coords:int) -> None:
+        # The buffers grow by doubling, so appending is O(1) amortized
+        if self._n + n_polygons > len(self._ids):
+            size = max(2 * len(self._ids), self._n + n_polygons)
+            for name in ['_offsets', '_lengths', '_ids', '_codes', '_bounds', '_alive']:
+                old = getattr(self, name)
+                new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+                new[:self._n] = old[:self._n]
+                setattr(self, name, new)
+        if self._n_coords + n_coords > len(self._coords):
+            size = max(2 * len(self._coords), self._n_coords + n_coords)
+            new = np.empty((size, 2))
+            new[:self._n_coords] = self._coords[:self._n_coords]
+            self._coords = new
+
+    def _compact(self) -> None:
+        # Removed polygons which can still be restored by undo/redo are kept
+        referenced = {i for _, ids in self._undo + self._redo for i in ids}
+        keep = [slot for slot in range(self._n) if self._alive[slot] or int(self._ids[slot]) in referenced]
+
+        starts = self._offsets[keep]
+        lengths = self._lengths[keep]
+        coords = np.concatenate([self._coords[s:s + l] for s, l in zip(starts, lengths)]) if keep else np.empty((0, 2))
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if keep else np.empty(0, dtype=np.int64)
+
+        n = len(keep)
+        self._coords[:len(coords)] = coords
+        self._offsets[:n] = offsets
+        self._lengths[:n] = lengths
+        for name in ['_ids', '_codes', '_bounds', '_alive']:
+            array = getattr(self, name)
+            array[:n] = array[keep]
+        self._n = n
+        self._n_coords = len(coords)
+        self._slot_of_id = {int(self._ids[slot]): slot for slot in range(n)}
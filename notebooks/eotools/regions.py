@@ -7,6 +7,7 @@ This Script shall be used as a tool for the exercise 'applied remote sensing'.
 It allows the user to define Regions of Interest and export them as geojson file
 aswell as an png Image. The usage of QGIS in this exercies is therefore unnecessary.
 '''
+from __future__ import annotations
 
 # Variables
 __name__ = 'regions'
@@ -15,27 +16,27 @@ __version__ = '20-Jun-2024_v01'
 # Modules
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Button
-import matplotlib.image as mpimg
-import ipywidgets as widgets
-from IPython.display import display
-from shapely.geometry import Point, Polygon
 import json
-import xarray as xr
+from eotools.lazy import lazy_import
+from eotools.polygons import PolygonStore
+plt = lazy_import('matplotlib.pyplot')
+widgets = lazy_import('ipywidgets')
+pd = lazy_import('pandas')
+xr = lazy_import('xarray')
 
 
 # Functions
 def roi(canvas:np.array ,ds:xr.Dataset , title='Regions of Interest', figsize=(8, 8), button_1="Woodland", button_2="Artificial-land",
         savepath:str='./',
         c1="C0", c2="C1",
-        alpha=0.2):
+        alpha=0.2, labels:list=None, colors:list=None, store:PolygonStore=None, geojson:str|list=None,
+        stats_bands:list=None, stats_ranges:dict=None):
     """
     |
     |Interactive Plot in which you can create Polygons in different colors and with different labels of land usage.
     |The following buttons are available:
     |
-    |   Button 1 - Button 2:
+    |   Label buttons (Button 1 - Button 2, or one button per entry of labels):
     |       By clicking, the land usage type and color of the next drawn polygon is selected.
     |
     |   Clear all button:
@@ -48,348 +49,585 @@ def roi(canvas:np.array ,ds:xr.Dataset , title='Regions of Interest', figsize=(8
     |   Clear polygon button:
     |       After clicking the button it is possible to clear an individual, finished polygon
     |       by clicking inside of it.
+    |   Undo - Redo buttons:
+    |       Undoes/redoes the last change of the finished polygons (adding, clearing, importing).
     |   Export Geojson button:
     |       Creates geojson files of the drawn polygons, for each land usage type a seperate
     |       geojson file is created.
     |   Export png button:
     |       Creates a png image of the plot.
+    |   Export statistics button:
+    |       Creates a json file with the pixel count and the mean, standard deviation and histogram
+    |       of every band for each polygon.
+    |
+    |Below the buttons a table shows the statistics of each polygon. It is updated whenever a polygon is closed,
+    |so polygons which are spectrally different from the other polygons of their label (high z_max) are found while drawing.
     |
     |
     |Parameters:
     |===========
-    |   image: the image to be plotted
-    |   dc: datacube of the filepaths used to create the image and containing the image geometry
-    |   (row, col): the upper-left origin of the pixel window
-    |   (row_size, col_size): the shape of the pixel window
+    |   canvas: the image to be plotted
+    |   ds: dataset containing the image geometry (x and y coordinates)
     |   figsize: tuple with the figsize (default: (8,8))
-    |   button_1 - button_8: string of the label for the land usage class (default: labels from eurostat land coverage statistics)
-    |   c1 - c8: string of the color for each label
+    |   button_1 - button_2: string of the label for the land usage class (default: labels from eurostat land coverage statistics)
+    |   c1 - c2: string of the color for each label
     |   alpha: transparency value for the filling of the polygons (default: 0.2)
+    |   labels: list of labels, replaces button_1 - button_2 (any number of labels)
+    |   colors: list of colors for the labels (default: matplotlib color cycle)
+    |   store: PolygonStore to draw into, e.g. from a previous session (default: a new store)
+    |   geojson: filepath or list of filepaths of geojson files, whose polygons are loaded into the store
+    |   stats_bands: bands of ds used for the polygon statistics (default: all variables of ds)
+    |   stats_ranges: histogram range (min, max) per band, so histograms of different polygons can be compared
     |
     |
     |Returns:
     |========
-    | Has no return value, but plots the image and lets user draw polygons, which can be exported as geojson and png
+    | The PolygonStore containing the polygons, the plot lets the user draw polygons, which can be exported as geojson and png
     """
+    from matplotlib.patches import Polygon as MplPolygon
+    from matplotlib.colors import to_rgba
+    from IPython.display import display
 
-    def export_geojson(polygons):
+    def update_image(*args):
         """
-            Exports geojson files out of a dictionary containing coordinates of polygons and their respective labels and id's
-
-            Parameters:
-                polygons: dictionary containing polygons and information about the label and the id of the polygon
+            Shows the pyramid level which matches the current zoom, cut to the visible window
         """
+        axes_size = ax.get_window_extent().size
+        data, extent = pyramid_window(pyramid, xyext, ax.get_xlim() + ax.get_ylim(), axes_size)
+        image.set_data(data)
+        image.set_extent(extent)
 
-        # Create a seperate dictionary for each label and define the basic layout of the geojson file
-        button_1_dict = {"type": "FeatureCollection", "name": button_1, "features": []}
-        button_2_dict = {"type": "FeatureCollection", "name": button_2, "features": []}
-        
-
-        # Add respective values to the feature- and id-key of each dictionary
-        for polygon in polygons:
-            if polygon["label"] == button_1:
-                button_1_dict["features"].append({"type": "Feature", "properties": {"id": polygon["id"]}, "geometry": {"type": "Polygon", "coordinates": [polygon["coordinates"]]}})
-            elif polygon["label"] == button_2:
-                button_2_dict["features"].append({"type": "Feature", "properties": {"id": polygon["id"]}, "geometry": {"type": "Polygon", "coordinates": [polygon["coordinates"]]}})
-            
-        # Combine the dictionaries in a list and create an empty list for the filtered dictionaries
-        dict_list_raw = [button_1_dict, button_2_dict]
-        dict_list_filtered = []
-
-        # Append non-empty dictionaries to the filtered dictionaries list
-        for dictionary in dict_list_raw:
-            if len(dictionary["features"]) > 0:
-                dict_list_filtered.append(dictionary)
-
-        # Export the geojson files
-        for dictionary in dict_list_filtered:
-            def write_path(num:int=None):
-                if num == 1:
-                    name = dictionary["name"].lower()
-                else:
-                    name = dictionary["name"].lower() + str(num)
-                    
-                filename = f"{name}.geojson"
-                filepath = os.path.abspath(savepath)
-                filepath = os.path.join(filepath, filename)
-                return filepath
-            
-            idx = 1
-            filepath = write_path(num=idx)
-
-            while os.path.exists(filepath):
-                idx += 1
-                filepath = write_path(num=idx)
-    
-            with open(filepath, "w") as geojson_file:
-                json.dump(dictionary, geojson_file)
-
-    def redraw(polygons):
+    def capture_background():
         """
-            Draws polygons out of a dictionary containing the label of the polygon and the shapely polygon object.
-
-            Parameters:
-                polygons: dictionary containing polygons as shapely objects and the label of the polygon.
+            Copies the rendered figure (image and finished polygons) so it can be restored without rendering the image again
         """
+        blit_cache["background"] = fig.canvas.copy_from_bbox(fig.bbox)
 
-        # The axes is cleared and the empty image is shown
-        ax.clear()
-        ax.imshow(canvas, extent=(xyext))
+    def draw_overlay():
+        """
+            Draws the open polygon and the error text on top of the stored background and blits the result to the screen.
+            The cost does not depend on the size of the canvas or the number of polygons.
+        """
+        if not use_blit or blit_cache["background"] is None:
+            fig.canvas.draw_idle()
+            return
 
-        # The polygons get drawn
-        for polygon in polygons:
-            if polygon["label"] == button_1:
-                ax.plot(*polygon["polygon"].exterior.xy, c=c1)
-                ax.fill(*polygon["polygon"].exterior.xy, c=c1, alpha=alpha)
-            elif polygon["label"] == button_2:
-                ax.plot(*polygon["polygon"].exterior.xy, c=c2)
-                ax.fill(*polygon["polygon"].exterior.xy, c=c2, alpha=alpha)
+        fig.canvas.restore_region(blit_cache["background"])
+        ax.draw_artist(open_line)
+        ax.draw_artist(error_text)
+        fig.canvas.blit(fig.bbox)
 
-    def on_image_click(event):
+    def on_draw(event):
         """
-            Defines what happens when the image is clicked
+            After a full draw (first draw, zoom, pan, resize) the backgrounds are stored again.
+            The animated artists are not part of a full draw, so the first copy only contains the image.
+        """
+        if not use_blit:
+            return
+        blit_cache["image"] = fig.canvas.copy_from_bbox(fig.bbox)
+        for artist in polygon_artists.values():
+            ax.draw_artist(artist)
+        capture_background()
+        ax.draw_artist(open_line)
+        ax.draw_artist(error_text)
+
+    def redraw_polygons():
         """
+            Draws all finished polygons on top of the stored image, without rendering the image again.
+            Used after polygons have been removed.
+        """
+        if not use_blit or blit_cache["image"] is None:
+            fig.canvas.draw_idle()
+            return
 
-        # Assert the error text and id list
-        global error_text
+        fig.canvas.restore_region(blit_cache["image"])
+        for artist in polygon_artists.values():
+            ax.draw_artist(artist)
+        capture_background()
+        draw_overlay()
 
-        if event.inaxes is not None:
+    def create_polygon_artist(polygon_id):
+        """
+            Creates the artist of a finished polygon of the store.
 
-            ### Left mouseclick is defined to add points to a polygon and clear individual polygons ###
-            if event.button == 1:
+            Parameters:
+                polygon_id: id of the polygon in the store.
+        """
+        label = store.label(polygon_id)
+        color = label_colors[label]
+        artist = MplPolygon(store.coordinates(polygon_id), closed=True, animated=use_blit,
+                            facecolor=to_rgba(color, alpha), edgecolor=color, lw=1)
+        ax.add_patch(artist)
+        polygon_artists[polygon_id] = artist
+        return artist
+
+    def add_polygon_artist(polygon_id):
+        """
+            Creates the artist of a finished polygon and draws only this artist onto the stored background.
 
-                # The x- and y-coordinate of the clicked point get saved
-                clicked_point = [event.xdata, event.ydata]
+            Parameters:
+                polygon_id: id of the polygon in the store.
+        """
+        artist = create_polygon_artist(polygon_id)
 
-                # If one of the label buttons is active one of the following statements is carried out
-                if button1.value or button2.value:
+        if not use_blit or blit_cache["background"] is None:
+            fig.canvas.draw_idle()
+            return
 
-                    # If an error text is shown it gets cleared of the plot
-                    # if error_text is not None:
-                    #     error_text.remove()
-                    #     error_text = None
+        fig.canvas.restore_region(blit_cache["background"])
+        ax.draw_artist(artist)
+        capture_background()
 
-                    # The clicked point gets appended to the clicked points list
-                    clicked_points.append(clicked_point)
+    def sync_polygon_artists():
+        """
+            Creates and removes artists, so that they match the polygons of the store (e.g. after undo/redo), and redraws them.
+        """
+        ids = set(int(i) for i in store.ids)
+        for polygon_id in set(polygon_artists) - ids:
+            polygon_artists.pop(polygon_id).remove()
+        for polygon_id in store.ids:
+            if int(polygon_id) not in polygon_artists:
+                create_polygon_artist(int(polygon_id))
+        redraw_polygons()
+        update_statistics()
+
+    def update_statistics(polygon_ids=()):
+        """
+            Computes the statistics of new polygons (only their bounding window is read) and shows the table of all polygons in the store.
 
-                    ### The following eight statements treat the left mouseclick when one of the label buttons is acitve ###
+            Parameters:
+                polygon_ids: ids of the polygons whose statistics have to be computed.
+        """
+        for polygon_id in polygon_ids:
+            polygon_stats[polygon_id] = polygon_band_statistics(ds, store.coordinates(polygon_id), bands=stats_bands, ranges=stats_ranges)
 
-                    # firstly the non active label buttons are disabled so it is not possible to change the label while still having an open polygon
-                    # secondly a plot is drawn with the respective color of the label with regards to which coordinates the mouseclick has
-                    # thirdly the drawn lines are saved into a line_segments list
+        ids = [int(i) for i in store.ids]
+        table = polygon_statistics_table({i: polygon_stats[i] for i in ids}, {i: store.label(i) for i in ids})
+        stats_output.clear_output(wait=True)
+        with stats_output:
+            display(table.round(3))
 
-                    if button1.value:
-                        button2.disabled = True
+    def update_open_line():
+        """
+            Updates the line of the polygon which is currently drawn with the clicked points
+        """
+        if len(clicked_points) > 0:
+            points = np.asarray(clicked_points)
+            open_line.set_data(points[:, 0], points[:, 1])
+            if active_label() is not None:
+                open_line.set_color(label_colors[active_label()])
+        else:
+            open_line.set_data([], [])
+        draw_overlay()
 
-                        try:
-                            plt.plot(clicked_point[0], clicked_point[1], c=c1, ls="-", lw=10, marker="x")
-                            last_point = clicked_points[-2]
-                            current_point = clicked_points[-1]
-                            line = plt.plot([last_point[0], current_point[0]], [last_point[1], current_point[1]], c=c1, ls="-", lw=1)
-                            line_segments.append(line[0])
-                        except:
-                            IndexError
+    def active_label():
+        """
+            Returns the label of the active label button (None if no label button is active)
+        """
+        for button in label_buttons:
+            if button.value:
+                return button.description
+        return None
 
-                    elif button2.value:
-                        button1.disabled = True
+    def set_label_buttons_disabled(disabled):
+        """
+            Disables all label buttons except the active one (or enables all of them)
+        """
+        for button in label_buttons:
+            button.disabled = disabled and not button.value
 
-                        try:
-                            plt.plot(clicked_point[0], clicked_point[1], c=c2, ls="-", lw=10, marker="x")
-                            last_point = clicked_points[-2]
-                            current_point = clicked_points[-1]
-                            line = plt.plot([last_point[0], current_point[0]], [last_point[1], current_point[1]], c=c2, ls="-", lw=1)
-                            line_segments.append(line[0])
-                        except:
-                            IndexError
+    def on_image_click(event):
+        """
+            Defines what happens when the image is clicked
+        """
 
-                # If the clear polygon button is active one of the following statements is carried out
-                elif clear_polygon_button.value:
+        # Clicks while zooming or panning are ignored
+        if event.inaxes is None or fig.canvas.widgetlock.locked() or ax.get_navigate_mode() is not None:
+            return
 
-                    # If the clicked points list is not empty an error text shows to make sure the polygon is finished before it is possible to delete a different polygon
-                    if len(clicked_points) != 0:
-                        ax.text(xyext[1] - (xyext[1] - xyext[0]) / 2 - 0.16 * (xyext[1] - xyext[0]), xyext[3] - (xyext[3] - xyext[2]) / 2, "Finish drawing previous polygon",
-                                color='r', bbox={'facecolor': 'white', 'edgecolor': 'r', 'pad': 3})
+        ### Left mouseclick is defined to add points to a polygon and clear individual polygons ###
+        if event.button == 1:
 
-                    # If the clicked points list is empty it is possible to delete a finished polygon by clicking inside of it
-                    else:
-                        clicked_polygon = None
-                        point = Point(clicked_point)  # A shapely point object is created out of the clicked point
+            # The x- and y-coordinate of the clicked point get saved
+            clicked_point = [event.xdata, event.ydata]
 
-                        # If a finished polygon contains the point which is clicked it is removed out of the dictionary
-                        for polygon in polygons:
-                            if polygon['polygon'].contains(point):
-                                polygons.remove(polygon)
+            # If one of the label buttons is active the clicked point gets appended to the open polygon
+            # and the non active label buttons are disabled, so it is not possible to change the label while still having an open polygon
+            if active_label() is not None:
+                clicked_points.append(clicked_point)
+                set_label_buttons_disabled(True)
+                update_open_line()
 
-                        # The plot gets redrawn
-                        redraw(polygons)
+            # If the clear polygon button is active one of the following statements is carried out
+            elif clear_polygon_button.value:
 
-                # If no button is active an error text is shown
-                # elif error_text is None:
-                #     error_text = ax.text(xyext[1] - (xyext[1] - xyext[0]) / 2 - 0.16 * (xyext[1] - xyext[0]), xyext[3] - (xyext[3] - xyext[2]) / 2,
-                #                          "Choose a label for the Polygon", color='r', bbox={'facecolor': 'white', 'edgecolor': 'r', 'pad': 3})
+                # If the clicked points list is not empty an error text shows to make sure the polygon is finished before it is possible to delete a different polygon
+                if len(clicked_points) != 0:
+                    error_text.set_visible(True)
+                    draw_overlay()
 
+                # If the clicked points list is empty it is possible to delete a finished polygon by clicking inside of it
                 else:
-                    pass
-
-            ### Right mouseclick is defined to close the polygon and save its data ###
-            elif event.button == 3:
-
-                # Making sure that at least three point have been clicked before closing the polygon
-                if len(clicked_points) > 2:
-
-                    ### Depending on the active label button the polygon is closed and the id of the polygon, a list of the coordinates of the vertices, a shapely polygon object
-                    ### and the label of the polygon are saved into a dictionary and this dictionary is appended to a list containing the dictionary of each created polygon
-                    if button1.value:
-                        first_point = clicked_points[0]
-                        last_point = clicked_points[-1]
-                        clicked_points.append(first_point)
-
-                        plt.plot([last_point[0], first_point[0]], [last_point[1], first_point[1]], c=c1, ls="-", lw=1)
-
-                        polygon_dict["id"] = max(index) + 1
-                        polygon_dict["coordinates"] = clicked_points.copy()
-                        polygon_dict["polygon"] = Polygon(clicked_points.copy())
-                        polygon_dict["label"] = button_1
-                        polygons.append(polygon_dict.copy())
-
-
-                    elif button2.value:
-                        first_point = clicked_points[0]
-                        last_point = clicked_points[-1]
-                        clicked_points.append(first_point)
-
-                        plt.plot([last_point[0], first_point[0]], [last_point[1], first_point[1]], c=c2, ls="-", lw=1)
-
-                        polygon_dict["id"] = max(index) + 1
-                        polygon_dict["coordinates"] = clicked_points.copy()
-                        polygon_dict["polygon"] = Polygon(clicked_points.copy())
-                        polygon_dict["label"] = button_2
-                        polygons.append(polygon_dict.copy())
+                    for polygon_id in store.find(*clicked_point):
+                        store.remove(polygon_id)
+                    sync_polygon_artists()
 
-                    # To make sure no id is used twice the used ids are saved into a list
-                    index.append(max(index) + 1)
+        ### Right mouseclick is defined to close the polygon and save it into the store ###
+        elif event.button == 3:
 
-                    # The polygons are redrawn
-                    redraw(polygons)
+            # Making sure that at least three point have been clicked before closing the polygon
+            label = active_label()
+            if len(clicked_points) > 2 and label is not None:
+                polygon_id = store.add(clicked_points, label=label)
 
-                    # All the buttons are enabled and the clicked points list is cleared so a new polygon can be drawn
-                    clicked_points.clear()
-
-                    button1.disabled = False
-                    button2.disabled = False
-
-    ### The following nine deffinitions make sure only one button can be active at a time by deactivating all buttons except the button clicked ###
-    def button1_clicked(change):
-        if change.new:
-            button2.value = False
-            clear_polygon_button.value = False
+                # All the buttons are enabled and the clicked points list is cleared so a new polygon can be drawn
+                clicked_points.clear()
+                error_text.set_visible(False)
+                set_label_buttons_disabled(False)
 
-    def button2_clicked(change):
-        if change.new:
-            button1.value = False
-            clear_polygon_button.value = False
+                # Only the new polygon is drawn and its statistics are computed
+                add_polygon_artist(polygon_id)
+                update_open_line()
+                update_statistics([polygon_id])
 
-    def clear_polygon_button_clicked(change):
+    ### The following definitions make sure only one button can be active at a time by deactivating all buttons except the button clicked ###
+    def toggle_button_clicked(change):
         if change.new:
-            button1.value = False
-            button2.value = False
+            for button in label_buttons + [clear_polygon_button]:
+                if button is not change.owner:
+                    button.value = False
 
-    ### The clear all button restores the original settings by clearing the plot, all the lists and dictionaries and enabling and deactivating all buttons ###
+    ### The clear all button restores the original settings by clearing the plot and the store and enabling and deactivating all buttons ###
     def clear_all_button_clicked(button):
-        polygons.clear()
-        polygon_dict.clear()
+        store.clear()
         clicked_points.clear()
-        line_segments.clear()
-
-        ax.clear()
-        ax.imshow(canvas, extent=(xyext))
+        error_text.set_visible(False)
 
-        button1.disabled = False
-        button2.disabled = False
+        for button in label_buttons:
+            button.disabled = False
+            button.value = False
 
-        button1.value = False
-        button2.value = False
+        open_line.set_data([], [])
+        sync_polygon_artists()
 
-    ### The clear most recent button clears the most recent drawn line and deletes the most recent coordinates out of the clicked points list if the clicked points list is not empty
+    ### The clear most recent button deletes the most recent coordinates out of the clicked points list if the clicked points list is not empty
     ### If the clicked points list is empty the most recent drawn polygon gets deleted as a whole
     def clear_most_recent_button_clicked(button):
         if len(clicked_points) > 0:
-            if len(clicked_points) == 1:
-                clicked_points.clear()
-                line_segments.clear()
-                plt.gca().lines[-1].remove()
-
-                button1.disabled = False
-                button2.disabled = False
-
-            else:
-                clicked_points.pop()
-                line_segments[-1].remove()
-                line_segments.pop()
-                plt.gca().lines[-1].remove()
-        else:
-            polygons.pop()
-            redraw(polygons)
-
-    ### The export geojson button exports the polygons as a geojson file ###
+            clicked_points.pop()
+            if len(clicked_points) == 0:
+                set_label_buttons_disabled(False)
+                error_text.set_visible(False)
+            update_open_line()
+
+        elif store.last_id() is not None:
+            store.remove(store.last_id())
+            sync_polygon_artists()
+
+    ### The undo and redo buttons undo/redo the last change of the store ###
+    def undo_button_clicked(button):
+        if store.undo():
+            sync_polygon_artists()
+
+    def redo_button_clicked(button):
+        if store.redo():
+            sync_polygon_artists()
+
+    ### The export geojson button exports the polygons as a geojson file per label ###
     def export_geojson_button_clicked(button):
-        export_geojson(polygons)
+        store.export_geojson(savepath)
+
+    ### The export statistics button exports the statistics of the polygons as a json file ###
+    def export_statistics_button_clicked(button):
+        filepath = os.path.join(os.path.abspath(savepath), 'regions_statistics.json')
+        statistics = [{'id': int(i), 'label': store.label(int(i)), **polygon_stats[int(i)]} for i in store.ids]
+        with open(filepath, "w") as json_file:
+            json.dump(statistics, json_file)
 
     ### The export png buttons exports a png of the figure ###
+    ### Animated artists are not part of a saved figure, so they are made static while saving ###
     def export_png_button_clicked(button):
         filename = 'regions_of_interest.png'
         filepath = os.path.abspath(savepath)
         filepath = os.path.join(filepath, filename)
-        plt.savefig(filepath, dpi=200)
+
+        artists = list(polygon_artists.values()) + [open_line]
+        for artist in artists:
+            artist.set_animated(False)
+        fig.savefig(filepath, dpi=200)
+        for artist in artists:
+            artist.set_animated(use_blit)
+        fig.canvas.draw_idle()
 
     ### The starting settings are defined ###
-    polygons = []
-    polygon_dict = {}
+    if store is None:
+        store = PolygonStore()
+    if geojson is not None:
+        for path in ([geojson] if isinstance(geojson, str) else geojson):
+            store.import_geojson(path)
     clicked_points = []
-    line_segments = []
-    index = [0]
-    error_text = None
-
-    ### The label-buttons and the clear polygon-button are defined as togglebuttons and they are connected with the button_clicked function ###
-    button1 = widgets.ToggleButton(value=False, description=button_1)
-    button1.observe(button1_clicked, 'value')
-
-    button2 = widgets.ToggleButton(value=False, description=button_2)
-    button2.observe(button2_clicked, 'value')
+    polygon_stats = {}
+
+    ### Every label gets a button and a color, also the labels of imported polygons ###
+    if labels is None:
+        labels = [button_1, button_2]
+    labels = list(labels) + [label for label in store.labels if label not in labels]
+    if colors is None:
+        colors = [c1, c2] if len(labels) == 2 else []
+    colors = list(colors) + [f"C{i % 10}" for i in range(len(colors), len(labels))]
+    label_colors = dict(zip(labels, colors))
+
+    ### Artists of the finished polygons (by id) and the stored backgrounds for blitting ###
+    polygon_artists = {}
+    blit_cache = {"image": None, "background": None}
+
+    ### The label-buttons and the clear polygon-button are defined as togglebuttons and they are connected with the toggle_button_clicked function ###
+    label_buttons = [widgets.ToggleButton(value=False, description=label) for label in labels]
+    for button in label_buttons:
+        button.observe(toggle_button_clicked, 'value')
 
     clear_polygon_button = widgets.ToggleButton(value=False, description="Clear polygon", button_style="warning")
-    clear_polygon_button.observe(clear_polygon_button_clicked, 'value')
+    clear_polygon_button.observe(toggle_button_clicked, 'value')
 
-    ### The clear all-, clear most recent-, export geojson- and export png-button are defined as buttons and connected with the button_clicked function ###
+    ### The clear all-, clear most recent-, undo-, redo-, export geojson- and export png-button are defined as buttons and connected with the button_clicked function ###
     clear_all_button = widgets.Button(description='Clear all', button_style="danger")
     clear_all_button.on_click(clear_all_button_clicked)
 
     clear_most_recent_button = widgets.Button(description='Clear most recent', button_style="warning")
     clear_most_recent_button.on_click(clear_most_recent_button_clicked)
 
+    undo_button = widgets.Button(description='Undo')
+    undo_button.on_click(undo_button_clicked)
+
+    redo_button = widgets.Button(description='Redo')
+    redo_button.on_click(redo_button_clicked)
+
     export_geojson_button = widgets.Button(description='Export Geojson', button_style="success")
     export_geojson_button.on_click(export_geojson_button_clicked)
 
     export_png_button = widgets.Button(description='Export png', button_style="success")
     export_png_button.on_click(export_png_button_clicked)
 
+    export_statistics_button = widgets.Button(description='Export statistics', button_style="success")
+    export_statistics_button.on_click(export_statistics_button_clicked)
+    stats_output = widgets.Output()
+
     ### The buttons are stored in boxes ###
-    buttons_box1 = widgets.HBox([button1, button2])
+    buttons_box1 = widgets.HBox(label_buttons)
     buttons_box2 = widgets.HBox([clear_most_recent_button, clear_polygon_button])
-    buttons_box3 = widgets.VBox([clear_all_button, export_geojson_button, export_png_button])
-    buttons_box5 = widgets.VBox([buttons_box1, buttons_box2, buttons_box3])
+    buttons_box3 = widgets.HBox([undo_button, redo_button])
+    buttons_box4 = widgets.VBox([clear_all_button, export_geojson_button, export_png_button, export_statistics_button])
+    buttons_box5 = widgets.VBox([buttons_box1, buttons_box2, buttons_box3, buttons_box4, stats_output])
 
     ### The image is plotted with the correct x- and y-axis ###
-    xyext = (ds.coords['x'].min(), ds.coords['x'].max(), ds.coords['y'].min(), ds.coords['y'].max()) # Left, Right, Bottom, Top
+    ### Only the part of the pyramid level matching the current zoom is shown, the full resolution only for small windows ###
+    xyext = tuple(float(v) for v in (ds.coords['x'].min(), ds.coords['x'].max(), ds.coords['y'].min(), ds.coords['y'].max())) # Left, Right, Bottom, Top
+    pyramid = build_pyramid(canvas)
     fig, ax = plt.subplots(figsize=figsize)
     #canvas.plot.imshow(ax=ax, extent=xyext)
-    ax.imshow(canvas, extent=(xyext))
+    image = ax.imshow(pyramid[-1], extent=(xyext))
+    ax.set_xlim(xyext[0], xyext[1])
+    ax.set_ylim(xyext[2], xyext[3])
+    ax.set_autoscale_on(False)
     ax.set_title(title)
+    update_image()
+
+    ### The open polygon and the error text are animated artists, which are only drawn by blitting ###
+    # The canvas of %matplotlib widget (ipympl, webagg) has copy_from_bbox, but no working blit, it is redrawn instead
+    use_blit = getattr(fig.canvas, 'supports_blit', False)
+    open_line, = ax.plot([], [], ls="-", lw=1, marker="x", markersize=10, animated=use_blit)
+    error_text = ax.text(0.5, 0.5, "Finish drawing previous polygon", transform=ax.transAxes, ha='center', animated=use_blit,
+                         color='r', bbox={'facecolor': 'white', 'edgecolor': 'r', 'pad': 3}, visible=False)
+
+    ### Polygons which are already in the store (e.g. imported) are drawn ###
+    for polygon_id in store.ids:
+        create_polygon_artist(int(polygon_id))
+    update_statistics([int(i) for i in store.ids])
 
     ### If there is a mouseclick on the image it is connected with the on image click function, also the buttons boxes are displayed ###
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    ax.callbacks.connect('xlim_changed', update_image)
+    ax.callbacks.connect('ylim_changed', update_image)
     cid = fig.canvas.mpl_connect('button_press_event', on_image_click)
     box = widgets.HBox([buttons_box5])
     display(box)
+    return store
+
+
+def polygon_band_statistics(ds:xr.Dataset, coordinates, bands:list=None, bins:int=32, ranges:dict=None) -> dict:
+    """
+    Computes the pixel count and the mean, standard deviation and histogram of every band for the pixels inside of a polygon.
+    Only the bounding window of the polygon is read and rasterized. If the Dataset has a time dimension, the median over time is used.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        Dataset with x and y coordinates in the same CRS as the polygon.
+    coordinates : list | np.array
+        Vertices of the polygon [(x, y), ...].
+    bands : list
+        Bands for which the statistics are computed (default: all variables of the Dataset).
+    bins : int
+        Number of bins of the histograms (default: 32).
+    ranges : dict
+        Range (min, max) of the histogram per band (default: range of the pixels in the polygon).
+
+    Returns
+    -------
+    dict
+        Dictionary with 'count' and per band dictionaries 'mean', 'std', 'histogram' and 'bin_edges'.
+    """
+    from matplotlib.path import Path as MplPath
+
+    if bands is None:
+        bands = list(ds.data_vars)
+    coordinates = np.asarray(coordinates, dtype=float)
+    (xmin, ymin), (xmax, ymax) = coordinates.min(axis=0), coordinates.max(axis=0)
+
+    # Bounding window of the polygon (works for ascending and descending coordinates)
+    x_idx = np.flatnonzero((ds['x'].values >= xmin) & (ds['x'].values <= xmax))
+    y_idx = np.flatnonzero((ds['y'].values >= ymin) & (ds['y'].values <= ymax))
+    stats = {'count': 0, 'mean': {}, 'std': {}, 'histogram': {}, 'bin_edges': {}}
+    if len(x_idx) == 0 or len(y_idx) == 0:
+        return stats
+    window = ds[bands].isel(x=slice(x_idx[0], x_idx[-1] + 1), y=slice(y_idx[0], y_idx[-1] + 1))
+    if 'time' in window.dims:
+        window = window.median(dim='time', skipna=True)
+
+    # Rasterize the polygon on the pixel centers of the window
+    xx, yy = np.meshgrid(window['x'].values, window['y'].values)
+    inside = MplPath(coordinates).contains_points(np.column_stack([xx.ravel(), yy.ravel()])).reshape(xx.shape)
+
+    for band in bands:
+        values = window[band].transpose('y', 'x').values[inside].astype(float)
+        values = values[~np.isnan(values)]
+        stats['count'] = max(stats['count'], len(values))
+        if len(values) == 0:
+            continue
+        band_range = ranges[band] if ranges is not None and band in ranges else (values.min(), values.max())
+        histogram, bin_edges = np.histogram(values, bins=bins, range=band_range)
+        stats['mean'][band] = float(values.mean())
+        stats['std'][band] = float(values.std())
+        stats['histogram'][band] = histogram.tolist()
+        stats['bin_edges'][band] = bin_edges.tolist()
+    return stats
+
+
+def polygon_statistics_table(statistics:dict, labels:dict) -> pd.DataFrame:
+    """
+    Creates a table of the polygon statistics with one row per polygon. The column 'z_max' is the largest deviation
+    (over all bands) of the polygon mean from the mean of all pixels with the same label, in standard deviations of that label.
+    Polygons with a high 'z_max' are spectrally different from the other polygons of their label and might be mislabelled.
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics per polygon id (provided by ``polygon_band_statistics``).
+    labels : dict
+        Label per polygon id.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with the columns id, label, count, mean_<band>, std_<band> and z_max.
+    """
+    rows = []
+    for polygon_id, stats in statistics.items():
+        row = {'id': polygon_id, 'label': labels[polygon_id], 'count': stats['count']}
+        row.update({f'mean_{band}': value for band, value in stats['mean'].items()})
+        row.update({f'std_{band}': value for band, value in stats['std'].items()})
+        rows.append(row)
+    if len(rows) == 0:
+        return pd.DataFrame(columns=['id', 'label', 'count', 'z_max'])
+    table = pd.DataFrame(rows)
+
+    # Mean and standard deviation of all pixels of a label, combined from the statistics of its polygons
+    bands = [column[len('mean_'):] for column in table.columns if column.startswith('mean_')]
+    z_max = pd.Series(0.0, index=table.index)
+    for band in bands:
+        mean, std, count = table[f'mean_{band}'], table[f'std_{band}'], table['count']
+        weight = count.groupby(table['label']).transform('sum')
+        label_mean = (mean * count).groupby(table['label']).transform('sum') / weight
+        label_var = ((std ** 2 + mean ** 2) * count).groupby(table['label']).transform('sum') / weight - label_mean ** 2
+        z = (mean - label_mean).abs() / np.sqrt(label_var.clip(lower=0)).replace(0, np.nan)
+        z_max = np.fmax(z_max, z.fillna(0))
+    table['z_max'] = z_max
+    return table
+
+
+def build_pyramid(canvas:np.array, min_size:int=512) -> list:
+    """
+    Builds overview levels of an image, each level has half the size of the previous one.
+    The first level is the canvas itself (not copied), the last level is the first one smaller than ``min_size``.
+
+    Parameters
+    ----------
+    canvas : np.array
+        Image of shape (rows, cols) or (rows, cols, bands).
+    min_size : int
+        Size of the coarsest level (default: 512).
+
+    Returns
+    -------
+    list
+        List of images from full to coarsest resolution.
+    """
+    pyramid = [canvas]
+    step = 1
+    while max(canvas.shape[:2]) // step > min_size:
+        step *= 2
+        pyramid.append(np.ascontiguousarray(canvas[::step, ::step]))
+    return pyramid
+
+
+def pyramid_window(pyramid:list, extent:tuple, view:tuple, screen_size:tuple) -> tuple:
+    """
+    Selects the coarsest pyramid level, which still has at least one pixel per screen pixel
+    in the current view, and cuts it to the visible window.
+
+    Parameters
+    ----------
+    pyramid : list
+        Images of the pyramid (provided by ``build_pyramid``).
+    extent : tuple
+        Extent of the full image (left, right, bottom, top).
+    view : tuple
+        Visible limits of the axes (x0, x1, y0, y1).
+    screen_size : tuple
+        Size of the axes in screen pixels (width, height).
+
+    Returns
+    -------
+    tuple
+        Visible part of the selected level and its extent (left, right, bottom, top).
+    """
+    left, right, bottom, top = extent
+    x0, x1 = sorted(view[:2])
+    y0, y1 = sorted(view[2:])
+
+    # Fraction of the image which is visible
+    frac_x = max(min(x1, right) - max(x0, left), 0) / (right - left)
+    frac_y = max(min(y1, top) - max(y0, bottom), 0) / (top - bottom)
+
+    # The coarsest level which still shows at least one image pixel per screen pixel
+    level = pyramid[0]
+    for candidate in pyramid:
+        if candidate.shape[1] * frac_x < screen_size[0] or candidate.shape[0] * frac_y < screen_size[1]:
+            break
+        level = candidate
+
+    # Visible window of the level (one pixel margin, so no gaps appear at the borders)
+    rows, cols = level.shape[:2]
+    dx = (right - left) / cols
+    dy = (top - bottom) / rows
+    col0 = int(np.clip(np.floor((x0 - left) / dx) - 1, 0, cols - 1))
+    col1 = int(np.clip(np.ceil((x1 - left) / dx) + 1, col0 + 1, cols))
+    row0 = int(np.clip(np.floor((top - y1) / dy) - 1, 0, rows - 1))
+    row1 = int(np.clip(np.ceil((top - y0) / dy) + 1, row0 + 1, rows))
+
+    window = level[row0:row1, col0:col1]
+    window_extent = (left + col0 * dx, left + col1 * dx, top - row1 * dy, top - row0 * dy)
+    return window, window_extent
 
 
 def remove_empty_polygons(poly_dict):
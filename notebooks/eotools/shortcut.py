@@ -3,6 +3,7 @@
 This script is intended to simplify further processes in your code. 
 In here you will find all the necessary functions to shorten the notebooks and to make it more readable.
 '''
+from __future__ import annotations
 
 
 
@@ -14,11 +15,37 @@ __version__ = '20-Jun-2024_v01'
 
 #Modules:
 import os
-import yaml
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-from eodag import EODataAccessGateway, SearchResult, EOProduct
+import re
+import copy
+import math
+import json
+import inspect
+import tempfile
+import warnings
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+from typing import TYPE_CHECKING
+from eotools import trace
+from eotools.lazy import lazy_import
+yaml = lazy_import('yaml')
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+mpimg = lazy_import('matplotlib.image')
+Image = lazy_import('PIL.Image')
+eodag = lazy_import('eodag')
+
+if TYPE_CHECKING:
+    from eodag import EODataAccessGateway, SearchResult, EOProduct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+QUICKLOOK_CACHE = Path.home() / '.cache' / 'eotools' / 'quicklooks'
 
 
 def read_paths(filepath:str = "paths.yml") -> dict:
@@ -68,38 +95,360 @@ def configure(dag:EODataAccessGateway, secrets:dict, paths:dict) -> EODataAccess
     print(f'EODAG has been configured.')
     return dag
 
-def plot_quicklooks(products:SearchResult|list[EOProduct]) -> None:
+@trace.traced()
+def fetch_quicklook(product:EOProduct, cache_dir:str|Path=QUICKLOOK_CACHE, size:int=256) -> Path|None:
+    '''
+    Get the thumbnail of the quicklook of a product from the local cache.
+    If it is not cached yet, the quicklook is downloaded, decoded once, downsampled and stored as png.
+
+    Params:
+    -------
+        - product: EOProduct -> product of which the quicklook is needed
+        - cache_dir: str|Path -> directory of the thumbnail cache (default: ~/.cache/eotools/quicklooks)
+        - size: int -> maximum width and height of the thumbnail in pixels
+
+    Returns:
+    --------
+        - thumbnail_path: Path -> path of the thumbnail (None if the quicklook could not be downloaded)
+    '''
+    thumbnail_path = Path(cache_dir) / f"{product.properties['id']}_{size}.png"
+    if thumbnail_path.is_file():
+        return thumbnail_path
+
+    # This line takes care of downloading the quicklook
+    quicklook_path = product.get_quicklook()
+    if not quicklook_path or not os.path.isfile(quicklook_path):
+        return None
+
+    thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(quicklook_path) as img:
+        img.thumbnail((size, size))
+        # Written to a unique temporary file first, so a parallel (also in threads of the same process)
+        # or interrupted fetch never leaves a broken thumbnail
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=f'.{thumbnail_path.stem}.', dir=thumbnail_path.parent)
+        os.close(fd)
+        try:
+            img.convert('RGB').save(tmp_path, format='PNG')
+            os.replace(tmp_path, thumbnail_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return thumbnail_path
+
+@trace.traced()
+def prefetch_quicklooks(products:SearchResult|list[EOProduct], cache_dir:str|Path=QUICKLOOK_CACHE,
+                        size:int=256, max_workers:int=8) -> list[Path|None]:
+    '''
+    Fetch the quicklook thumbnails of many products concurrently (see ``fetch_quicklook``).
+
+    Params:
+    -------
+        - products: SearchResult -> SearchResult object containing the products
+        - cache_dir: str|Path -> directory of the thumbnail cache (default: ~/.cache/eotools/quicklooks)
+        - size: int -> maximum width and height of the thumbnails in pixels
+        - max_workers: int -> maximum number of quicklooks downloaded at the same time
+
+    Returns:
+    --------
+        - thumbnail_paths: list[Path|None] -> paths of the thumbnails in the order of the products,
+                                              None for quicklooks which could not be fetched (a warning lists them)
+    '''
+    def fetch(product):
+        try:
+            return fetch_quicklook(product, cache_dir=cache_dir, size=size), None
+        except Exception as e:
+            return None, f"{product.properties['id']}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch, products))
+
+    failures = [error for _, error in results if error is not None]
+    if failures:
+        warnings.warn(f'{len(failures)} of {len(results)} quicklooks could not be fetched:\n' + '\n'.join(failures))
+    return [path for path, _ in results]
+
+def plot_quicklooks(products:SearchResult|list[EOProduct], max_products:int=12, ncols:int=4,
+                    cache_dir:str|Path=QUICKLOOK_CACHE, size:int=256, max_workers:int=8) -> None:
     '''
     Plot the quicklooks of the products.
+    The quicklooks are fetched concurrently and cached as thumbnails, so plotting them again is fast.
 
     Params:
     -------
         - products: SearchResult -> SearchResult object containing the products
+        - max_products: int -> maximum number of quicklooks to be plotted (default: 12, None for all)
+        - ncols: int -> number of columns of the grid (default: 4)
+        - cache_dir: str|Path -> directory of the thumbnail cache (default: ~/.cache/eotools/quicklooks)
+        - size: int -> maximum width and height of the thumbnails in pixels
+        - max_workers: int -> maximum number of quicklooks downloaded at the same time
 
     Returns:
     --------
         - None
         - Shows the quicklooks of the products
     '''
-    fig = plt.figure(figsize=(10,8))
-    for i, product in enumerate(products[:12]):
-        # This line takes care of downloading the quicklook
-        quicklook_path = product.get_quicklook()
-        
+    products = list(products)[:max_products]
+    thumbnails = prefetch_quicklooks(products, cache_dir=cache_dir, size=size, max_workers=max_workers)
+
+    nrows = max(math.ceil(len(products) / ncols), 1)
+    fig = plt.figure(figsize=(10, 8 * nrows / 3))
+    for i, (product, thumbnail_path) in enumerate(zip(products, thumbnails)):
         date = product.properties['startTimeFromAscendingNode'][:16]
         provider = product.provider
         tile = product.properties['title'].split('_')[5].lstrip('T')
     
         # Plot the quicklook
-        img = mpimg.imread(quicklook_path)
-        ax = fig.add_subplot(3, 4, i+1)
+        ax = fig.add_subplot(nrows, ncols, i+1)
         ax.set_title(f'Product {i}\n{date}\n{provider} - {tile}')
         ax.tick_params(top=False, bottom=False, left=False, right=False,
                        labelleft=False, labelbottom=False)
-        plt.imshow(img)
+        if thumbnail_path is not None:
+            ax.imshow(mpimg.imread(thumbnail_path))
     plt.tight_layout()
 
-def deserialize(filename:str, workspace:str, dag:EODataAccessGateway, log=True) -> SearchResult|list[EOProduct]:
+def _read_json(filepath:str|Path) -> dict:
+    '''
+    Read a json file with orjson (if installed), which is much faster than the json module for large files.
+    '''
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _geometry_bounds(geometry:dict) -> tuple:
+    '''
+    Bounds (minx, miny, maxx, maxy) of a GeoJSON geometry, without creating a shapely object.
+    '''
+    if not geometry or 'coordinates' not in geometry:
+        return (np.nan, np.nan, np.nan, np.nan)
+    coords = geometry['coordinates']
+    if geometry['type'] == 'Point':
+        points = np.asarray([coords], dtype=float)
+    elif geometry['type'] in ('LineString', 'MultiPoint'):
+        points = np.asarray(coords, dtype=float)
+    elif geometry['type'] in ('Polygon', 'MultiLineString'):
+        points = np.concatenate([np.asarray(ring, dtype=float) for ring in coords])
+    else:
+        points = np.concatenate([np.asarray(ring, dtype=float) for part in coords for ring in part])
+    (minx, miny), (maxx, maxy) = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+    return (minx, miny, maxx, maxy)
+
+def features_to_table(features:list[dict]) -> pd.DataFrame:
+    '''
+    Build a lightweight columnar index (id, title, start date, footprint bounds) of GeoJSON features of serialized products.
+
+    Params:
+    -------
+        - features: list[dict] -> GeoJSON features (e.g. of a serialized SearchResult)
+
+    Returns:
+    --------
+        - table: pd.DataFrame -> one row per feature
+    '''
+    properties = [feature.get('properties', {}) for feature in features]
+    bounds = np.array([_geometry_bounds(feature.get('geometry')) for feature in features], dtype=float).reshape(-1, 4)
+    return pd.DataFrame({
+        'id': [p.get('id') or feature.get('id') for p, feature in zip(properties, features)],
+        'title': [p.get('title') for p in properties],
+        'start': pd.to_datetime([p.get('startTimeFromAscendingNode') for p in properties], utc=True, format='ISO8601'),
+        'minx': bounds[:, 0], 'miny': bounds[:, 1], 'maxx': bounds[:, 2], 'maxy': bounds[:, 3],
+    })
+
+# Parsed files of deserialize(lazy=True), the least recently used file is dropped once the cache is full
+_DESERIALIZE_CACHE = OrderedDict()
+_DESERIALIZE_CACHE_SIZE = 4
+
+class LazySearchResult:
+    '''
+    Serialized search results, which only create ``EOProduct`` objects for the products that are accessed.
+    The GeoJSON is parsed once, a columnar index of all products is available as ``table`` and
+    ``__geo_interface__`` (used by folium) works without creating any product.
+    Indexing with an integer returns an ``EOProduct``, slicing or indexing with a list/boolean mask returns a
+    ``LazySearchResult`` of the selected products. ``to_search_result`` creates a regular ``SearchResult``.
+
+    Params:
+    -------
+        - source: dict -> parsed file (provided by ``deserialize``), shared between subsets
+        - indices: np.ndarray -> positions of the products of this result in the file (default: all)
+    '''
+
+    def __init__(self, source:dict, indices:np.ndarray=None):
+        self._source = source
+        self._indices = np.arange(len(source['features'])) if indices is None else np.asarray(indices, dtype=int)
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __repr__(self) -> str:
+        return f'LazySearchResult({len(self)} products, {len(self._source["products"])} created)'
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            position = self._indices[key]
+            return self._materialize([position])[0]
+        return LazySearchResult(self._source, self._indices[key])
+
+    def __iter__(self):
+        # Products are created in batches, so the cost of registering them is shared
+        batch_size = 256
+        for start in range(0, len(self._indices), batch_size):
+            yield from self._materialize(self._indices[start:start + batch_size])
+
+    @property
+    def table(self) -> pd.DataFrame:
+        '''
+        Columnar index (id, title, start, minx, miny, maxx, maxy) of the products, e.g. for filtering:
+        ``results[results.table['title'].str.contains('T33UWP').values]``
+        '''
+        return self._source['table'].iloc[self._indices].reset_index(drop=True)
+
+    @property
+    def __geo_interface__(self) -> dict:
+        return {'type': 'FeatureCollection', 'features': [self._source['features'][i] for i in self._indices]}
+
+    def to_search_result(self) -> SearchResult:
+        '''
+        Create all products of this result and return them as regular ``SearchResult``.
+        '''
+        return eodag.SearchResult(list(self))
+
+    def _materialize(self, positions) -> list[EOProduct]:
+        # Missing products are created together from the already parsed features, without writing them to a file again
+        products = self._source['products']
+        missing = [int(p) for p in positions if int(p) not in products]
+        if len(missing) > 0:
+            collection = {key: val for key, val in self._source['header'].items()}
+            # eodag may modify the features while creating products, the parsed features are kept unchanged
+            collection['features'] = copy.deepcopy([self._source['features'][p] for p in missing])
+            registered = _register_collection(collection, self._source['dag'])
+            products.update(zip(missing, registered))
+        return [products[int(p)] for p in positions]
+
+def _register_collection(collection:dict, dag:EODataAccessGateway) -> SearchResult:
+    '''
+    Same as ``dag.deserialize_and_register`` for a FeatureCollection which is already loaded.
+    '''
+    from_dict = getattr(eodag.SearchResult, 'from_dict', None)
+    if from_dict is not None and 'dag' in inspect.signature(from_dict).parameters:
+        return from_dict(collection, dag=dag)
+
+    # Older eodag versions: the products are registered the way deserialize_and_register does it
+    products = eodag.SearchResult.from_geojson(collection)
+    for product in products:
+        if product.downloader is None:
+            auth = product.downloader_auth or dag._plugins_manager.get_auth_plugin(product.provider)
+            product.register_downloader(dag._plugins_manager.get_download_plugin(product), auth)
+    return products
+
+# Sentinel-2 product names: <platform>_MSI<level>_<sensing datetime>_<baseline>_R<orbit>_T<tile>_<processing datetime>
+_TITLE_PATTERN = re.compile(r'^(?P<platform>S2[A-D_]?)_MSI(?P<level>[A-Z0-9]{3})_(?P<sensing>\d{8}T\d{6})_'
+                            r'(?P<baseline>N\d{4})_R(?P<orbit>\d{3})_T(?P<tile>[0-9A-Z]{5})_(?P<processing>\d{8}T\d{6})')
+
+def _strip_suffix(title:str) -> str:
+    for suffix in ('.SAFE', '.zip'):
+        if title.endswith(suffix):
+            return title[:-len(suffix)]
+    return title
+
+def parse_titles(titles) -> pd.DataFrame:
+    '''
+    Parse Sentinel-2 product names into columns: platform, level, sensing (datetime), baseline, orbit, tile
+    and processing (datetime). The names are matched once with a compiled pattern and every column is converted
+    as a whole (vectorised with the string methods of pandas), which is much faster than splitting every name.
+    Names which do not follow the naming convention get empty values.
+
+    Params:
+    -------
+        - titles: list[str] -> product names, with or without '.SAFE' or '.zip' suffix
+
+    Returns:
+    --------
+        - table: pd.DataFrame -> one row per name
+    '''
+    table = pd.Series(list(titles), dtype=object).str.extract(_TITLE_PATTERN)
+    for column in ('platform', 'level', 'baseline', 'tile'):
+        table[column] = table[column].astype('category')
+    table['sensing'] = pd.to_datetime(table['sensing'], format='%Y%m%dT%H%M%S', utc=True)
+    table['orbit'] = pd.to_numeric(table['orbit']).astype('Int16')
+    table['processing'] = pd.to_datetime(table['processing'], format='%Y%m%dT%H%M%S', utc=True)
+    return table
+
+def _product_bounds(product) -> tuple:
+    geometry = getattr(product, 'geometry', None)
+    return geometry.bounds if geometry is not None else (np.nan, np.nan, np.nan, np.nan)
+
+@trace.traced()
+def products_table(products:SearchResult|LazySearchResult|list|str|Path) -> pd.DataFrame:
+    '''
+    Build a columnar table of the products for fast filtering and grouping: title, the fields of the name
+    (see ``parse_titles``), cloud_cover and footprint bounds (minx, miny, maxx, maxy).
+    The index is the position of the product in ``products``, so filtered rows can be mapped back to the products
+    with ``select_products``.
+
+    Params:
+    -------
+        - products: SearchResult|LazySearchResult|list -> products (or a list of product names / SAFE paths),
+                    or a directory with downloaded products (SAFE directories or zip files, with a column 'path')
+
+    Returns:
+    --------
+        - table: pd.DataFrame -> one row per product
+
+    Example:
+    --------
+        table = products_table(products)
+        rows = table[(table['tile'] == '33UWP') & (table['cloud_cover'] < 20)].sort_values('sensing')
+        selected = select_products(products, rows)
+    '''
+    paths = None
+    if isinstance(products, (str, Path)):
+        paths = sorted(p for p in Path(products).iterdir() if p.name.startswith('S2') and p.suffix in ('.SAFE', '.zip'))
+        products = [p.name for p in paths]
+
+    if isinstance(products, LazySearchResult):
+        # The features are already parsed, no product has to be created
+        features = [products._source['features'][i] for i in products._indices]
+        index = products.table
+        titles, bounds = index['title'], index[['minx', 'miny', 'maxx', 'maxy']].to_numpy()
+        cloud_cover = [feature.get('properties', {}).get('cloudCover') for feature in features]
+    elif len(products) > 0 and all(isinstance(p, (str, Path)) for p in products):
+        titles = [os.path.basename(str(p)) for p in products]
+        bounds = np.full((len(titles), 4), np.nan)
+        cloud_cover = [None] * len(titles)
+    else:
+        titles = [p.properties.get('title') or p.properties.get('id') for p in products]
+        bounds = np.array([_product_bounds(p) for p in products], dtype=float).reshape(-1, 4)
+        cloud_cover = [p.properties.get('cloudCover') for p in products]
+
+    titles = [_strip_suffix(str(title)) for title in titles]
+    table = parse_titles(titles)
+    table.insert(0, 'title', titles)
+    table['cloud_cover'] = pd.to_numeric(pd.Series(cloud_cover, dtype=object), errors='coerce')
+    table[['minx', 'miny', 'maxx', 'maxy']] = bounds
+    if paths is not None:
+        table['path'] = [str(p) for p in paths]
+    return table
+
+def select_products(products:SearchResult|LazySearchResult|list, rows:pd.DataFrame|pd.Index) -> SearchResult|LazySearchResult|list:
+    '''
+    Map rows of a ``products_table`` (e.g. after filtering or sorting) back to the products, in the order of the rows.
+
+    Params:
+    -------
+        - products: SearchResult|LazySearchResult|list -> products the table was built from
+        - rows: pd.DataFrame|pd.Index -> selected rows (or their index)
+
+    Returns:
+    --------
+        - selected: SearchResult|LazySearchResult|list -> same type as ``products``
+    '''
+    positions = np.asarray(rows.index if isinstance(rows, pd.DataFrame) else rows, dtype=int)
+    if isinstance(products, LazySearchResult):
+        return products[positions]
+    selected = [products[i] for i in positions]
+    return eodag.SearchResult(selected) if isinstance(products, eodag.SearchResult) else selected
+
+@trace.traced()
+def deserialize(filename:str, workspace:str, dag:EODataAccessGateway, log=True, lazy:bool=False) -> SearchResult|list[EOProduct]|LazySearchResult:
     '''
     Deserialize and register the Search Results.
 
@@ -109,6 +458,9 @@ def deserialize(filename:str, workspace:str, dag:EODataAccessGateway, log=True)
         - workspace: str -> Filepath to the workspace (directory where the serialized file is stored)
         - dag: EODataAccessGateway -> EODAG Object
         - log: bool -> if True, print the number of deserialized products
+        - lazy: bool -> if True, a ``LazySearchResult`` is returned, which only creates the products that are accessed.
+                        The last few parsed files are cached (by filepath and modification time), so deserializing
+                        them again is instant.
 
     Returns:
     --------
@@ -116,7 +468,22 @@ def deserialize(filename:str, workspace:str, dag:EODataAccessGateway, log=True)
     '''
     # Deserialize the Search Results
     output_file = os.path.join(workspace['serialize'], filename)
-    deserialized_search_results = dag.deserialize_and_register(output_file)
+    if lazy:
+        key = (os.path.abspath(output_file), os.path.getmtime(output_file), id(dag))
+        if key not in _DESERIALIZE_CACHE:
+            # Older versions of the same file are dropped from the cache
+            for old_key in [k for k in _DESERIALIZE_CACHE if k[0] == key[0] and k[2] == key[2]]:
+                del _DESERIALIZE_CACHE[old_key]
+            collection = _read_json(output_file)
+            features = collection.pop('features', [])
+            _DESERIALIZE_CACHE[key] = {'header': collection, 'features': features, 'table': features_to_table(features),
+                                       'products': {}, 'dag': dag}
+            while len(_DESERIALIZE_CACHE) > _DESERIALIZE_CACHE_SIZE:
+                _DESERIALIZE_CACHE.popitem(last=False)
+        _DESERIALIZE_CACHE.move_to_end(key)
+        deserialized_search_results = LazySearchResult(_DESERIALIZE_CACHE[key])
+    else:
+        deserialized_search_results = dag.deserialize_and_register(output_file)
 
     if log:
         print(f"Got {len(deserialized_search_results)} deserialized products.")
@@ -124,3 +491,81 @@ def deserialize(filename:str, workspace:str, dag:EODataAccessGateway, log=True)
     return deserialized_search_results
 
 
+@trace.traced('shortcut.search_page')
+def _search_page(search, page:int, items_per_page:int, kwargs:dict) -> tuple:
+    '''
+    Search a single page and return the products and the total number of products (None if unknown).
+    Works with ``dag.search`` returning a tuple (eodag 2) or a SearchResult with ``number_matched`` (newer versions).
+    '''
+    result = search(page=page, items_per_page=items_per_page, **kwargs)
+    if isinstance(result, tuple):
+        products, total = result
+    else:
+        products, total = result, getattr(result, 'number_matched', None)
+    return list(products), total
+
+def search_all(dag:EODataAccessGateway=None, items_per_page:int=20, max_workers:int=4, max_pages:int=None,
+               search=None, **kwargs):
+    '''
+    Generator which searches all pages of a search concurrently and yields the products as soon as their page arrived.
+    The first page is used to get the total number of results, afterwards at most ``max_workers`` pages are requested at the same time.
+    If the provider does not return the total number, pages are requested until a page is not full.
+    Products are deduplicated by id (providers can return a product on two pages, if the results change while paging).
+
+    Params:
+    -------
+        - dag: EODataAccessGateway -> EODAG Object (not needed if ``search`` is given)
+        - items_per_page: int -> number of products per page
+        - max_workers: int -> maximum number of pages requested at the same time
+        - max_pages: int -> maximum number of pages to be searched (default: all)
+        - search: callable -> function with the signature of ``dag.search`` (default: ``dag.search``),
+                              e.g. a local stand-in for a provider
+        - **kwargs: dict -> search parameters passed to ``dag.search`` (productType, start, end, geom, ...)
+
+    Yields:
+    --------
+        - product: EOProduct -> every product found (in the order the pages arrived)
+    '''
+    if search is None:
+        search = dag.search
+
+    seen_ids = set()
+    def unique(products):
+        for product in products:
+            product_id = product.properties['id']
+            if product_id not in seen_ids:
+                seen_ids.add(product_id)
+                yield product
+
+    products, total = _search_page(search, 1, items_per_page, kwargs)
+    yield from unique(products)
+
+    # Last page: known from the total number, otherwise found when a page is not full
+    last_page = math.ceil(total / items_per_page) if total is not None else None
+    if len(products) < items_per_page:
+        last_page = 1
+    if max_pages is not None:
+        last_page = min(last_page, max_pages) if last_page is not None else max_pages
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = {}
+        next_page = 2
+        while True:
+            while len(in_flight) < max_workers and (last_page is None or next_page <= last_page):
+                in_flight[executor.submit(_search_page, search, next_page, items_per_page, kwargs)] = next_page
+                next_page += 1
+            if len(in_flight) == 0:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                if last_page is not None and page > last_page:
+                    continue
+                products, _ = future.result()
+                if len(products) < items_per_page and (last_page is None or page < last_page):
+                    last_page = page
+                yield from unique(products)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,370 @@
+#Description
+'''
+This script is intended to find the slow stages of a notebook or batch run without attaching a profiler.
+In here you will find an opt-in instrumentation: the stages of eotools (search, download, get_data, merge,
+clipping, contrast, ...) record nested spans with wall time, bytes read, peak resident memory and array shapes,
+which can be exported as json or in the Chrome trace format (chrome://tracing, https://ui.perfetto.dev).
+
+Tracing is disabled by default and costs nearly nothing then. Enable it with ``trace.enable()``
+or by setting the environment variable ``EOTOOLS_TRACE=1``.
+
+Example:
+    from eotools import trace
+    trace.enable()
+    ds = loading.load_multiple_timestamps(products, bands)
+    trace.summary()
+    trace.export_chrome_trace('trace.json')
+'''
+from __future__ import annotations
+
+
+
+#Variables:
+__version__ = '19-Oct-2026_v01'
+
+
+
+#Modules:
+import os
+import json
+import time
+import threading
+import functools
+from eotools.lazy import lazy_import
+pd = lazy_import('pandas')
+
+
+_enabled = os.environ.get('EOTOOLS_TRACE', '').lower() in ('1', 'true', 'yes')
+_lock = threading.Lock()
+_local = threading.local()
+_spans = []
+_open = set()
+_sampler = None
+_next_id = 1
+_origin = time.perf_counter()
+
+
+##############################################
+# Process functions
+##############################################
+
+def current_rss() -> int:
+    '''
+    Resident memory of the process in bytes (from /proc, falls back to the peak of the process on other Unix systems,
+    0 on Windows).
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    try:
+        # The resource module only exists on Unix
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def bytes_read() -> int:
+    '''
+    Number of bytes the process has read so far (files and sockets, from /proc/self/io, 0 on other systems).
+    '''
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def _sample(interval:float) -> None:
+    '''
+    Background thread which updates the memory peak of all open spans.
+    '''
+    while _enabled:
+        rss = current_rss()
+        with _lock:
+            for open_span in _open:
+                open_span.peak_rss = max(open_span.peak_rss, rss)
+        time.sleep(interval)
+
+
+##############################################
+# Span functions
+##############################################
+
+class Span:
+    '''
+    A timed stage of a run. Spans are nested per thread: a span opened while another span of the same thread is open
+    becomes its child. Bytes read are counted for the whole process, so they include other threads.
+
+    Params:
+    -------
+        - name: str -> name of the stage (e.g.: 'loading.get_data')
+        - **attrs: -> additional information (e.g.: product, band), more can be added with ``set``
+    '''
+    __slots__ = ('id', 'parent', 'name', 'attrs', 'thread', 'start', 'end', 'start_rss', 'peak_rss', 'start_read', 'end_read')
+
+    def __init__(self, name:str, **attrs):
+        global _next_id
+        with _lock:
+            self.id = _next_id
+            _next_id += 1
+        stack = _stack()
+        self.parent = stack[-1].id if stack else None
+        self.name = name
+        self.attrs = attrs
+        self.thread = threading.get_ident()
+        self.start = self.end = None
+
+    def set(self, **attrs) -> Span:
+        '''
+        Adds information to the span. Arrays and Datasets are stored as their shape (see ``array_shape``).
+        '''
+        for key, value in attrs.items():
+            shape = array_shape(value) if not isinstance(value, (tuple, dict)) else None
+            self.attrs[key] = shape if shape is not None else value
+        return self
+
+    def __enter__(self) -> Span:
+        self.start_rss = self.peak_rss = current_rss()
+        self.start_read = bytes_read()
+        _stack().append(self)
+        with _lock:
+            _open.add(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        self.end_read = bytes_read()
+        self.peak_rss = max(self.peak_rss, current_rss())
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        with _lock:
+            _open.discard(self)
+            _spans.append(self)
+        return False
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self) -> dict:
+        '''
+        The span as json serialisable dictionary (times in seconds since the import of this module, memory in bytes).
+        '''
+        return {'id': self.id, 'parent': self.parent, 'name': self.name, 'thread': self.thread,
+                'start': self.start - _origin, 'seconds': self.seconds,
+                'bytes_read': self.end_read - self.start_read if self.end_read is not None else None,
+                'start_rss': self.start_rss, 'peak_rss': self.peak_rss,
+                'attrs': {key: value if isinstance(value, (int, float, str, bool, type(None), list, tuple, dict)) else str(value)
+                          for key, value in self.attrs.items()}}
+
+class _NoSpan:
+    '''
+    Returned by ``span`` while tracing is disabled.
+    '''
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def _stack() -> list:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def span(name:str, **attrs) -> Span:
+    '''
+    Context manager which records a span, if tracing is enabled.
+
+    Params:
+    -------
+        - name: str -> name of the stage
+        - **attrs: -> additional information (e.g.: product=..., band=...)
+
+    Returns:
+    -------
+        - span: Span -> use ``span.set(shape=data)`` inside of the block to add information
+
+    Example:
+    -------
+        with trace.span('loading.get_data', band=band) as s:
+            data = product.get_data(band=band)
+            s.set(shape=data)
+    '''
+    if not _enabled:
+        return _NO_SPAN
+    return Span(name, **attrs)
+
+def traced(name:str=None):
+    '''
+    Decorator which records a span for every call of a function, if tracing is enabled.
+    The shape of the returned array (or the sizes of a returned Dataset) is added to the span.
+
+    Params:
+    -------
+        - name: str -> name of the span (default: ``<module>.<function>``)
+    '''
+    def decorator(func):
+        # Spans are named without the package, as the modules which overwrite their __name__ (loading.get_data)
+        span_name = name or f"{func.__module__.removeprefix('eotools.')}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name) as s:
+                result = func(*args, **kwargs)
+                shape = array_shape(result)
+                if shape is not None:
+                    s.set(shape=shape)
+                return result
+        return wrapper
+    return decorator
+
+def array_shape(data) -> tuple|dict|None:
+    '''
+    Shape of an array or DataArray, sizes of a Dataset (as dictionary), None for other objects.
+    '''
+    if hasattr(data, 'shape'):
+        return tuple(data.shape)
+    if hasattr(data, 'sizes'):
+        return dict(data.sizes)
+    return None
+
+def product_name(product) -> str:
+    '''
+    Title of a product for the span attributes (works for EOProducts and other objects).
+    '''
+    properties = getattr(product, 'properties', None) or {}
+    return properties.get('title') or properties.get('id') or str(product)
+
+
+##############################################
+# Control functions
+##############################################
+
+def enable(sample_interval:float=0.01) -> None:
+    '''
+    Enables the tracing. The memory peak of the open spans is sampled in a background thread.
+
+    Params:
+    -------
+        - sample_interval: float -> seconds between two samples of the resident memory
+    '''
+    global _enabled, _sampler
+    _enabled = True
+    if _sampler is None or not _sampler.is_alive():
+        _sampler = threading.Thread(target=_sample, args=(sample_interval,), daemon=True)
+        _sampler.start()
+
+def disable() -> None:
+    '''
+    Disables the tracing, the recorded spans are kept.
+    '''
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    '''
+    Removes all recorded spans.
+    '''
+    with _lock:
+        _spans.clear()
+
+def spans() -> list[dict]:
+    '''
+    All finished spans as dictionaries (see ``Span.to_dict``), ordered by start time.
+    '''
+    with _lock:
+        finished = list(_spans)
+    return [s.to_dict() for s in sorted(finished, key=lambda s: s.start)]
+
+def summary(log:bool=True) -> pd.DataFrame:
+    '''
+    Aggregates the spans by name: number of calls, total, mean and max wall time, bytes read and memory peak.
+
+    Params:
+    -------
+        - log: bool -> if True, the table is printed
+
+    Returns:
+    -------
+        - table: pandas.DataFrame -> one row per span name, sorted by the total time
+    '''
+    table = pd.DataFrame(spans(), columns=['name', 'seconds', 'bytes_read', 'start_rss', 'peak_rss'])
+    table['peak_mb'] = (table['peak_rss'] - table['start_rss']) / 1e6
+    table['read_mb'] = table['bytes_read'] / 1e6
+    table = (table.groupby('name')
+                  .agg(calls=('seconds', 'size'), total_s=('seconds', 'sum'), mean_s=('seconds', 'mean'),
+                       max_s=('seconds', 'max'), read_mb=('read_mb', 'sum'), peak_mb=('peak_mb', 'max'))
+                  .sort_values('total_s', ascending=False))
+    if log:
+        print(table.round(3).to_string())
+    return table
+
+
+##############################################
+# Export functions
+##############################################
+
+def export_json(filepath:str) -> str:
+    '''
+    Writes all finished spans as json.
+
+    Params:
+    -------
+        - filepath: str -> path of the json file
+
+    Returns:
+    -------
+        - filepath: str
+    '''
+    with open(filepath, 'w') as f:
+        json.dump({'spans': spans()}, f, indent=1)
+    return filepath
+
+def export_chrome_trace(filepath:str) -> str:
+    '''
+    Writes all finished spans in the Chrome trace format, which can be opened with chrome://tracing or https://ui.perfetto.dev.
+    Every span is a complete event on the track of its thread, the resident memory at the start of the spans
+    is added as counter track.
+
+    Params:
+    -------
+        - filepath: str -> path of the json file
+
+    Returns:
+    -------
+        - filepath: str
+    '''
+    pid = os.getpid()
+    events = []
+    for s in spans():
+        args = dict(s['attrs'], bytes_read=s['bytes_read'], peak_mb=round(s['peak_rss'] / 1e6, 1))
+        events.append({'name': s['name'], 'cat': s['name'].split('.')[0], 'ph': 'X', 'pid': pid, 'tid': s['thread'],
+                       'ts': s['start'] * 1e6, 'dur': s['seconds'] * 1e6, 'args': args})
+        events.append({'name': 'memory', 'ph': 'C', 'pid': pid, 'ts': s['start'] * 1e6,
+                       'args': {'rss_mb': round(s['start_rss'] / 1e6, 1)}})
+    with open(filepath, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return filepath
+
+
+if _enabled:
+    enable()
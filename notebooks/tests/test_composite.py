@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from eotools import loading
+from eotools.benchmarks import synthetic
+from eotools.composite import TemporalComposite, composite_products
+
+
+def acquisitions(n:int, shape:tuple=(4, 5), seed:int=0, nan_fraction:float=0.2):
+    '''
+    Random acquisitions with values in (0, 10000) and some Nan values.
+    '''
+    rng = np.random.default_rng(seed)
+    y, x = np.arange(shape[0]) * -10.0, np.arange(shape[1]) * 10.0
+    stack = rng.uniform(0, 10000, size=(n,) + shape).astype(np.float32)
+    stack[rng.random(stack.shape) < nan_fraction] = np.nan
+    return stack, [xr.Dataset({'B04': (('y', 'x'), layer)}, coords={'y': y, 'x': x}) for layer in stack]
+
+
+def test_exact_statistics():
+    stack, datasets = acquisitions(12)
+    composite = TemporalComposite(stats=('mean', 'min', 'max', 'count'))
+    for ds in datasets:
+        composite.update(ds)
+
+    results = composite.results()
+    assert np.array_equal(results['count']['B04'].values, np.sum(~np.isnan(stack), axis=0))
+    assert np.allclose(results['mean']['B04'].values, np.nanmean(stack, axis=0), rtol=1e-5)
+    assert np.array_equal(results['min']['B04'].values, np.nanmin(stack, axis=0))
+    assert np.array_equal(results['max']['B04'].values, np.nanmax(stack, axis=0))
+
+
+@pytest.mark.parametrize('n_updates', [9, 300])
+def test_median_and_percentiles(n_updates):
+    stack, datasets = acquisitions(n_updates, seed=n_updates)
+    composite = TemporalComposite(stats=('median',), percentiles=(10, 90), bins=64)
+    for ds in datasets:
+        composite.update(ds)
+
+    histogram = composite._bands['B04']['histogram']
+    # The counts are promoted to 2 bytes once a bin could overflow
+    assert histogram.dtype == (np.uint16 if n_updates > 255 else np.uint8)
+    assert np.array_equal(histogram.sum(axis=0), np.sum(~np.isnan(stack), axis=0))
+
+    width = 10000 / 64
+    for name, q in [('median', 50), ('p10', 10), ('p90', 90)]:
+        approximation = composite.result(name)['B04'].values
+        assert np.abs(approximation - np.nanpercentile(stack, q, axis=0)).max() < width
+
+
+def test_result_of_unrequested_statistic():
+    _, datasets = acquisitions(2)
+    composite = TemporalComposite(stats=('median',)).update(datasets[0])
+    with pytest.raises(ValueError):
+        composite.result('p90')
+    with pytest.raises(ValueError):
+        composite.result('mean')
+    with pytest.raises(ValueError):
+        TemporalComposite(bins=256)
+
+
+def test_composite_products_matches_stack(tmp_path):
+    synthetic.make_time_series(tmp_path, n_dates=5, size=60, driver='GTiff')
+    products = synthetic.products_from_directory(tmp_path)
+
+    composite = composite_products(products, ['B04', 'B08'], stats=('median', 'count', 'mean'), bins=128)
+    stack = xr.concat([loading.load_single_product_regex(product, ['B04', 'B08']) for product in products], dim='time')
+
+    width = 10000 / 128
+    median = composite.result('median')
+    for band in ['B04', 'B08']:
+        expected = stack[band].astype(np.float32)
+        assert np.abs(median[band].values - expected.median('time').values).max() < width
+        assert np.allclose(composite.result('mean')[band].values, expected.mean('time').values, rtol=1e-5)
+    assert int(composite.result('count')['B04'].max()) == 5
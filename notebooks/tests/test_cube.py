@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from eotools import cube, loading
+from eotools.benchmarks import synthetic
+
+
+BANDS = ['B04', 'B8A']
+ACCESS = {'time': 2, 'y': 32, 'x': 32}
+
+
+@pytest.fixture(scope='module')
+def products(tmp_path_factory):
+    root = tmp_path_factory.mktemp('products')
+    synthetic.make_time_series(root, n_dates=6, size=60, driver='GTiff')
+    return synthetic.products_from_directory(root)
+
+
+@pytest.fixture(scope='module')
+def reference(products):
+    return loading.load_multiple_timestamps_regex(products, BANDS)
+
+
+def assert_matches(ds, reference):
+    # The loader labels the acquisitions with dates, the cube stores them as datetime64
+    assert np.array_equal(ds['time'].values, reference['time'].values.astype('datetime64[ns]'))
+    for band in BANDS:
+        assert np.array_equal(ds[band].values, reference[band].values.astype(ds[band].dtype), equal_nan=True)
+
+
+def test_append_later_acquisitions(products, reference, tmp_path):
+    path = tmp_path / 'cube.zarr'
+    cube.load_cube(products[:3], BANDS, path, access=ACCESS)
+    ds = cube.append_cube(path, products)
+
+    assert_matches(ds, reference)
+    assert cube.new_products(path, products) == []
+    assert sorted(cube.cube_metadata(ds)['products']) == sorted(cube.product_ids(products))
+    # Nothing new, nothing is loaded
+    assert cube.append_cube(path, products).sizes['time'] == 6
+
+
+def test_insert_requires_allow_rewrite(products, tmp_path):
+    path = tmp_path / 'cube.zarr'
+    cube.load_cube(products[::2], BANDS, path, access=ACCESS)
+
+    with pytest.raises(ValueError, match='allow_rewrite'):
+        cube.append_cube(path, products[1::2])
+
+    # The cube is left as it was
+    ds = cube.open_cube(path)
+    assert ds.sizes['time'] == 3
+    assert len(cube.new_products(path, products)) == 3
+
+
+@pytest.mark.parametrize('stored, appended', [(slice(0, None, 2), slice(1, None, 2)),
+                                              (slice(3, None), slice(0, 3)),
+                                              (slice(1, 5), [0, 5])])
+def test_insert_out_of_order(products, reference, tmp_path, stored, appended):
+    path = tmp_path / 'cube.zarr'
+    stored_products = products[stored]
+    appended_products = products[appended] if isinstance(appended, slice) else [products[i] for i in appended]
+    cube.load_cube(stored_products, BANDS, path, access=ACCESS)
+
+    ds = cube.append_cube(path, appended_products, allow_rewrite=True)
+
+    assert_matches(ds, reference)
+    assert ds[BANDS[0]].encoding['chunks'][0] == ACCESS['time']
+    assert sorted(cube.cube_metadata(ds)['products']) == sorted(cube.product_ids(products))
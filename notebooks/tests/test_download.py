@@ -0,0 +1,161 @@
+import hashlib
+import io
+import threading
+import zipfile
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+
+from eotools import download
+
+
+TITLE = 'S2A_MSIL2A_20240501T100031_N0510_R122_T33UWP_20240501T120000'
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    '''
+    Serves the files of a directory and answers range requests (as the datapool does).
+    '''
+    requests = []
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        data = path.read_bytes()
+        self.requests.append((self.path, self.headers.get('Range')))
+        start = int(self.headers['Range'].split('=')[1].rstrip('-')) if self.headers.get('Range') else 0
+        if start >= len(data) > 0:
+            self.send_response(416)
+            self.end_headers()
+            return
+        self.send_response(206 if start > 0 else 200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class Auth:
+    def authenticate(self):
+        return None
+
+
+class Product:
+    def __init__(self, url:str, title:str=TITLE, product_id:str=None):
+        self.properties = {'id': product_id or title, 'title': title, 'downloadLink': url}
+        self.downloader_auth = Auth()
+        self.remote_location = url
+        self.location = url
+
+
+def make_archive(path:Path, files:dict, md5:dict=None, href_prefix:str='./') -> bytes:
+    '''
+    Zip archive of a SAFE product with a manifest listing the size and MD5 checksum of every file.
+    '''
+    md5 = md5 or {}
+    streams = ''.join(
+        f'<dataObject ID="{name}"><byteStream mimeType="application/octet-stream" size="{len(data)}">'
+        f'<fileLocation locatorType="URL" href="{href_prefix}{name}"/>'
+        f'<checksum checksumName="MD5">{md5.get(name, hashlib.md5(data).hexdigest())}</checksum>'
+        f'</byteStream></dataObject>' for name, data in files.items())
+    manifest = f'<?xml version="1.0"?><xfdu:XFDU xmlns:xfdu="urn:ccsds:schema:xfdu:1"><dataObjectSection>{streams}</dataObjectSection></xfdu:XFDU>'
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr(f'{TITLE}.SAFE/manifest.safe', manifest)
+        for name, data in files.items():
+            archive.writestr(f'{TITLE}.SAFE/{name}', data)
+    path.write_bytes(buffer.getvalue())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server(tmp_path):
+    remote = tmp_path / 'remote'
+    remote.mkdir()
+    RangeHandler.requests = []
+    httpd = HTTPServer(('127.0.0.1', 0), partial(RangeHandler, directory=str(remote)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield remote, f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+FILES = {'GRANULE/IMG_DATA/B02.jp2': bytes(range(256)) * 4000, 'MTD_MSIL2A.xml': b'<metadata/>'}
+
+
+def test_download_resumes_partial_archive(server, tmp_path):
+    remote, url = server
+    data = make_archive(remote / 'product.zip', FILES)
+    datapool = tmp_path / 'datapool'
+    datapool.mkdir()
+    (datapool / f'{TITLE}.zip.part').write_bytes(data[:len(data) // 3])
+
+    product = Product(f'{url}/product.zip')
+    safe_dir, n_bytes, skipped = download.download_product(product, datapool)
+
+    assert RangeHandler.requests == [('/product.zip', f'bytes={len(data) // 3}-')]
+    assert n_bytes == len(data) - len(data) // 3
+    assert not skipped
+    assert safe_dir == (datapool / f'{TITLE}.SAFE').resolve()
+    assert (safe_dir / 'GRANULE/IMG_DATA/B02.jp2').read_bytes() == FILES['GRANULE/IMG_DATA/B02.jp2']
+    assert product.location == safe_dir.as_uri()
+    assert not list(datapool.glob('*.zip*'))
+
+    # A complete copy is not downloaded again
+    assert download.download_product(product, datapool) == (safe_dir, 0, True)
+    assert len(RangeHandler.requests) == 1
+
+
+def test_download_removes_checksum_mismatch(server, tmp_path):
+    remote, url = server
+    make_archive(remote / 'product.zip', FILES, md5={'MTD_MSIL2A.xml': '0' * 32})
+    datapool = tmp_path / 'datapool'
+
+    with pytest.raises(IOError, match='does not match its manifest'):
+        download.download_product(Product(f'{url}/product.zip'), datapool)
+    assert list(datapool.iterdir()) == []
+
+    # Without the verification only the sizes are compared
+    safe_dir, _, _ = download.download_product(Product(f'{url}/product.zip'), datapool, verify_checksums=False)
+    assert download.is_product_complete(safe_dir)
+    assert not download.is_product_complete(safe_dir, verify_checksums=True)
+
+
+def test_manifest_outside_of_product_is_rejected(tmp_path):
+    make_archive(tmp_path / 'product.zip', {'../outside.txt': b'x'})
+    with zipfile.ZipFile(tmp_path / 'product.zip') as archive:
+        archive.extract(f'{TITLE}.SAFE/manifest.safe', tmp_path)
+    safe_dir = tmp_path / f'{TITLE}.SAFE'
+    (tmp_path / 'outside.txt').write_bytes(b'x')
+
+    with pytest.raises(ValueError, match='outside'):
+        download.read_manifest(safe_dir)
+    assert not download.is_product_complete(safe_dir)
+
+
+def test_manifest_href_prefix(tmp_path):
+    # Only a leading './' is removed, names starting with dots are kept
+    make_archive(tmp_path / 'product.zip', {'.hidden/file.xml': b'x', 'MTD.xml': b'y'})
+    with zipfile.ZipFile(tmp_path / 'product.zip') as archive:
+        archive.extractall(tmp_path)
+    safe_dir = tmp_path / f'{TITLE}.SAFE'
+
+    paths = [f['path'] for f in download.read_manifest(safe_dir)]
+    assert paths == [safe_dir / '.hidden/file.xml', safe_dir / 'MTD.xml']
+    assert download.is_product_complete(safe_dir, verify_checksums=True)
+
+
+def test_download_all_deduplicates(server, tmp_path):
+    remote, url = server
+    make_archive(remote / 'product.zip', FILES)
+    products = [Product(f'{url}/product.zip'), Product(f'{url}/product.zip'), Product(f'{url}/product.zip')]
+
+    paths = download.download_all(products, tmp_path / 'datapool', max_workers=3, log=False)
+
+    assert len(RangeHandler.requests) == 1
+    assert paths == [str((tmp_path / 'datapool' / f'{TITLE}.SAFE').resolve())] * 3
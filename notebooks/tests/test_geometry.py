@@ -0,0 +1,48 @@
+import numpy as np
+
+from eotools.geometry import reservoir_sample
+
+
+def stream(n_rows:int, chunk_size:int, n_columns:int=3):
+    rows = np.arange(n_rows * n_columns, dtype=float).reshape(n_rows, n_columns)
+    return (rows[i:i + chunk_size] for i in range(0, n_rows, chunk_size))
+
+
+def test_reservoir_is_deterministic():
+    first = reservoir_sample(stream(1000, 64), max_samples=50, random_state=3)
+    second = reservoir_sample(stream(1000, 64), max_samples=50, random_state=3)
+    other = reservoir_sample(stream(1000, 64), max_samples=50, random_state=4)
+
+    assert first.shape == (50, 3)
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, other)
+    # Sampled rows are rows of the stream, without duplicates
+    assert np.all(first[:, 0] % 3 == 0)
+    assert len(np.unique(first[:, 0])) == 50
+
+
+def test_reservoir_is_uniform():
+    n_rows, max_samples, n_runs = 200, 20, 2000
+    counts = np.zeros(n_rows)
+    for seed in range(n_runs):
+        sample = reservoir_sample(stream(n_rows, 17, n_columns=1), max_samples=max_samples, random_state=seed)
+        counts[sample[:, 0].astype(int)] += 1
+
+    # Every row is drawn with probability max_samples / n_rows, independent of its chunk and position
+    expected = n_runs * max_samples / n_rows
+    assert abs(counts.mean() - expected) < 1e-9
+    assert np.abs(counts - expected).max() < 5 * np.sqrt(expected)
+    assert abs(counts[:n_rows // 2].sum() - counts[n_rows // 2:].sum()) < 0.05 * counts.sum()
+
+
+def test_reservoir_keeps_short_streams():
+    sample = reservoir_sample(stream(30, 7), max_samples=100, random_state=0)
+    assert np.array_equal(sample, np.concatenate(list(stream(30, 7))))
+    assert np.array_equal(reservoir_sample(stream(30, 7)), sample)
+
+
+def test_reservoir_empty_width():
+    empty_chunks = [np.empty((0, 4)), np.empty((0, 4))]
+    assert reservoir_sample(iter(empty_chunks), max_samples=10).shape == (0, 4)
+    assert reservoir_sample(iter(empty_chunks)).shape == (0, 4)
+    assert reservoir_sample(iter([]), max_samples=10).shape == (0, 0)
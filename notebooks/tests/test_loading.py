@@ -0,0 +1,114 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+import xarray as xr
+import rioxarray  # noqa: F401 (registers the .rio accessor)
+from pyproj import Transformer
+
+from eotools import loading
+from eotools.benchmarks import synthetic
+
+
+def coordinate_tile(crs:int, origin:tuple, size:int, res:float, values_crs:int=32633) -> xr.DataArray:
+    '''
+    Tile whose pixels hold the easting of their center in ``values_crs``, so misplaced pixels are easy to find.
+    '''
+    x = origin[0] + (np.arange(size) + 0.5) * res
+    y = origin[1] - (np.arange(size) + 0.5) * res
+    xx, yy = np.meshgrid(x, y)
+    easting, _ = Transformer.from_crs(crs, values_crs, always_xy=True).transform(xx, yy)
+    return xr.DataArray(easting.astype(np.float32), coords={'y': y, 'x': x}, dims=('y', 'x')).rio.write_crs(crs)
+
+
+def test_mosaic_grid_transforms_bounds():
+    east = coordinate_tile(32633, (300000, 5400000), 60, 20)
+    west = coordinate_tile(32632, (741900, 5401000), 60, 20)
+
+    grid = loading.mosaic_grid([east, west])
+    assert grid['crs'].to_epsg() == 32633
+    # Both tiles are 1.2 km wide and overlap, the union is far smaller than the distance between the UTM origins
+    assert len(grid['x']) < 150 and len(grid['y']) < 150
+    assert np.allclose((grid['x'][0] - 300000 - 10) % 20, 0)
+
+
+@pytest.mark.parametrize('origin, res', [((300515, 5399485), 20), ((300000, 5400000), 30), ((300005, 5400010), 30)])
+def test_paste_aligns_tiles_with_the_grid(origin, res):
+    reference = coordinate_tile(32633, (300000, 5400000), 60, 20)
+    tile = coordinate_tile(32633, origin, 60, res)
+    grid = loading.mosaic_grid([reference, tile])
+
+    target = np.full((len(grid['y']), len(grid['x'])), np.nan, dtype=np.float32)
+    loading._paste(target, tile, grid, 'first')
+
+    # Every pixel of the grid gets the value of the tile pixel containing its center
+    covered = ~np.isnan(target)
+    assert covered.sum() > 0.9 * tile.size * (res / 20) ** 2
+    expected = origin[0] + (np.floor((grid['x'] - origin[0]) / res) + 0.5) * res
+    assert np.allclose(target[covered], np.broadcast_to(expected, target.shape)[covered], atol=1e-3, rtol=0)
+
+
+def test_paste_reprojects_tiles_of_another_zone():
+    reference = coordinate_tile(32633, (300000, 5400000), 60, 20)
+    tile = coordinate_tile(32632, (741900, 5401000), 60, 20)
+    grid = loading.mosaic_grid([reference, tile])
+
+    target = np.full((len(grid['y']), len(grid['x'])), np.nan, dtype=np.float32)
+    loading._paste(target, tile, grid, 'first')
+
+    # Nearest neighbour: the value is at most half a (rotated) pixel away from the center of the grid pixel
+    covered = ~np.isnan(target)
+    assert covered.sum() > 0.9 * tile.size
+    error = (target - grid['x'][None, :])[covered]
+    assert np.abs(error).max() <= 0.5 * 20 * np.sqrt(2)
+    assert abs(error.mean()) < 1
+
+
+def test_mosaic_products_of_two_utm_zones(tmp_path):
+    date = dt.datetime(2024, 5, 1, 10, 0, 31)
+    synthetic.make_safe_product(tmp_path, date, size=60, tile='33UUP', driver='GTiff', crs='EPSG:32633', origin=(300000, 5400000))
+    synthetic.make_safe_product(tmp_path, date, size=60, tile='32UQU', driver='GTiff', crs='EPSG:32632', origin=(741900, 5401000))
+    products = synthetic.products_from_directory(tmp_path)
+
+    ds = loading.mosaic_products(products, ['B04', 'B8A'])
+
+    # The grid is the one of the first product (in any of the two zones)
+    assert ds.rio.crs == products[0].get_data('B04').rio.crs
+    assert ds.sizes['time'] == 1
+    assert ds.sizes['x'] < 150 and ds.sizes['y'] < 150
+    # Both tiles contribute, the 20 m band covers the same area as the 10 m band
+    assert 0.3 < float(ds['B04'].notnull().mean()) < 1
+    assert float(np.abs(ds['B04'].notnull().mean() - ds['B8A'].notnull().mean())) < 0.05
+
+
+def test_local_product_reads_metadata_and_bands(tmp_path):
+    synthetic.make_time_series(tmp_path, n_dates=2, size=240, driver='GTiff', cloud_fraction=0.25)
+    products = loading.local_products(tmp_path)
+
+    first = products[0]
+    times = [p.properties['startTimeFromAscendingNode'] for p in products]
+    assert times == sorted(times)
+    assert first.properties['productType'] == 'S2_MSI_L2A'
+    assert first.properties['tileIdentifier'] == '33UWP'
+    assert 15 < first.properties['cloudCover'] < 35
+
+    assert first.get_data('B04').rio.resolution() == (10.0, -10.0)
+    assert first.get_data(loading.band_2_regex('B04')[1]).rio.resolution() == (20.0, -20.0)
+    with pytest.raises(Exception, match='not found'):
+        first.get_data('B10')
+
+
+def test_local_product_applies_common_params(tmp_path):
+    synthetic.make_time_series(tmp_path, n_dates=2, size=60, driver='GTiff')
+    products = loading.local_products(tmp_path)
+    lonmin, latmin, lonmax, latmax = products[0].geometry.bounds
+    extent = (lonmin + 0.001, latmin + 0.001, lonmax - 0.002, latmax - 0.001)
+
+    assert products[0].get_data('B04', resolution=20).rio.resolution() == (20.0, -20.0)
+
+    common_params = {'crs': 'EPSG:4326', 'resolution': 0.0002, 'extent': extent}
+    ds = loading.load_multiple_timestamps_regex(products, ['B04', 'B8A'], **common_params)
+    grid = loading.common_grid(**common_params)
+    assert (ds.sizes['y'], ds.sizes['x']) == grid['shape']
+    assert ds.rio.crs.to_epsg() == 4326
+    assert float(ds['B04'].isel(time=0).notnull().mean()) > 0.9
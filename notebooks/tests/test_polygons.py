@@ -0,0 +1,101 @@
+import json
+import warnings
+
+import numpy as np
+import pytest
+
+from eotools.polygons import PolygonStore
+
+
+def square(x:float, y:float, size:float=1.0) -> list:
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size)]
+
+
+def test_add_closes_ring_and_finds_point():
+    store = PolygonStore(capacity=1)
+    first = store.add(square(0, 0), 'forest')
+    second = store.add(square(5, 5, 2), 'water')
+
+    assert len(store) == 2
+    assert store.labels == ['forest', 'water']
+    assert np.array_equal(store.coordinates(first)[0], store.coordinates(first)[-1])
+    assert store.find(0.5, 0.5) == [first]
+    assert store.find(6, 6) == [second]
+    assert store.find(3, 3) == []
+
+
+def test_undo_redo_clear():
+    store = PolygonStore()
+    a = store.add(square(0, 0), 'forest')
+    b = store.add(square(2, 0), 'forest')
+    store.remove(a)
+    store.clear()
+    assert len(store) == 0
+
+    assert store.undo()
+    assert list(store.ids) == [b]
+    assert store.undo()
+    assert list(store.ids) == [a, b]
+    assert store.undo()
+    assert list(store.ids) == [a]
+
+    assert store.redo()
+    assert list(store.ids) == [a, b]
+    # A new operation discards the redo history
+    store.add(square(4, 0), 'water')
+    assert not store.redo()
+
+
+def test_compact_keeps_ids_and_undo():
+    store = PolygonStore(capacity=4)
+    ids = [store.add(square(i, 0), 'forest') for i in range(200)]
+    for polygon_id in ids[:150]:
+        store.remove(polygon_id)
+
+    # Removed slots are compacted, apart from those still referenced by the history
+    assert store._n < 200
+    assert list(store.ids) == ids[150:]
+    for polygon_id in ids[150:]:
+        assert np.allclose(store.coordinates(polygon_id)[0], (ids.index(polygon_id), 0))
+
+    assert store.undo()
+    assert ids[149] in store
+    assert np.allclose(store.coordinates(ids[149])[0], (149, 0))
+    assert store.find(149.5, 0.5) == [ids[149]]
+
+
+def test_geojson_roundtrip(tmp_path):
+    store = PolygonStore()
+    store.add(square(0, 0), 'forest')
+    store.add(square(3, 3), 'water')
+    filepaths = store.export_geojson(tmp_path)
+    assert sorted(p.rsplit('/', 1)[-1] for p in filepaths) == ['forest.geojson', 'water.geojson']
+
+    imported = PolygonStore()
+    for filepath in filepaths:
+        imported.import_geojson(filepath)
+    assert sorted(imported.labels) == ['forest', 'water']
+    assert len(imported) == 2
+    # Importing twice creates new ids instead of reusing the ones of the file
+    imported.import_geojson(filepaths[0])
+    assert len(imported) == 3
+    assert imported.undo()
+    assert len(imported) == 2
+
+
+def test_import_warns_on_holes():
+    outer = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    hole = [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]]
+    collection = {'type': 'FeatureCollection', 'name': 'forest',
+                  'features': [{'type': 'Feature', 'properties': {'id': 7},
+                                'geometry': {'type': 'Polygon', 'coordinates': [outer, hole]}}]}
+    store = PolygonStore()
+    with pytest.warns(UserWarning, match='holes'):
+        ids = store.import_geojson(json.loads(json.dumps(collection)))
+    assert ids == [7]
+    assert store.label(7) == 'forest'
+
+    collection['features'][0]['geometry']['coordinates'] = [outer]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        PolygonStore().import_geojson(collection)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from eotools.shortcut import search_all
+
+
+class FakeProduct:
+    def __init__(self, product_id:str):
+        self.properties = {'id': product_id}
+
+
+class FakeProvider:
+    '''
+    Stand-in for ``dag.search``: serves ``n_products`` products page by page and records the requested pages.
+    '''
+
+    def __init__(self, n_products:int, report_total:bool=True, duplicates:dict=None, delay:float=0.0):
+        self.ids = [f'S2_{i:04d}' for i in range(n_products)]
+        self.report_total = report_total
+        self.duplicates = duplicates or {}
+        self.delay = delay
+        self.pages = []
+        self.lock = threading.Lock()
+
+    def __call__(self, page:int, items_per_page:int, **kwargs):
+        with self.lock:
+            self.pages.append(page)
+        # Later pages arrive first, so the order of the pages is not the order of the requests
+        time.sleep(self.delay / page)
+        ids = self.ids[(page - 1) * items_per_page:page * items_per_page] + self.duplicates.get(page, [])
+        products = [FakeProduct(i) for i in ids]
+        return products, len(self.ids) if self.report_total else None
+
+
+def test_search_all_pages_with_total():
+    provider = FakeProvider(95, delay=0.02)
+    found = [p.properties['id'] for p in search_all(search=provider, items_per_page=10, max_workers=3)]
+
+    assert sorted(found) == provider.ids
+    assert sorted(provider.pages) == list(range(1, 11))
+
+
+def test_search_all_pages_without_total():
+    provider = FakeProvider(40, report_total=False)
+    found = [p.properties['id'] for p in search_all(search=provider, items_per_page=10, max_workers=2)]
+
+    # The end is only found by a page which is not full, pages after it are dropped
+    assert sorted(found) == provider.ids
+    assert 5 in provider.pages
+
+
+def test_search_all_deduplicates_and_limits_pages():
+    provider = FakeProvider(50, duplicates={2: ['S2_0000'], 3: ['S2_0015']})
+    found = [p.properties['id'] for p in search_all(search=provider, items_per_page=10, max_pages=3)]
+
+    assert sorted(found) == provider.ids[:30]
+    assert len(found) == len(set(found))
+    assert max(provider.pages) == 3
+
+
+def test_search_all_single_page_and_kwargs():
+    received = {}
+    def search(page, items_per_page, **kwargs):
+        received.update(kwargs)
+        return [FakeProduct('a'), FakeProduct('b')], 2
+
+    found = [p.properties['id'] for p in search_all(search=search, productType='S2_MSI_L2A')]
+    assert found == ['a', 'b']
+    assert received == {'productType': 'S2_MSI_L2A'}